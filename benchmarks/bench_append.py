@@ -0,0 +1,74 @@
+"""
+Bulk appends and file creation: the original open-per-call path vs. file_writer.
+
+Appends --appends lines to one log file, the way an agent writes a log line by line, through
+the original append_to_file body (makedirs, open, write, close on every call) and through the
+append_to_file tool, which reuses a cached append handle. Then creates --files files with a
+plain write and with the atomic temp-file-and-rename path, with and without fsync.
+
+Usage:
+    python benchmarks/bench_append.py [--appends 10000] [--files 1000]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from terminal import file_writer, server
+
+def _legacy_append(file_path: str, content: str, add_newline: bool = True) -> None:
+    # append_to_file before cached handles
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'a', encoding='utf-8') as f:
+        if add_newline:
+            f.write("\n")
+        f.write(content)
+
+def _legacy_create(file_path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def _time(label: str, count: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:44} {elapsed * 1000:9.1f}ms  {elapsed / count * 1e6:8.1f}us per call")
+    return elapsed
+
+def main(appends: int, files: int) -> None:
+    append_to_file = server.append_to_file.__wrapped__
+    create_file = server.create_file.__wrapped__
+    with tempfile.TemporaryDirectory() as root:
+        line = "2026-01-01T00:00:00 INFO request handled in 12ms status=200 path=/api/items"
+        print(f"{appends} appends to one file")
+        legacy = _time("open per call (original)", appends,
+                       lambda: [_legacy_append(os.path.join(root, "logs", "legacy.log"), line) for _ in range(appends)])
+        cached = _time("append_to_file with cached handle", appends,
+                       lambda: [append_to_file(os.path.join(root, "logs", "cached.log"), line) for _ in range(appends)])
+        _time("file_writer.append_file alone", appends,
+              lambda: [file_writer.append_file(os.path.join(root, "logs", "direct.log"), line) for _ in range(appends)])
+        file_writer.shutdown()
+        with open(os.path.join(root, "logs", "legacy.log"), "rb") as a, open(os.path.join(root, "logs", "cached.log"), "rb") as b:
+            assert a.read() == b.read(), "both paths must write the same bytes"
+        print(f"  speed-up x{legacy / cached:.1f}")
+
+        content = "x" * 4096
+        print(f"{files} files of {len(content)} bytes")
+        _time("plain write (original)", files,
+              lambda: [_legacy_create(os.path.join(root, "plain", f"f{index}.txt"), content) for index in range(files)])
+        file_writer.fsync_writes = False
+        _time("create_file, atomic without fsync", files,
+              lambda: [create_file(os.path.join(root, "atomic", f"f{index}.txt"), content) for index in range(files)])
+        file_writer.fsync_writes = True
+        _time("create_file, atomic with fsync (default)", files,
+              lambda: [create_file(os.path.join(root, "synced", f"f{index}.txt"), content) for index in range(files)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--appends", type=int, default=10000)
+    parser.add_argument("--files", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    main(args.appends, args.files)
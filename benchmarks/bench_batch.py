@@ -0,0 +1,88 @@
+"""
+Scaffolding a project with one tool call per file operation vs one batch_file_operations call.
+
+Every call goes through an in-memory MCP client session, so JSON-RPC framing and result
+validation are paid like with a real client (minus the pipe). The workload creates
+directories and files, appends to some of them, copies a few and deletes others.
+
+Usage:
+    python benchmarks/bench_batch.py [--files 200] [--repeat 3]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from mcp.shared.memory import create_connected_server_and_client_session
+from terminal.server import mcp
+
+def scaffold_operations(files: int) -> list[dict]:
+    operations = []
+    for index in range(files):
+        directory = f"project/pkg{index // 20}"
+        if index % 20 == 0:
+            operations.append({"op": "create_directory", "path": directory})
+        path = f"{directory}/module{index}.py"
+        operations.append({"op": "create_file", "path": path, "content": f"# module {index}\n" + "x = 1\n" * 20})
+        if index % 4 == 0:
+            operations.append({"op": "append_to_file", "path": path, "content": "y = 2"})
+        if index % 10 == 0:
+            operations.append({"op": "copy_file", "path": path, "destination": f"{directory}/module{index}_copy.py"})
+        if index % 10 == 5:
+            operations.append({"op": "delete_file", "path": path})
+    return operations
+
+_ARGUMENTS = {
+    "create_file": lambda op: {"file_path": op["path"], "content": op["content"]},
+    "append_to_file": lambda op: {"file_path": op["path"], "content": op["content"]},
+    "create_directory": lambda op: {"directory_path": op["path"]},
+    "copy_file": lambda op: {"source_path": op["path"], "destination_path": op["destination"]},
+    "delete_file": lambda op: {"file_path": op["path"]},
+}
+
+async def one_call_per_operation(session, operations: list[dict]) -> float:
+    start = time.perf_counter()
+    for op in operations:
+        result = await session.call_tool(op["op"], _ARGUMENTS[op["op"]](op))
+        assert not result.isError
+    return time.perf_counter() - start
+
+async def batched(session, operations: list[dict], atomic: bool) -> float:
+    start = time.perf_counter()
+    result = await session.call_tool("batch_file_operations", {"operations": operations, "atomic": atomic})
+    assert not result.isError and result.structuredContent["success"], result
+    return time.perf_counter() - start
+
+async def run(files: int, repeat: int) -> None:
+    operations = scaffold_operations(files)
+    workloads = {
+        "one call per operation": lambda session: one_call_per_operation(session, operations),
+        "batch": lambda session: batched(session, operations, False),
+        "batch, atomic": lambda session: batched(session, operations, True),
+    }
+    async with create_connected_server_and_client_session(mcp) as session:
+        print(f"{len(operations)} operations ({files} files)")
+        for label, workload in workloads.items():
+            best = float("inf")
+            for _ in range(repeat):
+                root = tempfile.mkdtemp()
+                await session.call_tool("set_working_directory", {"path": root})
+                best = min(best, await workload(session))
+                shutil.rmtree(root)
+            print(f"  {label:24} {best * 1000:8.1f}ms  {best / len(operations) * 1e6:7.1f}us per operation")
+        await session.call_tool("set_working_directory", {"path": os.getcwd()})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # The server logs every request
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.files, args.repeat))
+
+if __name__ == "__main__":
+    main()
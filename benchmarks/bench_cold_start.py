@@ -0,0 +1,67 @@
+"""
+Cold start of the server: from spawning `python -m terminal` to an answered initialize and tools/list.
+
+Each run starts a fresh server process through a stdio MCP client. With a cold schema cache
+(an empty MCP_TERMINAL_CACHE_DIR) every tool is built before tools/list is answered, with a
+warm one the definitions come from the cache written by the previous run. A run with
+MCP_TERMINAL_TOOL_CACHE=0 shows the time without the cache.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 10]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from mcp import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+
+async def _start_once(env: dict) -> tuple[float, float]:
+    """Seconds from spawning the server until initialize and until tools/list were answered"""
+    server = StdioServerParameters(command=sys.executable, args=["-m", "terminal"], env=env)
+    with open(os.devnull, "w") as errlog:
+        start = time.perf_counter()
+        async with stdio_client(server, errlog=errlog) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                initialized = time.perf_counter()
+                await session.list_tools()
+                listed = time.perf_counter()
+    return initialized - start, listed - start
+
+async def _measure(label: str, runs: int, env: dict, cold: bool) -> None:
+    initialize, tools = [], []
+    for _ in range(runs):
+        cache_dir = env["MCP_TERMINAL_CACHE_DIR"]
+        if cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        first, second = await _start_once(env)
+        initialize.append(first)
+        tools.append(second)
+    print(f"{label:30} initialize {statistics.median(initialize) * 1000:7.1f}ms"
+          f"  tools/list {statistics.median(tools) * 1000:7.1f}ms  (median of {runs})")
+
+async def main(runs: int) -> None:
+    cache_dir = tempfile.mkdtemp(prefix="mcp-terminal-cold-start-")
+    env = {**os.environ, "MCP_TERMINAL_CACHE_DIR": cache_dir}
+    env.pop("MCP_TERMINAL_TOOL_CACHE", None)
+    try:
+        # The first start also warms the page cache for the imports
+        await _start_once(env)
+        await _measure("schema cache disabled", runs, {**env, "MCP_TERMINAL_TOOL_CACHE": "0"}, cold=False)
+        await _measure("cold schema cache", runs, env, cold=True)
+        await _start_once(env)
+        await _measure("warm schema cache", runs, env, cold=False)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs))
@@ -0,0 +1,103 @@
+"""
+Payload size and cost of output compaction on typical command output.
+
+For each synthetic output (progress bars, a build log with repeated warnings, a long stack
+trace, coloured test output, plain unique lines), prints the JSON size of the command_result
+returned by run_command without and with compaction, the reduction, and the time spent
+compacting in one pass and fed in 64 KB chunks as a streamed command is. The outputs are
+printed by `cat` through terminal_run_command_async and terminal_stream_command, so the
+sizes are those a client receives.
+
+Usage:
+    python benchmarks/bench_compaction.py [--scale 1.0] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from pydantic_core import to_json
+from terminal import compaction
+from terminal.terminal import terminal_run_command_async, terminal_stream_command
+
+def _progress_bars(scale: float) -> str:
+    # pip/tqdm style: coloured bars redrawn with \r, one finished line per download
+    lines = []
+    for package in range(int(40 * scale)):
+        redraws = "".join(f"\x1b[2K\r\x1b[32m{'━' * (step // 2)}\x1b[0m {step}% {step * 13} kB/s" for step in range(0, 101))
+        lines.append(f"Downloading package{package}-1.0.tar.gz\n{redraws}\n")
+    return "".join(lines)
+
+def _build_log(scale: float) -> str:
+    warning = "warning: unused variable 'result' [-Wunused-variable]\n"
+    lines = []
+    for unit in range(int(300 * scale)):
+        lines.append(f"[{unit}/{int(300 * scale)}] Compiling src/module{unit}.c\n")
+        lines.append(warning * 20)
+    return "".join(lines)
+
+def _stack_trace(scale: float) -> str:
+    frames = [f"    at com.example.service.Handler{index}.handle(Handler{index}.java:{index * 7})\n" for index in range(int(3000 * scale))]
+    return "Exception in thread \"main\" java.lang.StackOverflowError\n" + "".join(frames)
+
+def _test_output(scale: float) -> str:
+    rng = random.Random(0)
+    lines = []
+    for index in range(int(5000 * scale)):
+        status = "\x1b[32mPASSED\x1b[0m" if rng.random() < 0.98 else "\x1b[31mFAILED\x1b[0m"
+        lines.append(f"tests/test_module{index // 50}.py::test_case_{index} {status} \x1b[36m[{index * 100 // int(5000 * scale)}%]\x1b[0m\n")
+    return "".join(lines)
+
+def _unique_lines(scale: float) -> str:
+    rng = random.Random(1)
+    return "".join(f"{index:08d} {rng.getrandbits(128):032x}\n" for index in range(int(20000 * scale)))
+
+OUTPUTS = {
+    "progress bars": _progress_bars,
+    "build log": _build_log,
+    "stack trace": _stack_trace,
+    "test output": _test_output,
+    "unique lines": _unique_lines,
+}
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _compact_chunked(text: str) -> str:
+    compactor = compaction.output_compactor()
+    step = 64 * 1024
+    return "".join(compactor.feed(text[index:index + step]) for index in range(0, len(text), step)) + compactor.finish()
+
+async def main(scale: float, repeat: int) -> None:
+    options = compaction.default_options
+    print(f"{'output':14} {'raw payload':>12} {'compacted':>10} {'streamed':>10} {'saved':>6} {'one pass':>9} {'chunked':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, generate in OUTPUTS.items():
+            text = generate(scale)
+            path = os.path.join(directory, "output.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            raw = await terminal_run_command_async(["cat", path])
+            compacted = compaction.compact_result(raw, options)
+            streamed = await terminal_stream_command(["cat", path], compaction=options)
+            assert streamed.stdout == compacted.stdout, f"{name}: streamed and one-pass compaction differ"
+            raw_size, compacted_size = len(to_json(raw)), len(to_json(compacted))
+            streamed_size = len(to_json(streamed))
+            one_pass = _best(lambda: compaction.compact_text(text, options), repeat)
+            chunked = _best(lambda: _compact_chunked(text), repeat)
+            print(f"{name:14} {raw_size / 1024:>10.1f}KB {compacted_size / 1024:>8.1f}KB {streamed_size / 1024:>8.1f}KB"
+                  f" {1 - compacted_size / raw_size:>6.1%} {one_pass * 1000:>7.1f}ms {chunked * 1000:>7.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="Scales the size of every output")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.scale, args.repeat))
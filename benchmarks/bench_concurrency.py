@@ -0,0 +1,60 @@
+"""
+Compares sequential and concurrent run_command calls.
+
+With the async tools, N parallel calls should finish in roughly max(latency)
+instead of sum(latency), and cheap tools must stay responsive while a long
+command is running.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--calls 8] [--sleep 0.5]
+"""
+import argparse
+import asyncio
+import time
+
+from terminal.server import mcp
+from terminal.terminal import terminal_run_command
+
+def _sleep_command(seconds: float) -> str:
+    # `sleep` exists both in POSIX shells and as a PowerShell alias
+    return f"sleep {seconds}"
+
+def bench_sequential(calls: int, seconds: float) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        terminal_run_command(_sleep_command(seconds))
+    return time.perf_counter() - start
+
+async def bench_concurrent(calls: int, seconds: float) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(mcp.call_tool("run_command", {"command": _sleep_command(seconds)}) for _ in range(calls)))
+    return time.perf_counter() - start
+
+async def bench_responsiveness(seconds: float) -> float:
+    """Latency of get_working_directory while a long command is running"""
+    long_call = asyncio.create_task(mcp.call_tool("run_command", {"command": _sleep_command(seconds)}))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await mcp.call_tool("get_working_directory", {})
+    latency = time.perf_counter() - start
+    await long_call
+    return latency
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=8)
+    parser.add_argument("--sleep", type=float, default=0.5)
+    args = parser.parse_args()
+
+    sequential = bench_sequential(args.calls, args.sleep)
+    concurrent = asyncio.run(bench_concurrent(args.calls, args.sleep))
+    responsiveness = asyncio.run(bench_responsiveness(args.sleep))
+
+    print(f"{args.calls} calls x {args.sleep:.2f}s")
+    print(f"  sequential (sum of latencies): {sequential:.3f}s")
+    print(f"  concurrent (max of latencies): {concurrent:.3f}s")
+    print(f"  speedup: {sequential / concurrent:.1f}x")
+    print(f"  get_working_directory during a running command: {responsiveness * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
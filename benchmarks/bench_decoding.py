@@ -0,0 +1,160 @@
+"""
+Decode passes, time and allocations of the output decoder against the original _decode_output.
+
+Builds outputs in several encodings (UTF-8, UTF-8 with a stray Latin-1 byte near the end,
+Latin-1, UTF-16) and decodes each one whole, then in 64 KiB streamed chunks. Decode passes
+count the bytes handed to codecs divided by the output size; peak allocation is measured
+with tracemalloc, beyond the output itself.
+
+Usage:
+    python benchmarks/bench_decoding.py [--size 100M] [--repeat 3]
+"""
+import argparse
+import codecs
+import locale
+import sys
+import time
+import tracemalloc
+
+from terminal.decoding import output_decoder, decode_output
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+_CHUNK_SIZE = 64 * 1024
+
+def _parse_size(text: str) -> int:
+    text = text.strip().upper()
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+def make_outputs(size: int) -> dict[str, bytes]:
+    line = "build step ✓ naïve café 12345 done\n"
+    text = (line * (size // len(line.encode()) + 1))
+    utf8 = text.encode()[:size]
+    utf8 = utf8[:utf8.rfind(b"\n") + 1]
+    # A tool printing one Latin-1 name at the very end of otherwise UTF-8 output
+    mixed = utf8[:-16] + b"r\xe9sum\xe9 done.\n"
+    latin1 = text.encode("latin1", errors="replace")[:size]
+    utf16 = text[:size // 2].encode("utf-16")
+    return {"utf-8": utf8, "utf-8 + latin-1 tail": mixed, "latin-1": latin1, "utf-16": utf16}
+
+# ---------------------------------------------------------------------------
+# The original implementation
+# ---------------------------------------------------------------------------
+
+def _get_encoding_candidates() -> list[str]:
+    return [sys.stdout.encoding, sys.stdin.encoding, locale.getpreferredencoding()]
+
+def legacy_decode_output(output_bytes, encoding_candidates: list[str] = []):
+    if isinstance(output_bytes, str):
+        return output_bytes
+    encoding_candidates.extend(["utf-8", "utf-16", "latin1"])
+    for encoding in encoding_candidates:
+        try:
+            return output_bytes.decode(encoding)
+        except (UnicodeDecodeError, UnicodeError, LookupError):
+            continue
+    return output_bytes.decode("utf-8", errors="replace")
+
+def legacy_streamed(data: bytes) -> str:
+    # The original pipeline buffered every chunk and decoded once at the end
+    buffer = bytearray()
+    for start in range(0, len(data), _CHUNK_SIZE):
+        buffer.extend(data[start:start + _CHUNK_SIZE])
+    return legacy_decode_output(bytes(buffer), _get_encoding_candidates())
+
+# ---------------------------------------------------------------------------
+# The decoder
+# ---------------------------------------------------------------------------
+
+def decoder_whole(data: bytes) -> str:
+    return decode_output(data)
+
+def decoder_streamed(data: bytes) -> str:
+    decoder = output_decoder()
+    view = memoryview(data)
+    parts = [decoder.decode(view[start:start + _CHUNK_SIZE]) for start in range(0, len(data), _CHUNK_SIZE)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+IMPLEMENTATIONS = {
+    "original, whole": lambda data: legacy_decode_output(data, _get_encoding_candidates()),
+    "original, streamed": legacy_streamed,
+    "decoder, whole": decoder_whole,
+    "decoder, streamed": decoder_streamed,
+}
+
+class _counting_codecs:
+    """Count the bytes handed to incremental decoders, including those used for detection"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def __enter__(self):
+        self._getincrementaldecoder = codecs.getincrementaldecoder
+        counter = self
+
+        def getincrementaldecoder(encoding):
+            cls = counter._getincrementaldecoder(encoding)
+
+            class counted(cls):
+                def decode(self, data, final=False):
+                    counter.bytes += len(data)
+                    return super().decode(data, final)
+            return counted
+        codecs.getincrementaldecoder = getincrementaldecoder
+        return self
+
+    def __exit__(self, *exc):
+        codecs.getincrementaldecoder = self._getincrementaldecoder
+
+def _legacy_passes(data: bytes) -> int:
+    # bytes.decode cannot be wrapped, replay the candidate order instead
+    passes = 0
+    for encoding in _get_encoding_candidates() + ["utf-8", "utf-16", "latin1"]:
+        passes += 1
+        try:
+            data.decode(encoding)
+            return passes
+        except (UnicodeError, LookupError):
+            continue
+    return passes + 1
+
+def measure(name: str, data: bytes, repeat: int) -> tuple[float, float, float]:
+    func = IMPLEMENTATIONS[name]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    result = func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Allocation beyond the decoded text itself
+    extra = peak - sys.getsizeof(result)
+    del result
+    if name.startswith("original"):
+        passes = _legacy_passes(data)
+    else:
+        with _counting_codecs() as counter:
+            func(data)
+        passes = counter.bytes / len(data)
+    return best, passes, extra
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="100M", help="Output size, e.g. 10M or 1G")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size = _parse_size(args.size)
+    for label, data in make_outputs(size).items():
+        print(f"{label} ({len(data) / 1024 ** 2:.0f} MiB):")
+        for name in IMPLEMENTATIONS:
+            best, passes, extra = measure(name, data, args.repeat)
+            print(f"  {name:20} {best:7.3f}s  {passes:5.2f} decode passes  {extra / 1024 ** 2:8.1f} MiB extra peak")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Directory size analysis: `du -s`, a single-threaded os.walk, and get_directory_sizes cold and cached.
+
+Generates a tree of --dirs directories holding --files files each, then times a full analysis
+with every method. The cached run follows a change to one directory, so it shows the cost of
+re-listing only what changed. POSIX only (uses `du`).
+
+Usage:
+    python benchmarks/bench_directory_sizes.py [--dirs 2000] [--files 20] [--repeat 3]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from terminal import directory_sizes
+
+def _build_tree(root: str, dirs: int, files: int) -> None:
+    for index in range(dirs):
+        directory = os.path.join(root, f"group{index % 20}", f"dir{index}")
+        os.makedirs(directory)
+        for number in range(files):
+            with open(os.path.join(directory, f"file{number}.txt"), "wb") as f:
+                f.write(b"x" * (100 + number * 37))
+
+def _serial_walk(root: str) -> int:
+    total = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            total += os.lstat(os.path.join(directory, name)).st_blocks * 512
+    return total
+
+def _best(fn, repeat: int, before=None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(dirs: int, files: int, repeat: int) -> None:
+    root = tempfile.mkdtemp(prefix="mcp-terminal-sizes-")
+    try:
+        _build_tree(root, dirs, files)
+        changed = os.path.join(root, "group0", "dir0")
+        counter = iter(range(1_000_000))
+
+        def touch() -> None:
+            with open(os.path.join(changed, f"new{next(counter)}.txt"), "wb") as f:
+                f.write(b"y" * 4096)
+
+        print(f"{dirs} directories, {dirs * files} files, {directory_sizes.size_workers} size workers")
+        timings = {
+            "du -s": _best(lambda: subprocess.run(["du", "-s", root], capture_output=True, check=True), repeat),
+            "os.walk + lstat (serial)": _best(lambda: _serial_walk(root), repeat),
+            "get_directory_sizes, cold": _best(lambda: directory_sizes.analyze(root, use_cache=False), repeat),
+        }
+        directory_sizes.analyze(root)
+        timings["get_directory_sizes, one dir changed"] = _best(lambda: directory_sizes.analyze(root), repeat, before=touch)
+        for label, seconds in timings.items():
+            print(f"  {label:40} {seconds * 1000:9.1f}ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        directory_sizes.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirs", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.dirs, args.files, args.repeat)
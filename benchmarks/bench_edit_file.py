@@ -0,0 +1,126 @@
+"""
+Changing one line of a large file: rewriting it with create_file vs. edit_file.
+
+Every call goes through an in-memory MCP client session, so the JSON-RPC request is encoded,
+sent and validated like with a real client (minus the pipe). A source file of --lines lines is
+edited --repeat times, one line each time, by:
+  - create_file with the whole new content, what clients do without edit_file
+  - edit_file with a search/replace edit
+  - edit_file with a unified diff (3 lines of context)
+  - edit_file with a line range
+  - edit_file with a search/replace edit and base_sha256, the hash of the previous edit
+The request size is the JSON of the tool arguments, the bytes a client has to generate. The
+same edits are then timed without the MCP session, the work left to the server; the latency of
+a call through the session mostly hides it.
+
+Usage:
+    python benchmarks/bench_edit_file.py [--lines 5000] [--repeat 50]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from mcp.shared.memory import create_connected_server_and_client_session
+from terminal import file_editor, file_writer
+from terminal.server import mcp
+
+def _source(lines: int) -> list[str]:
+    return [f"    value_{index} = compute({index}, scale=2)  # line {index + 1}\n" for index in range(lines)]
+
+def _arguments(method: str, path: str, lines: list[str], index: int, round_number: int, sha256: str) -> dict:
+    old, new = lines[index], f"    value_{index} = compute({index}, scale={round_number + 3})  # line {index + 1}\n"
+    lines[index] = new
+    if method == "create_file":
+        return {"file_path": path, "content": "".join(lines)}
+    if method == "search/replace":
+        return {"file_path": path, "edits": [{"old_text": old, "new_text": new}]}
+    if method == "search/replace + base_sha256":
+        return {"file_path": path, "edits": [{"old_text": old, "new_text": new}], "base_sha256": sha256}
+    if method == "line range":
+        return {"file_path": path, "edits": [{"start_line": index + 1, "end_line": index + 1, "new_text": new}]}
+    start = max(index - 3, 0)
+    context = lines[start:index]
+    after = lines[index + 1:index + 4]
+    hunk = [f"@@ -{start + 1},{len(context) + len(after) + 1} +{start + 1},{len(context) + len(after) + 1} @@\n"]
+    hunk += [" " + line for line in context] + ["-" + old, "+" + new] + [" " + line for line in after]
+    return {"file_path": path, "diff": "".join(hunk)}
+
+def _direct(arguments: dict) -> str | None:
+    if "content" in arguments:
+        file_writer.write_file(arguments["file_path"], arguments["content"])
+        return None
+    edits = [file_editor.text_edit(**edit) for edit in arguments.get("edits", [])]
+    return file_editor.edit_file(arguments["file_path"], arguments.get("diff", ""), edits,
+                                 arguments.get("base_sha256", "")).sha256
+
+def _server_side(path: str, line_count: int, repeat: int, methods: tuple[str, ...]) -> None:
+    print("Without the MCP session")
+    lines = _source(line_count)
+    with open(path, "w") as f:
+        f.writelines(lines)
+    baseline = None
+    for method in methods:
+        sha256 = hashlib.sha256("".join(lines).encode()).hexdigest()
+        timings = []
+        for round_number in range(repeat):
+            arguments = _arguments(method, path, lines, (round_number * 37) % line_count, round_number, sha256)
+            start = time.perf_counter()
+            sha256 = _direct(arguments)
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings)
+        baseline = baseline or median
+        print(f"  {method:30} median {median * 1000:6.2f}ms (x{baseline / median:.1f})")
+
+async def run(line_count: int, repeat: int) -> None:
+    root = tempfile.mkdtemp(prefix="mcp-terminal-edit-")
+    path = os.path.join(root, "module.py")
+    methods = ("create_file", "search/replace", "unified diff", "line range", "search/replace + base_sha256")
+    try:
+        async with create_connected_server_and_client_session(mcp) as session:
+            lines = _source(line_count)
+            with open(path, "w") as f:
+                f.writelines(lines)
+            print(f"One line changed in a {line_count}-line file ({os.path.getsize(path):,} bytes), {repeat} times")
+            baseline = None
+            for method in methods:
+                read = await session.call_tool("read_file", {"file_path": path})
+                sha256 = read.structuredContent["sha256"]
+                sizes, timings = [], []
+                for round_number in range(repeat):
+                    index = (round_number * 37) % line_count
+                    arguments = _arguments(method, path, lines, index, round_number, sha256)
+                    tool = "create_file" if method == "create_file" else "edit_file"
+                    start = time.perf_counter()
+                    result = await session.call_tool(tool, arguments)
+                    timings.append(time.perf_counter() - start)
+                    assert result.structuredContent["success"], result.structuredContent["stderr"]
+                    sha256 = result.structuredContent.get("sha256")
+                    sizes.append(len(json.dumps(arguments)))
+                with open(path) as f:
+                    assert f.read() == "".join(lines), f"{method} left different content"
+                median = statistics.median(timings)
+                size = statistics.median(sizes)
+                baseline = baseline or (size, median)
+                print(f"  {method:30} request {size:>9,.0f} bytes (x{baseline[0] / size:>6.0f} smaller)"
+                      f"  median {median * 1000:6.2f}ms (x{baseline[1] / median:.1f})")
+        _server_side(path, line_count, repeat, methods)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.lines, args.repeat))
+
+if __name__ == "__main__":
+    main()
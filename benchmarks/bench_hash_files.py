@@ -0,0 +1,112 @@
+"""
+Content hashing: sha256sum through a shell vs. the parallel, cached hashing of hash_files.
+
+Generates a tree of --small-files files of 1 to 16 KB and --large-files files of --large-mb MB, a
+quarter of which are copies of others, then times:
+  - find | xargs sha256sum, what run_command amounts to
+  - hashlib.file_digest over every file, one at a time
+  - hash_files with an empty digest cache, with a warm one, and with one loaded from disk
+    (a restarted server)
+  - finding duplicates by hashing every file, vs. the size / partial hash / full hash stages
+    of hash_files find_duplicates=True
+The parallel rows gain with the number of cores: hashlib releases the GIL while digesting.
+
+Usage:
+    python benchmarks/bench_hash_files.py [--small-files 20000] [--large-files 8] [--large-mb 64]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from terminal import file_hashes
+
+def _build_tree(root: str, small_files: int, large_files: int, large_mb: int) -> None:
+    for index in range(small_files):
+        directory = os.path.join(root, "src", f"pkg{index // 500}")
+        os.makedirs(directory, exist_ok=True)
+        # Every fourth file repeats the content of the previous one
+        original = index - index % 4 // 3
+        with open(os.path.join(directory, f"file{index}.txt"), "wb") as f:
+            f.write(f"{original}\n".encode().ljust(1024 + original * 37 % 15360, b"x"))
+    os.makedirs(os.path.join(root, "dist"))
+    block = os.urandom(1024 * 1024)
+    for index in range(large_files):
+        with open(os.path.join(root, "dist", f"blob{index}.bin"), "wb") as f:
+            # Same size for all, only every fourth file is a copy of the previous one
+            for number in range(large_mb):
+                f.write(block if number else f"{index - index % 4 // 3}".encode().ljust(1024 * 1024, b"\0"))
+
+def _time(label: str, fn) -> float:
+    start = time.perf_counter()
+    detail = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:48} {elapsed * 1000:9.1f}ms  {detail or ''}")
+    return elapsed
+
+def _sha256sum(root: str) -> str:
+    output = subprocess.run(f"find '{root}' -type f -print0 | xargs -0 sha256sum", shell=True,
+                            capture_output=True, check=True).stdout
+    return f"{len(output.splitlines())} digests"
+
+def _serial(root: str) -> dict[str, bytes]:
+    digests = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                digests[path] = hashlib.file_digest(f, "sha256").digest()
+    return digests
+
+def _describe(result: file_hashes.hash_result) -> str:
+    return f"{result.files_hashed} read, {result.files_cached} cached, {result.bytes_hashed / 1024 / 1024:.0f} MB"
+
+def main(small_files: int, large_files: int, large_mb: int) -> None:
+    base = tempfile.mkdtemp(prefix="mcp-terminal-hash-")
+    root = os.path.join(base, "tree")
+    cache_path = os.path.join(base, "digests.bin")
+    try:
+        _build_tree(root, small_files, large_files, large_mb)
+        print(f"{small_files} files of 1 to 16 KB and {large_files} of {large_mb} MB, {file_hashes.hash_workers} hash workers")
+        baseline = _time("find | xargs sha256sum", lambda: _sha256sum(root))
+        _time("hashlib.file_digest, one file at a time", lambda: f"{len(_serial(root))} digests")
+        limit = small_files + large_files
+        file_hashes._cache = file_hashes.digest_cache(cache_path, file_hashes.hash_cache_entries)
+        cold = _time("hash_files, empty cache", lambda: _describe(file_hashes.hash_tree(root, limit=limit)))
+        print(f"  {'':48} x{baseline / cold:.1f}")
+        warm = _time("hash_files, warm cache", lambda: _describe(file_hashes.hash_tree(root, limit=limit)))
+        print(f"  {'':48} x{baseline / warm:.1f}")
+        file_hashes._cache.save()
+        file_hashes._cache = file_hashes.digest_cache(cache_path, file_hashes.hash_cache_entries)
+        _time("hash_files, cache loaded from disk", lambda: _describe(file_hashes.hash_tree(root, limit=limit)))
+
+        print("finding duplicates")
+
+        def naive() -> str:
+            groups = {}
+            for path, digest in _serial(root).items():
+                groups.setdefault(digest, []).append(path)
+            return f"{sum(1 for paths in groups.values() if len(paths) > 1)} groups"
+
+        naive_time = _time("hash every file, group by digest", naive)
+
+        def staged() -> str:
+            result = file_hashes.find_duplicates(root, use_cache=False, limit=limit)
+            return f"{len(result.duplicates)} groups, {result.partial_hashes} partial hashes, " + _describe(result)
+
+        staged_time = _time("find_duplicates, no cache", staged)
+        print(f"  {'':48} x{naive_time / staged_time:.1f}")
+    finally:
+        file_hashes.shutdown()
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small-files", type=int, default=20000)
+    parser.add_argument("--large-files", type=int, default=8)
+    parser.add_argument("--large-mb", type=int, default=64)
+    args = parser.parse_args()
+    main(args.small_files, args.large_files, args.large_mb)
@@ -0,0 +1,132 @@
+"""
+Load test of one server process shared by many clients over streamable HTTP (or SSE).
+
+Starts `python -m terminal --transport streamable-http` on a local port, then runs
+--clients simulated agents concurrently, each with its own MCP session, issuing --calls
+tool calls back to back. Reports p50/p99 call latency, throughput, failed calls and the
+server's resident memory, next to the memory of a server process that answered one
+call (the cost per client when every client spawns its own stdio server).
+
+Usage:
+    python benchmarks/bench_http_load.py [--clients 50] [--calls 40] [--tool get_working_directory]
+                                         [--transport streamable-http] [--port 8765]
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import subprocess
+import sys
+import time
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+TOOLS = {
+    "get_working_directory": {},
+    "list_directory": {"path": "."},
+    "run_command": {"command": "echo hello"},
+}
+
+def _rss_kb(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Server did not listen on port {port}")
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _client(transport: str, url: str):
+    return streamablehttp_client(url) if transport == "streamable-http" else sse_client(url)
+
+async def simulated_client(transport: str, url: str, tool: str, calls: int, latencies: list[float], errors: list[str]) -> None:
+    try:
+        async with _client(transport, url) as streams:
+            async with ClientSession(streams[0], streams[1]) as session:
+                await session.initialize()
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    result = await session.call_tool(tool, TOOLS[tool])
+                    latencies.append(time.perf_counter() - start)
+                    if result.isError:
+                        errors.append(str(result.content))
+    except Exception as e:
+        errors.append(repr(e))
+
+_STDIO_RSS_CHILD = """
+import asyncio
+from terminal.server import mcp
+asyncio.run(mcp.call_tool("get_working_directory", {}))
+with open("/proc/self/status") as f:
+    print(next(line.split()[1] for line in f if line.startswith("VmRSS:")))
+"""
+
+def stdio_server_rss() -> int | None:
+    """Resident memory of a server process that imported everything and answered one call"""
+    output = subprocess.run([sys.executable, "-c", _STDIO_RSS_CHILD], capture_output=True, text=True)
+    return int(output.stdout) if output.returncode == 0 and output.stdout.strip() else None
+
+async def run(args: argparse.Namespace, server: subprocess.Popen) -> None:
+    path = "/mcp" if args.transport == "streamable-http" else "/sse"
+    url = f"http://127.0.0.1:{args.port}{path}"
+    latencies: list[float] = []
+    errors: list[str] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(simulated_client(args.transport, url, args.tool, args.calls, latencies, errors)
+                           for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    server_rss = _rss_kb(server.pid)
+
+    print(f"{args.clients} clients x {args.calls} {args.tool} calls over {args.transport}")
+    if latencies:
+        print(f"  p50 latency:  {_percentile(latencies, 0.50) * 1000:8.2f}ms")
+        print(f"  p99 latency:  {_percentile(latencies, 0.99) * 1000:8.2f}ms")
+        print(f"  throughput:   {len(latencies) / elapsed:8.1f} calls/s")
+    print(f"  failed calls: {len(errors)}" + (f" (first: {errors[0][:200]})" if errors else ""))
+    if server_rss:
+        print(f"  server RSS:   {server_rss / 1024:8.1f} MiB for all clients")
+    stdio_rss = stdio_server_rss() if sys.platform.startswith("linux") else None
+    if stdio_rss:
+        print(f"  stdio RSS:    {stdio_rss / 1024:8.1f} MiB per client, {stdio_rss * args.clients / 1024:.0f} MiB for {args.clients} processes")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--tool", choices=sorted(TOOLS), default="get_working_directory")
+    parser.add_argument("--transport", choices=("streamable-http", "sse"), default="streamable-http")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-connections", type=int, default=None)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    command = [sys.executable, "-m", "terminal", "--transport", args.transport, "--port", str(args.port), "--log-level", "WARNING"]
+    if args.max_connections:
+        command += ["--max-connections", str(args.max_connections)]
+    server = subprocess.Popen(command)
+    try:
+        _wait_for_port(args.port)
+        asyncio.run(run(args, server))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Throughput of the search engine against the original glob + line-by-line implementation.
+
+Generates a synthetic tree (source-like text files plus some binaries and an ignored
+vendor directory) in a temporary directory and searches it with both implementations.
+
+Usage:
+    python benchmarks/bench_search.py [--files 20000] [--lines 100] [--processes 4]
+"""
+import argparse
+import glob
+import os
+import random
+import tempfile
+import time
+
+from terminal import search
+
+_WORDS = ["alpha", "beta", "gamma", "delta", "return", "import", "value", "result", "config", "handler"]
+
+def generate_tree(root: str, files: int, lines: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    per_directory = 100
+    for index in range(files):
+        directory = os.path.join(root, f"pkg{index // (per_directory * 10)}", f"mod{index // per_directory}")
+        os.makedirs(directory, exist_ok=True)
+        body = []
+        for line in range(lines):
+            words = rng.choices(_WORDS, k=8)
+            if rng.random() < 0.002:
+                words.append("needle_token")
+            body.append(" ".join(words))
+        with open(os.path.join(directory, f"file{index}.py"), "w") as f:
+            f.write("\n".join(body))
+        if index % 500 == 0:
+            with open(os.path.join(directory, f"blob{index}.bin"), "wb") as f:
+                f.write(os.urandom(64 * 1024))
+    vendor = os.path.join(root, "node_modules", "dep")
+    os.makedirs(vendor, exist_ok=True)
+    for index in range(files // 10):
+        with open(os.path.join(vendor, f"dep{index}.js"), "w") as f:
+            f.write("needle_token\n" * 10)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("node_modules/\n")
+
+def legacy_search(root: str, search_text: str, case_sensitive: bool) -> int:
+    """The original search_in_files algorithm"""
+    files = [f for f in glob.glob(os.path.join(root, "**", "*"), recursive=True) if os.path.isfile(f)]
+    search_term = search_text if case_sensitive else search_text.lower()
+    results = []
+    for file_path in files:
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                for line_num, line in enumerate(f, 1):
+                    line_to_check = line if case_sensitive else line.lower()
+                    if search_term in line_to_check:
+                        results.append(f"{file_path}:{line_num}: {line.rstrip()}")
+        except (UnicodeDecodeError, PermissionError, IsADirectoryError):
+            continue
+    return len(results)
+
+def _time(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    search.search_processes = args.processes
+
+    with tempfile.TemporaryDirectory() as root:
+        generate_tree(root, args.files, args.lines)
+        total = sum(os.path.getsize(os.path.join(d, f)) for d, _, names in os.walk(root) for f in names)
+        print(f"tree: {args.files} files, {total / 2**20:.1f} MB, {args.processes} search processes")
+
+        for label, case_sensitive in (("case-sensitive", True), ("case-insensitive", False)):
+            legacy_time, legacy_count = _time(legacy_search, root, "needle_token", case_sensitive)
+            new_time, outcome = _time(search.search_files, root, "needle_token",
+                                      case_sensitive=case_sensitive, max_results=10**9)
+            print(f"  {label}:")
+            print(f"    legacy  {legacy_time:7.3f}s  {legacy_count} matches (including ignored files)")
+            print(f"    engine  {new_time:7.3f}s  {outcome.match_count} matches  {outcome.files_scanned} files scanned"
+                  f"  ({legacy_time / new_time:.1f}x)")
+
+        regex_time, outcome = _time(search.search_files, root, r"needle_\w+", use_regex=True, max_results=10**9)
+        print(f"  regex:            {regex_time:7.3f}s  {outcome.match_count} matches")
+        early_time, outcome = _time(search.search_files, root, "alpha", max_results=100)
+        print(f"  early stop (100): {early_time:7.3f}s  {outcome.files_scanned} files scanned")
+    search.shutdown()
+
+if __name__ == "__main__":
+    main()
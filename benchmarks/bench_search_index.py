@@ -0,0 +1,100 @@
+"""
+Repeat searches with and without the trigram index.
+
+Generates the synthetic tree of bench_search.py plus files with unique identifiers,
+builds the index once and then compares a full walk-and-scan with indexed searches,
+re-stating the tree before each query and trusting the index of a directory watched with
+inotify (Linux).
+
+Usage:
+    python benchmarks/bench_search_index.py [--files 20000] [--lines 100] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from bench_search import generate_tree
+from terminal import search, search_index, watcher
+
+_QUERIES = [
+    ("rare literal", "needle_token", False, True),
+    ("unique identifier", "ident_04242", False, True),
+    ("case-insensitive", "IDENT_01234", False, False),
+    ("regex", r"def ident_0\d+\(", True, True),
+]
+
+def _add_identifiers(root: str, files: int) -> None:
+    directory = os.path.join(root, "idents")
+    os.makedirs(directory, exist_ok=True)
+    for index in range(files):
+        with open(os.path.join(directory, f"ident{index}.py"), "w") as f:
+            f.write(f"def ident_{index:05d}(value):\n    return value\n")
+
+def _median_time(func, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as cache_dir:
+        search_index.settings.cache_dir = cache_dir
+        generate_tree(root, args.files, args.lines)
+        _add_identifiers(root, args.files // 2)
+        print(f"tree: {args.files + args.files // 2} files")
+
+        start = time.perf_counter()
+        index = search_index.get_index(root, create=True)
+        index.ready.wait()
+        print(f"  index build:   {time.perf_counter() - start:7.3f}s  {index.describe()}")
+        print(f"  index on disk: {os.path.getsize(index.cache_path) / 2**20:7.1f} MB")
+
+        start = time.perf_counter()
+        search_index._indexes.clear()
+        reloaded = search_index.get_index(root, create=True)
+        reloaded.ready.wait()
+        print(f"  index reload:  {time.perf_counter() - start:7.3f}s  (load and re-stat)")
+
+        results = []
+        for label, text, use_regex, case_sensitive in _QUERIES:
+            def scan():
+                return search.search_files(root, text, use_regex=use_regex, case_sensitive=case_sensitive,
+                                           max_results=10**9)
+
+            # The query is bound now, the watched runs call it after the loop
+            def indexed(text=text, use_regex=use_regex, case_sensitive=case_sensitive):
+                paths = search_index.candidate_files(root, text, use_regex=use_regex, case_sensitive=case_sensitive)
+                return search.search_files(root, text, use_regex=use_regex, case_sensitive=case_sensitive,
+                                           max_results=10**9, paths=paths)
+
+            scan_time, expected = _median_time(scan, args.repeat)
+            restat_time, outcome = _median_time(indexed, args.repeat)
+            assert outcome.matches == expected.matches
+            results.append((label, scan_time, expected, restat_time, outcome, indexed))
+
+        # Watched with inotify, the index is trusted until a change is reported
+        watched = watcher.watch(root).backend == "inotify"
+        for label, scan_time, expected, restat_time, outcome, indexed in results:
+            print(f"  {label}:")
+            print(f"    walk and scan    {scan_time * 1000:9.1f} ms  {expected.files_scanned} files scanned")
+            print(f"    indexed + stat   {restat_time * 1000:9.1f} ms  {outcome.files_scanned} files scanned"
+                  f"  ({scan_time / restat_time:.0f}x)")
+            if watched:
+                trusted_time, trusted_outcome = _median_time(indexed, args.repeat)
+                assert trusted_outcome.matches == expected.matches
+                print(f"    indexed, watched {trusted_time * 1000:9.1f} ms  ({scan_time / trusted_time:.0f}x)")
+    watcher.shutdown()
+    search.shutdown()
+
+if __name__ == "__main__":
+    main()
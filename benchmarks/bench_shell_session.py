@@ -0,0 +1,54 @@
+"""
+Per-call latency of the persistent shell session compared to spawning a shell per command.
+
+Usage:
+    python benchmarks/bench_shell_session.py [--calls 200] [--command "echo hello"]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from terminal.shell_session import shell_session
+from terminal.terminal import terminal_run_command_async
+
+async def _measure(run, calls: int) -> list[float]:
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        result = await run()
+        latencies.append(time.perf_counter() - start)
+        if not result.success:
+            raise RuntimeError(result.stderr)
+    return latencies
+
+def _report(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"  {name:<12} p50 {p50:7.3f}ms  p99 {p99:7.3f}ms  total {sum(latencies):.3f}s")
+
+async def run(calls: int, command: str) -> None:
+    cwd = os.getcwd()
+    spawn = await _measure(lambda: terminal_run_command_async(command, cwd), calls)
+
+    session = shell_session(cwd)
+    await session.run("true")  # Exclude shell startup from the measurement
+    persistent = await _measure(lambda: session.run(command), calls)
+    await session.close()
+
+    print(f"{calls} calls of {command!r}")
+    _report("spawn", spawn)
+    _report("persistent", persistent)
+    print(f"  speedup: {statistics.median(spawn) / statistics.median(persistent):.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--command", default="echo hello")
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.command))
+
+if __name__ == "__main__":
+    main()
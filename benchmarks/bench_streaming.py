@@ -0,0 +1,54 @@
+"""
+Peak memory of buffered vs. streamed command execution for growing output sizes.
+
+Each measurement runs in a fresh interpreter so ru_maxrss reflects a single command.
+POSIX only (uses the resource module and `yes`/`head`).
+
+Usage:
+    python benchmarks/bench_streaming.py [--sizes 1K,10M,200M]
+"""
+import argparse
+import subprocess
+import sys
+
+_CHILD = """
+import asyncio, resource, sys, time
+from terminal.terminal import terminal_run_command, terminal_stream_command
+mode, size = sys.argv[1], int(sys.argv[2])
+command = f"yes 0123456789abcdef | head -c {size}"
+start = time.perf_counter()
+if mode == "buffered":
+    result = terminal_run_command(command)
+else:
+    result = asyncio.run(terminal_stream_command(command))
+elapsed = time.perf_counter() - start
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, elapsed, len(result.stdout))
+"""
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def _parse_size(text: str) -> int:
+    text = text.strip().upper()
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+def _measure(mode: str, size: int) -> tuple[int, float, int]:
+    output = subprocess.run([sys.executable, "-c", _CHILD, mode, str(size)], capture_output=True, text=True, check=True).stdout
+    rss_kb, elapsed, result_len = output.split()
+    return int(rss_kb), float(elapsed), int(result_len)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1K,10M,200M")
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'mode':>9} {'peak RSS':>10} {'time':>8} {'result chars':>13}")
+    for text in args.sizes.split(","):
+        size = _parse_size(text)
+        for mode in ("buffered", "streamed"):
+            rss_kb, elapsed, result_len = _measure(mode, size)
+            print(f"{text:>10} {mode:>9} {rss_kb / 1024:>8.1f}MB {elapsed:>7.2f}s {result_len:>13}")
+
+if __name__ == "__main__":
+    main()
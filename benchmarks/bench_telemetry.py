@@ -0,0 +1,76 @@
+"""
+Overhead of the telemetry wrapper around tool calls.
+
+For a few tools, times the tool function alone and wrapped by telemetry.instrument, and
+relates the difference to the time of the same call made by an MCP client over an
+in-memory session. With MCP_TERMINAL_TELEMETRY=0 tools are registered unwrapped, so the
+overhead is zero there by construction. read_file of a --large-mb MB file shows the cost on a
+large response, where sizing the payload matters most.
+
+Usage:
+    python benchmarks/bench_telemetry.py [--calls 300] [--repeat 3] [--large-mb 1]
+"""
+import argparse
+import asyncio
+import inspect
+import logging
+import os
+import tempfile
+import time
+
+from mcp.shared.memory import create_connected_server_and_client_session
+from terminal import server, telemetry
+from terminal.server import mcp
+
+WORKLOADS = {
+    "get_working_directory": ("get_working_directory", {}),
+    "list_directory": ("list_directory", {"path": "."}),
+    "get_file_info": ("get_file_info", {"file_path": "."}),
+    "run_command": ("run_command", {"command": "true"}),
+    "read_file (large)": ("read_file", {}),
+}
+
+async def _time_calls(fn, arguments: dict, calls: int, repeat: int) -> float:
+    """Best time per call over repeat rounds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            result = fn(**arguments)
+            if inspect.isawaitable(result):
+                await result
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+async def run(calls: int, repeat: int, large_mb: int) -> None:
+    telemetry.trace_file = telemetry.metrics_file = None
+    with tempfile.TemporaryDirectory() as directory:
+        large_file = os.path.join(directory, "large.txt")
+        with open(large_file, "w") as f:
+            f.write("0123456789abcdef\"quoted\"\n" * (large_mb * 1024 * 1024 // 25))
+        async with create_connected_server_and_client_session(mcp) as session:
+            print(f"{'tool':24} {'bare':>10} {'wrapped':>10} {'client call':>12} {'overhead':>9}")
+            for label, (tool, arguments) in WORKLOADS.items():
+                if tool == "read_file":
+                    arguments = {"file_path": large_file}
+                tool_calls = max(1, calls // 20) if tool in ("run_command", "read_file") else calls
+                bare_fn = getattr(server, tool)
+                wrapped_fn = telemetry.instrument(bare_fn)
+                bare = await _time_calls(bare_fn, arguments, tool_calls, repeat)
+                wrapped = await _time_calls(wrapped_fn, arguments, tool_calls, repeat)
+                client = await _time_calls(lambda **kwargs: session.call_tool(tool, kwargs), arguments, tool_calls, repeat)
+                overhead = max(0.0, wrapped - bare) / client * 100
+                print(f"{label:24} {bare * 1e6:8.1f}us {wrapped * 1e6:8.1f}us {client * 1e6:10.1f}us {overhead:8.2f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--large-mb", type=int, default=1)
+    args = parser.parse_args()
+    # The server logs every request
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.calls, args.repeat, args.large_mb))
+
+if __name__ == "__main__":
+    main()
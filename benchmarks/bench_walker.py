@@ -0,0 +1,163 @@
+"""
+Syscalls and wall time of the scandir walker against the original glob/os.walk/listdir code.
+
+Builds a tree of about 100k entries (nested directories plus one large flat directory)
+and runs each workload in a child interpreter. Syscalls are counted with strace when it
+is installed; otherwise the file-system calls made through the os module are counted,
+which misses os.DirEntry.stat (only used by the detailed listing).
+
+Usage:
+    python benchmarks/bench_walker.py [--entries 100000] [--repeat 3]
+"""
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from terminal import walker
+
+def generate_tree(root: str, entries: int) -> None:
+    """Half of the entries in nested directories of 100 files, half in one flat directory"""
+    nested = entries // 2
+    for index in range(nested):
+        directory = os.path.join(root, "tree", f"d{index // 10000}", f"d{index // 100}")
+        if index % 100 == 0:
+            os.makedirs(directory, exist_ok=True)
+        name = f"f{index}.py" if index % 3 else f"f{index}.txt"
+        open(os.path.join(directory, name), "w").close()
+    flat = os.path.join(root, "flat")
+    os.makedirs(flat)
+    for index in range(entries - nested):
+        open(os.path.join(flat, f"f{index}.dat"), "w").close()
+
+# ---------------------------------------------------------------------------
+# The original implementations
+# ---------------------------------------------------------------------------
+
+def legacy_find(root: str, pattern: str, case_sensitive: bool) -> int:
+    matches = glob.glob(os.path.join(root, "**", pattern), recursive=True)
+    if not case_sensitive:
+        all_files = []
+        for directory, _, files in os.walk(root):
+            for file in files:
+                all_files.append(os.path.join(directory, file))
+        matches = [f for f in all_files if fnmatch.fnmatch(os.path.basename(f).lower(), pattern.lower())]
+    return len(sorted(matches))
+
+def legacy_search_candidates(root: str) -> int:
+    files = glob.glob(os.path.join(root, "**", "*"), recursive=True)
+    return len([f for f in files if os.path.isfile(f)])
+
+def legacy_list(directory: str, details: bool) -> int:
+    items = []
+    for item in os.listdir(directory):
+        path = os.path.join(directory, item)
+        if details:
+            stat_info = os.stat(path)
+            is_dir = os.path.isdir(path)
+            items.append((item, stat_info.st_size if not is_dir else 0, stat_info.st_mtime))
+        else:
+            items.append(item + ("/" if os.path.isdir(path) else ""))
+    return len(sorted(items))
+
+# ---------------------------------------------------------------------------
+# The walker
+# ---------------------------------------------------------------------------
+
+def walker_find(root: str, pattern: str, case_sensitive: bool) -> int:
+    return sum(1 for _ in walker.walk(root, pattern, include_dirs=True, case_sensitive=case_sensitive))
+
+def walker_search_candidates(root: str) -> int:
+    return sum(1 for _ in walker.walk(root, respect_ignore=True))
+
+def walker_list(directory: str, details: bool) -> int:
+    items = []
+    for entry in walker.walk(directory, recursive=False, include_dirs=True, include_other=True, follow_symlinks=True):
+        if details:
+            stat_info = entry.stat()
+            items.append((entry.name, stat_info.st_size if not entry.is_dir() else 0, stat_info.st_mtime))
+        else:
+            items.append(entry.name + ("/" if entry.is_dir() else ""))
+    return len(items)
+
+WORKLOADS = {
+    "find *.py": (legacy_find, walker_find, lambda root: (root, "*.py", True)),
+    "find *.PY (case-insensitive)": (legacy_find, walker_find, lambda root: (root, "*.PY", False)),
+    "search candidates": (legacy_search_candidates, walker_search_candidates, lambda root: (root,)),
+    "list 50k entries": (legacy_list, walker_list, lambda root: (os.path.join(root, "flat"), False)),
+    "list 50k entries, details": (legacy_list, walker_list, lambda root: (os.path.join(root, "flat"), True)),
+}
+
+def _count_os_calls() -> dict:
+    """Wrap the os functions the implementations reach, including through glob and os.path"""
+    counts = {}
+    for name in ("stat", "lstat", "scandir", "listdir"):
+        original = getattr(os, name)
+
+        def counted(*args, _original=original, _name=name, **kwargs):
+            counts[_name] = counts.get(_name, 0) + 1
+            return _original(*args, **kwargs)
+        setattr(os, name, counted)
+    return counts
+
+def run_child(workload: str, implementation: int, root: str, count: bool) -> None:
+    counts = _count_os_calls() if count else {}
+    func, args = WORKLOADS[workload][implementation], WORKLOADS[workload][2](root)
+    start = time.perf_counter()
+    found = func(*args)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"time": elapsed, "found": found, "calls": sum(counts.values())}))
+
+def _strace_total(path: str) -> int:
+    with open(path) as f:
+        for line in f:
+            if line.rstrip().endswith("total"):
+                return int(line.split()[2])
+    return 0
+
+def measure(workload: str, implementation: int, root: str, use_strace: bool) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--child", workload, str(implementation), root]
+    if use_strace:
+        with tempfile.NamedTemporaryFile(suffix=".strace") as trace:
+            output = subprocess.run(["strace", "-f", "-c", "-o", trace.name] + command,
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output)
+            result["calls"] = _strace_total(trace.name)
+            return result
+    output = subprocess.run(command + ["--count"], capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument("--count", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        workload, implementation, root = args.child
+        run_child(workload, int(implementation), root, args.count)
+        return
+
+    use_strace = shutil.which("strace") is not None
+    unit = "syscalls (strace)" if use_strace else "os calls"
+    with tempfile.TemporaryDirectory() as root:
+        generate_tree(root, args.entries)
+        print(f"tree: {args.entries} entries, counting {unit}")
+        for workload in WORKLOADS:
+            print(f"  {workload}:")
+            for implementation, label in ((0, "original"), (1, "walker")):
+                results = [measure(workload, implementation, root, use_strace) for _ in range(args.repeat)]
+                best = min(result["time"] for result in results)
+                print(f"    {label:9} {best:7.3f}s  {results[0]['calls']:>8} {unit}  {results[0]['found']} found")
+        if not use_strace:
+            print("  (os.DirEntry.stat is not counted without strace)")
+
+if __name__ == "__main__":
+    main()
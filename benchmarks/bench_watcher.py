@@ -0,0 +1,123 @@
+"""
+Finding what a command changed: re-walking the tree vs. the change journal of get_changes_since.
+
+Generates a tree of --dirs directories holding --files files each and starts watching it. A
+simulated build then modifies --changed files and writes a few new ones; the changes are found
+by a walk that stats every entry and compares with the previous walk (what re-running
+list_directory/find_files amounts to), by the polling backend and by the inotify journal.
+An event storm of --storm new files (an npm install) then shows the cost of watching while
+writing, and that the journal stays bounded. Finally, get_directory_sizes is repeated past its
+cache TTL with and without a watch. Linux only for the inotify rows.
+
+Usage:
+    python benchmarks/bench_watcher.py [--dirs 2000] [--files 20] [--changed 50] [--storm 50000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from terminal import directory_sizes, watcher
+
+def _build_tree(root: str, dirs: int, files: int) -> None:
+    for index in range(dirs):
+        directory = os.path.join(root, f"group{index % 20}", f"dir{index}")
+        os.makedirs(directory)
+        for number in range(files):
+            with open(os.path.join(directory, f"file{number}.txt"), "w") as f:
+                f.write("x" * number)
+
+def _stat_walk(root: str) -> dict[str, tuple[int, int]]:
+    state = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            info = os.lstat(path)
+            state[path] = (info.st_mtime_ns, info.st_size)
+    return state
+
+def _diff(before: dict, after: dict) -> int:
+    return sum(1 for path, state in after.items() if before.get(path) != state) + sum(1 for path in before if path not in after)
+
+def _build_step(root: str, dirs: int, changed: int, round_number: int) -> None:
+    for index in range(changed):
+        directory = index * 7 % dirs
+        with open(os.path.join(root, f"group{directory % 20}", f"dir{directory}", "file0.txt"), "a") as f:
+            f.write(f"build {round_number}\n")
+    os.makedirs(os.path.join(root, "out", f"round{round_number}"))
+    for index in range(5):
+        with open(os.path.join(root, "out", f"round{round_number}", f"artifact{index}.o"), "wb") as f:
+            f.write(b"\0" * 1024)
+
+def _row(label: str, seconds: float, found: int | str) -> None:
+    print(f"  {label:46} {seconds * 1000:9.1f}ms  {found} changes")
+
+def _storm(root: str, count: int) -> float:
+    directory = os.path.join(root, "node_modules")
+    start = time.perf_counter()
+    for index in range(count):
+        package = os.path.join(directory, f"pkg{index // 50}")
+        if index % 50 == 0:
+            os.makedirs(package)
+        with open(os.path.join(package, f"file{index % 50}.js"), "w") as f:
+            f.write("module.exports = {}\n")
+    return time.perf_counter() - start
+
+def main(dirs: int, files: int, changed: int, storm: int) -> None:
+    base = tempfile.mkdtemp(prefix="mcp-terminal-watch-")
+    root = os.path.join(base, "watched")
+    try:
+        _build_tree(root, dirs, files)
+        print(f"{dirs} directories, {dirs * files} files, {changed} modified and 5 created per build step")
+        started = time.perf_counter()
+        cursor = watcher.changes_since(root).next_cursor
+        print(f"  {'start watching (' + watcher.watch(root).backend + ')':46} {(time.perf_counter() - started) * 1000:9.1f}ms")
+        before = _stat_walk(root)
+        polled = watcher.watched_root(root)
+        watcher._poll(polled)
+
+        _build_step(root, dirs, changed, 0)
+        start = time.perf_counter()
+        after = _stat_walk(root)
+        _row("walk + stat + compare with the last walk", time.perf_counter() - start, _diff(before, after))
+        start = time.perf_counter()
+        watcher._poll(polled)
+        _row("polling backend scan", time.perf_counter() - start, len(polled.journal.since(0, 1 << 30)[0]))
+        start = time.perf_counter()
+        result = watcher.changes_since(root, cursor)
+        _row(f"get_changes_since ({result.backend})", time.perf_counter() - start, len(result.changes))
+        cursor = result.next_cursor
+
+        print(f"{storm} files written in {storm // 50} new directories")
+        plain = _storm(os.path.join(base, "unwatched"), storm)
+        print(f"  {'unwatched':46} {plain * 1000:9.1f}ms")
+        watched = _storm(root, storm)
+        print(f"  {'watched':46} {watched * 1000:9.1f}ms  x{watched / plain:.2f}")
+        result = watcher.changes_since(root, cursor)
+        journal = watcher.watch(root).journal
+        print(f"  journal: {len(journal.entries)} entries (limit {journal.max_entries}), {len(result.changes)} changes"
+              f" returned: {', '.join(f'{change.kind} {change.path}' for change in result.changes[:3])}")
+
+        print("get_directory_sizes repeated past the size cache TTL")
+        directory_sizes.size_cache_ttl = 0
+        unwatched = os.path.join(base, "sizes")
+        _build_tree(unwatched, dirs, files)
+        for label, target in (("unwatched", unwatched), ("watched", root)):
+            directory_sizes.analyze(target)
+            start = time.perf_counter()
+            result = directory_sizes.analyze(target)
+            print(f"  {label:46} {(time.perf_counter() - start) * 1000:9.1f}ms  {result.walked_directories} directories listed again")
+    finally:
+        watcher.shutdown()
+        directory_sizes.shutdown()
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirs", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--changed", type=int, default=50)
+    parser.add_argument("--storm", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.dirs, args.files, args.changed, args.storm)
@@ -0,0 +1,13 @@
+"""
+Reproducible benchmark suite covering every tool of the server.
+
+Generates a synthetic fixture (wide and deep directory trees, a source tree, large text and
+binary files), runs each tool's workloads in-process and through a stdio MCP client, and
+writes the timings as JSON. Two result files can be compared to catch regressions.
+
+Usage (from the repository root, with the package importable):
+    python -m benchmarks.suite list
+    python -m benchmarks.suite run [--scale small] [--modes in-process stdio] [--filter read_file]
+                                   [--repeat-factor 1.0] [--output results.json]
+    python -m benchmarks.suite compare baseline.json candidate.json [--metric median] [--threshold 0.10]
+"""
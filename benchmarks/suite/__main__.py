@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import datetime
+import importlib.metadata
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from . import __doc__ as _usage
+from .runner import MODES, RESULTS_VERSION, compare, run_mode
+from .workloads import SCALES, WORKLOADS, build_fixture
+
+def _git_commit() -> str | None:
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+def _metadata(scale: str) -> dict:
+    try:
+        mcp_version = importlib.metadata.version("mcp")
+    except importlib.metadata.PackageNotFoundError:
+        mcp_version = None
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "scale": scale,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mcp": mcp_version,
+        # Server settings change what is measured (persistent shell, limits, telemetry)
+        "settings": {name: value for name, value in sorted(os.environ.items()) if name.startswith("MCP_TERMINAL_")},
+    }
+
+def _print_progress(mode: str, name: str, stats: dict) -> None:
+    failures = f"  {stats['failures']} failed" if stats["failures"] else ""
+    print(f"  {mode:10} {name:36} median {stats['median'] * 1000:9.3f}ms  p95 {stats['p95'] * 1000:9.3f}ms{failures}", flush=True)
+
+async def _run(args: argparse.Namespace) -> dict:
+    workloads = [item for item in WORKLOADS if not args.filter or any(text in item.name for text in args.filter)]
+    root = tempfile.mkdtemp(prefix="mcp-terminal-bench-")
+    try:
+        print(f"Generating the {args.scale} fixture in {root}", flush=True)
+        fx = build_fixture(root, SCALES[args.scale], seed=args.seed)
+        results = {}
+        for mode in args.modes:
+            results[mode] = await run_mode(mode, fx, workloads, args.repeat_factor, _print_progress)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {"version": RESULTS_VERSION, "meta": _metadata(args.scale), "results": results}
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)
+    if results.get("version") != RESULTS_VERSION:
+        raise SystemExit(f"{path}: unsupported results version {results.get('version')}")
+    return results
+
+def _compare(args: argparse.Namespace) -> int:
+    baseline, candidate = _load(args.baseline), _load(args.candidate)
+    rows = compare(baseline, candidate, args.metric, args.threshold)
+    print(f"{args.metric} of {args.candidate} against {args.baseline}")
+    for row in rows:
+        marker = {"regression": "  SLOWER", "improvement": "  faster"}.get(row["status"], "")
+        print(f"  {row['mode']:10} {row['workload']:36} {row['before'] * 1000:9.3f}ms -> {row['after'] * 1000:9.3f}ms"
+              f"  x{row['ratio']:.2f}{marker}")
+    regressions = sum(row["status"] == "regression" for row in rows)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=_usage,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the workloads and the tools they cover")
+
+    run = commands.add_parser("run", help="Run the workloads and write the results as JSON")
+    run.add_argument("--scale", choices=sorted(SCALES), default="small")
+    run.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    run.add_argument("--filter", nargs="*", help="Only run workloads whose name contains one of these")
+    run.add_argument("--repeat-factor", type=float, default=1.0, help="Scales the timed iterations of every workload")
+    run.add_argument("--seed", type=int, default=0, help="Seed of the generated fixture")
+    run.add_argument("--output", default=None, help="Results file (default: print to stdout)")
+
+    diff = commands.add_parser("compare", help="Compare two results files, exit status 1 on regressions")
+    diff.add_argument("baseline")
+    diff.add_argument("candidate")
+    diff.add_argument("--metric", choices=("median", "min", "p95", "mean"), default="median")
+    diff.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for item in WORKLOADS:
+            print(f"{item.name:36} {', '.join(item.tools)}")
+        from terminal.server import mcp
+        covered = {tool for item in WORKLOADS for tool in item.tools}
+        missing = sorted(tool.name for tool in asyncio.run(mcp.list_tools()) if tool.name not in covered)
+        print(f"Tools without a workload: {', '.join(missing) if missing else 'none'}")
+        return 0
+    if args.command == "compare":
+        return _compare(args)
+
+    # The server logs every request
+    logging.disable(logging.INFO)
+    results = asyncio.run(_run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Runs workloads against the server in-process or through a stdio MCP client, and compares results.
+"""
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+from mcp import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+
+from .workloads import fixture, workload
+
+MODES = ("in-process", "stdio")
+RESULTS_VERSION = 1
+
+class tool_call_failed(Exception):
+    pass
+
+def _structured(result) -> dict:
+    """Structured content of what FastMCP.call_tool returned, whatever its shape in this mcp version"""
+    if isinstance(result, tuple):
+        return result[1] or {}
+    for content in result:
+        text = getattr(content, "text", None)
+        if text is not None:
+            try:
+                return json.loads(text)
+            except ValueError:
+                return {"result": text}
+    return {}
+
+@contextlib.asynccontextmanager
+async def in_process_client(fx: fixture):
+    """Calls the tools of the server imported into this process, skipping JSON-RPC and transport"""
+    from terminal.server import mcp
+
+    async def call(tool: str, arguments: dict) -> dict:
+        return _structured(await mcp.call_tool(tool, arguments))
+
+    await call("set_working_directory", {"path": fx.root})
+    yield call
+
+@contextlib.asynccontextmanager
+async def stdio_client_session(fx: fixture):
+    """Calls the tools of a `python -m terminal` child process through a real MCP client over stdio"""
+    server = StdioServerParameters(command=sys.executable, args=["-m", "terminal"], cwd=fx.root, env=dict(os.environ))
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(server, errlog=errlog) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+
+                async def call(tool: str, arguments: dict) -> dict:
+                    result = await session.call_tool(tool, arguments)
+                    if result.isError:
+                        raise tool_call_failed(f"{tool}: {result.content}")
+                    return result.structuredContent or {}
+
+                yield call
+
+CLIENTS = {"in-process": in_process_client, "stdio": stdio_client_session}
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "samples": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "mean": statistics.fmean(ordered),
+    }
+
+async def run_mode(mode: str, fx: fixture, workloads: list[workload], repeat_factor: float = 1.0,
+                   progress=None) -> dict[str, dict]:
+    """
+    Runs every workload once untimed, then repeat times timed, through the client of mode.
+
+    Returns:
+        dict[str, dict]: Per workload, the tools it calls, timing statistics in seconds and the
+            number of calls that returned success=false.
+    """
+    _reset_scratch(fx)
+    results = {}
+    async with CLIENTS[mode](fx) as call:
+        for item in workloads:
+            failures = 0
+
+            async def checked_call(tool: str, arguments: dict) -> dict:
+                nonlocal failures
+                result = await call(tool, arguments)
+                if result.get("success") is False and tool not in item.expected_failures:
+                    failures += 1
+                return result
+
+            repeat = max(1, round(item.repeat * repeat_factor))
+            samples = []
+            for iteration in range(-1, repeat):
+                if item.prepare is not None:
+                    item.prepare(fx, iteration)
+                start = time.perf_counter()
+                await item.run(checked_call, fx, iteration)
+                if iteration >= 0:
+                    samples.append(time.perf_counter() - start)
+            results[item.name] = {"tools": list(item.tools), **summarize(samples), "failures": failures}
+            if progress is not None:
+                progress(mode, item.name, results[item.name])
+    return results
+
+def _reset_scratch(fx: fixture) -> None:
+    # Workloads that write expect their paths to be free
+    shutil.rmtree(fx.path("scratch"), ignore_errors=True)
+    os.makedirs(fx.path("scratch"))
+
+def compare(baseline: dict, candidate: dict, metric: str = "median", threshold: float = 0.10,
+            min_delta: float = 0.0001) -> list[dict]:
+    """
+    Matches the workloads of two result files.
+
+    Args:
+        baseline (dict): Results of the reference run.
+        candidate (dict): Results of the run under test.
+        metric (str): Statistic compared, "median", "min", "p95" or "mean".
+        threshold (float): Relative slowdown above which a workload counts as a regression.
+        min_delta (float): Differences below this many seconds are noise, whatever the ratio.
+
+    Returns:
+        list[dict]: One row per workload present in both runs, with status "regression",
+            "improvement" or "unchanged".
+    """
+    rows = []
+    for mode, workloads in candidate["results"].items():
+        for name, stats in workloads.items():
+            reference = baseline["results"].get(mode, {}).get(name)
+            if reference is None:
+                continue
+            before, after = reference[metric], stats[metric]
+            ratio = after / before if before > 0 else float("inf")
+            status = "unchanged"
+            if abs(after - before) >= min_delta:
+                if ratio > 1 + threshold:
+                    status = "regression"
+                elif ratio < 1 / (1 + threshold):
+                    status = "improvement"
+            rows.append({"mode": mode, "workload": name, "before": before, "after": after, "ratio": ratio, "status": status})
+    return rows
@@ -0,0 +1,294 @@
+"""
+Synthetic fixtures and the workloads run against them.
+
+A workload is an async function receiving call(tool, arguments), the fixture and the
+iteration number; everything it awaits is timed. Workloads that need something on disk
+first (a file to delete, a directory to move) get an untimed prepare step.
+"""
+import asyncio
+import os
+import random
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+# Sizes of the generated fixture and of the command output workloads
+SCALES = {
+    "small": {"wide_files": 2000, "deep_depth": 40, "tree_files": 1000, "tree_lines": 60,
+              "large_mb": 16, "binary_mb": 8, "output_mb": 8, "graph_nodes": 16},
+    "medium": {"wide_files": 10000, "deep_depth": 120, "tree_files": 5000, "tree_lines": 100,
+               "large_mb": 64, "binary_mb": 32, "output_mb": 32, "graph_nodes": 64},
+}
+
+_WORDS = ["alpha", "beta", "gamma", "delta", "return", "import", "value", "result", "config", "handler"]
+
+@dataclass
+class fixture:
+    root: str
+    scale: dict
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+def build_fixture(root: str, scale: dict, seed: int = 0) -> fixture:
+    """
+    Generates the fixture under root, deterministically for a given seed:
+    wide/ holds many files in one directory, deep/ a long chain of nested directories,
+    tree/ source-like text files with a few binaries, plus one large text file, one
+    binary file and an empty scratch/ directory for the workloads that write.
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "wide"))
+    for index in range(scale["wide_files"]):
+        with open(os.path.join(root, "wide", f"entry{index:05d}.txt"), "w") as f:
+            f.write(f"entry {index}\n")
+
+    directory = os.path.join(root, "deep")
+    for depth in range(scale["deep_depth"]):
+        directory = os.path.join(directory, f"level{depth}")
+        os.makedirs(directory)
+        with open(os.path.join(directory, "marker.txt"), "w") as f:
+            f.write(f"depth {depth}\n")
+
+    for index in range(scale["tree_files"]):
+        directory = os.path.join(root, "tree", f"pkg{index // 200}", f"mod{index // 20}")
+        os.makedirs(directory, exist_ok=True)
+        lines = []
+        for _ in range(scale["tree_lines"]):
+            words = rng.choices(_WORDS, k=8)
+            if rng.random() < 0.002:
+                words.append("needle_token")
+            lines.append(" ".join(words))
+        with open(os.path.join(directory, f"file{index}.py"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        if index % 250 == 0:
+            with open(os.path.join(directory, f"blob{index}.bin"), "wb") as f:
+                f.write(rng.randbytes(64 * 1024))
+
+    line = b"0123456789 abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ\n"
+    with open(os.path.join(root, "large.txt"), "wb") as f:
+        block = line * (1024 * 1024 // len(line))
+        for _ in range(scale["large_mb"]):
+            f.write(block)
+    with open(os.path.join(root, "binary.bin"), "wb") as f:
+        for _ in range(scale["binary_mb"]):
+            f.write(rng.randbytes(1024 * 1024))
+    os.makedirs(os.path.join(root, "scratch"))
+    return fixture(root, scale)
+
+call_tool = Callable[[str, dict], Awaitable[dict]]
+
+@dataclass
+class workload:
+    name: str
+    tools: tuple[str, ...]
+    run: Callable[[call_tool, fixture, int], Awaitable[None]]
+    repeat: int
+    prepare: Callable[[fixture, int], None] | None = None
+    # Tools whose success=false results are part of the workload (a job killed by a signal)
+    expected_failures: tuple[str, ...] = ()
+
+WORKLOADS: list[workload] = []
+
+def register(name: str, *tools: str, repeat: int = 20, prepare: Callable[[fixture, int], None] | None = None,
+             expected_failures: tuple[str, ...] = ()):
+    def decorator(run):
+        WORKLOADS.append(workload(name, tools or (name.split("/")[0],), run, repeat, prepare, expected_failures))
+        return run
+    return decorator
+
+# Commands
+
+@register("run_command/tiny", repeat=100)
+async def _tiny_command(call, fx, i):
+    await call("run_command", {"command": "true"})
+
+@register("run_command/high_output", repeat=5)
+async def _high_output(call, fx, i):
+    await call("run_command", {"command": f"head -c {fx.scale['output_mb']}M {fx.path('large.txt')}"})
+
+@register("run_command/streamed_output", repeat=5)
+async def _streamed_output(call, fx, i):
+    await call("run_command", {"command": f"head -c {fx.scale['output_mb']}M {fx.path('large.txt')}", "stream_output": True})
+
+@register("run_commands/graph", repeat=10)
+async def _graph(call, fx, i):
+    # Chains of four commands, the chains running side by side
+    nodes = [{"id": f"n{index}", "command": "true", "depends_on": [f"n{index - 1}"] if index % 4 else []}
+             for index in range(fx.scale["graph_nodes"])]
+    await call("run_commands", {"commands": nodes})
+
+@register("working_directory/set_get", "set_working_directory", "get_working_directory", repeat=100)
+async def _working_directory(call, fx, i):
+    await call("set_working_directory", {"path": fx.root})
+    await call("get_working_directory", {})
+
+@register("background_job/lifecycle", "start_background_job", "wait_for_job", "get_job_output",
+          "list_background_jobs", "signal_job", repeat=10, expected_failures=("wait_for_job",))
+async def _job_lifecycle(call, fx, i):
+    job = await call("start_background_job", {"command": "echo started; sleep 30"})
+    while not (await call("get_job_output", {"job_id": job["job_id"]}))["stdout"]:
+        await asyncio.sleep(0.001)
+    await call("list_background_jobs", {})
+    await call("signal_job", {"job_id": job["job_id"], "signal_name": "SIGTERM"})
+    await call("wait_for_job", {"job_id": job["job_id"], "timeout": 10})
+
+@register("restart_shell_session", repeat=20)
+async def _restart_shell(call, fx, i):
+    await call("restart_shell_session", {})
+
+# Files
+
+@register("create_directory", repeat=50)
+async def _create_directory(call, fx, i):
+    await call("create_directory", {"directory_path": fx.path("scratch", "dirs", f"d{i}", "nested")})
+
+@register("create_file/small", "create_file", repeat=50)
+async def _create_file(call, fx, i):
+    await call("create_file", {"file_path": fx.path("scratch", f"small{i}.txt"), "content": "hello\n" * 10})
+
+@register("create_file/1mb", "create_file", repeat=10)
+async def _create_large_file(call, fx, i):
+    await call("create_file", {"file_path": fx.path("scratch", f"large{i}.txt"), "content": "x" * (1024 * 1024)})
+
+def _make_source_file(fx: fixture, i: int) -> None:
+    with open(fx.path("scratch", f"edited{i}.py"), "w") as f:
+        f.writelines(f"value_{line} = compute({line})\n" for line in range(5000))
+
+@register("edit_file/search_replace", "edit_file", repeat=20, prepare=_make_source_file)
+async def _edit_search_replace(call, fx, i):
+    await call("edit_file", {"file_path": fx.path("scratch", f"edited{i}.py"),
+                             "edits": [{"old_text": "value_2500 = compute(2500)", "new_text": "value_2500 = compute(-1)"}]})
+
+@register("edit_file/diff", "edit_file", repeat=20, prepare=_make_source_file)
+async def _edit_diff(call, fx, i):
+    await call("edit_file", {"file_path": fx.path("scratch", f"edited{i}.py"),
+                             "diff": "@@ -2500,3 +2500,3 @@\n value_2499 = compute(2499)\n-value_2500 = compute(2500)\n"
+                                     "+value_2500 = compute(-1)\n value_2501 = compute(2501)\n"})
+
+@register("append_to_file", repeat=100)
+async def _append(call, fx, i):
+    await call("append_to_file", {"file_path": fx.path("scratch", "appended.txt"), "content": f"line {i}"})
+
+@register("read_file/head", "read_file", repeat=50)
+async def _read_head(call, fx, i):
+    await call("read_file", {"file_path": fx.path("large.txt"), "head": 100})
+
+@register("read_file/tail", "read_file", repeat=50)
+async def _read_tail(call, fx, i):
+    await call("read_file", {"file_path": fx.path("large.txt"), "tail": 100})
+
+@register("read_file/line_range", "read_file", repeat=20)
+async def _read_range(call, fx, i):
+    await call("read_file", {"file_path": fx.path("large.txt"), "start_line": 50000 + i, "end_line": 50100 + i})
+
+@register("copy_file/binary", "copy_file", repeat=5)
+async def _copy_binary(call, fx, i):
+    await call("copy_file", {"source_path": fx.path("binary.bin"), "destination_path": fx.path("scratch", f"binary{i}.bin")})
+
+def _make_file(fx: fixture, i: int) -> None:
+    with open(fx.path("scratch", f"victim{i}.txt"), "w") as f:
+        f.write("delete me\n")
+
+@register("delete_file", repeat=50, prepare=_make_file)
+async def _delete_file(call, fx, i):
+    await call("delete_file", {"file_path": fx.path("scratch", f"victim{i}.txt")})
+
+@register("copy_file/large", "copy_file", repeat=5)
+async def _copy_file(call, fx, i):
+    await call("copy_file", {"source_path": fx.path("large.txt"), "destination_path": fx.path("scratch", f"copy{i}.txt")})
+
+@register("get_file_info", repeat=100)
+async def _file_info(call, fx, i):
+    await call("get_file_info", {"file_path": fx.path("large.txt")})
+
+@register("batch_file_operations/scaffold", "batch_file_operations", repeat=10)
+async def _batch(call, fx, i):
+    base = f"scratch/batch{i}"
+    operations = [{"op": "create_directory", "path": base}]
+    operations += [{"op": "create_file", "path": f"{base}/f{index}.txt", "content": "x\n"} for index in range(50)]
+    await call("batch_file_operations", {"operations": operations, "atomic": True})
+
+# Directories
+
+@register("list_directory/wide", "list_directory", repeat=10)
+async def _list_wide(call, fx, i):
+    await call("list_directory", {"path": fx.path("wide"), "limit": 100000})
+
+@register("list_directory/details", "list_directory", repeat=10)
+async def _list_details(call, fx, i):
+    await call("list_directory", {"path": fx.path("wide"), "show_details": True, "limit": 1000})
+
+@register("copy_directory+delete_directory", "copy_directory", "delete_directory", repeat=3)
+async def _copy_delete_directory(call, fx, i):
+    destination = fx.path("scratch", f"tree_copy{i}")
+    await call("copy_directory", {"source_path": fx.path("tree"), "destination_path": destination})
+    await call("delete_directory", {"directory_path": destination, "recursive": True})
+
+def _make_directory(fx: fixture, i: int) -> None:
+    os.makedirs(fx.path("scratch", f"movable{i}", "inner"))
+
+@register("move_file_or_directory", repeat=50, prepare=_make_directory)
+async def _move(call, fx, i):
+    await call("move_file_or_directory", {"source_path": fx.path("scratch", f"movable{i}"),
+                                          "destination_path": fx.path("scratch", f"moved{i}")})
+
+@register("get_disk_usage", repeat=20)
+async def _disk_usage(call, fx, i):
+    await call("get_disk_usage", {"path": fx.root})
+
+@register("get_directory_sizes", repeat=10)
+async def _directory_sizes(call, fx, i):
+    # Every other call bypasses the per-directory cache, the others only re-stat the tree
+    await call("get_directory_sizes", {"path": fx.root, "use_cache": i % 2 == 1})
+
+@register("hash_files", repeat=10)
+async def _hash_files(call, fx, i):
+    await call("hash_files", {"path": fx.path("tree"), "use_cache": i % 2 == 1})
+
+@register("hash_files/duplicates", "hash_files", repeat=5)
+async def _find_duplicates(call, fx, i):
+    await call("hash_files", {"path": fx.path("tree"), "find_duplicates": True, "use_cache": False})
+
+@register("get_changes_since", repeat=20)
+async def _changes_since(call, fx, i):
+    started = await call("get_changes_since", {"path": fx.path("scratch")})
+    with open(fx.path("scratch", f"changed{i}.txt"), "w") as f:
+        f.write("changed\n")
+    await call("get_changes_since", {"cursor": started["next_cursor"], "path": fx.path("scratch")})
+
+# Search
+
+@register("find_files/wide", "find_files", repeat=10)
+async def _find_wide(call, fx, i):
+    await call("find_files", {"pattern": "entry1*.txt", "search_path": fx.path("wide"), "limit": 100000})
+
+@register("find_files/deep", "find_files", repeat=10)
+async def _find_deep(call, fx, i):
+    await call("find_files", {"pattern": "marker.txt", "search_path": fx.path("deep"), "limit": 100000})
+
+@register("search_in_files/literal", "search_in_files", repeat=5)
+async def _search_literal(call, fx, i):
+    await call("search_in_files", {"search_text": "needle_token", "search_path": fx.path("tree")})
+
+@register("search_in_files/regex", "search_in_files", repeat=5)
+async def _search_regex(call, fx, i):
+    await call("search_in_files", {"search_text": r"gamma \w+ needle", "search_path": fx.path("tree"), "use_regex": True})
+
+@register("build_search_index", repeat=3)
+async def _build_index(call, fx, i):
+    await call("build_search_index", {"path": fx.path("tree")})
+
+# System
+
+@register("get_system_info", repeat=50)
+async def _system_info(call, fx, i):
+    await call("get_system_info", {})
+
+@register("environment/set_get", "set_environment_variable", "get_environment_variables", repeat=50)
+async def _environment(call, fx, i):
+    await call("set_environment_variable", {"name": "MCP_TERMINAL_BENCH", "value": str(i)})
+    await call("get_environment_variables", {"filter_pattern": "MCP_TERMINAL_BENCH"})
+
+@register("get_server_stats", repeat=50)
+async def _server_stats(call, fx, i):
+    await call("get_server_stats", {})
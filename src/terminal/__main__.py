@@ -1,7 +1,172 @@
-from .server import mcp
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import signal
+import subprocess
+import sys
+import time
+
+TRANSPORTS = ("stdio", "streamable-http", "sse")
+_LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="mcp-terminal", description="Terminal MCP server")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="stdio",
+                        help="stdio serves one client; streamable-http and sse serve many clients from one process (default: stdio)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--max-connections", type=int, default=None,
+                        help="Concurrent connections accepted before answering 503 (default: unlimited)")
+    parser.add_argument("--keep-alive", type=float, default=5,
+                        help="Seconds an idle HTTP connection is kept open (default: 5)")
+    parser.add_argument("--shutdown-timeout", type=float, default=10,
+                        help="Seconds to let running requests finish after SIGINT/SIGTERM (default: 10)")
+    parser.add_argument("--stateless", action="store_true",
+                        help="streamable-http: no session per client, every request stands alone")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="Commands running at the same time, across all clients (default: MCP_TERMINAL_MAX_CONCURRENCY)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker threads for file-system tools (default: MCP_TERMINAL_MAX_WORKERS)")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"))
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print where the start-up time goes (imports per package, slowest modules, tools/list) and exit")
+    return parser.parse_args(argv)
+
+def _http_server(config):
+    import uvicorn
+
+    class http_server(uvicorn.Server):
+        @contextlib.contextmanager
+        def capture_signals(self):
+            # uvicorn re-raises the signal once it stopped, which would exit before resources are released
+            yield
+
+    return http_server(config)
+
+async def serve_http(args: argparse.Namespace) -> None:
+    """
+    Serves every client from this process over streamable HTTP or SSE.
+    SIGINT/SIGTERM stop accepting connections, running requests get shutdown-timeout
+    seconds to finish, then commands, jobs and worker pools are torn down.
+    """
+    import uvicorn
+    from . import jobs
+    from .server import mcp
+
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.settings.log_level = args.log_level
+    # FastMCP configured logging when the server module was imported
+    logging.getLogger().setLevel(args.log_level)
+    mcp.settings.stateless_http = args.stateless
+    # Every request is a session of its own, a job could not be reached after the call that started it
+    jobs.shared = args.stateless
+    if args.host not in _LOCAL_HOSTS:
+        # DNS rebinding protection only allows localhost, FastMCP turns it off for other hosts too
+        mcp.settings.transport_security = None
+    app = mcp.streamable_http_app() if args.transport == "streamable-http" else mcp.sse_app()
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        log_level=args.log_level.lower(),
+        limit_concurrency=args.max_connections,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.shutdown_timeout,
+    )
+    server = _http_server(config)
+    loop = asyncio.get_running_loop()
+
+    def stop() -> None:
+        # A second signal skips waiting for running requests
+        if server.should_exit:
+            server.force_exit = True
+        server.should_exit = True
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except (NotImplementedError, RuntimeError):
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop))
+    try:
+        await server.serve()
+    finally:
+        await release_resources()
+
+async def release_resources() -> None:
+    """
+    Stops what outlives a request: shell sessions, background jobs, file watchers and worker
+    pools, then flushes and closes the files kept open for appending and writes out telemetry
+    """
+    from . import concurrency, directory_copy, directory_sizes, file_hashes, file_writer, jobs, search, shell_session, telemetry, watcher
+    for session in shell_session.iter_shell_sessions():
+        await session.close()
+    jobs.kill_running_jobs()
+    search.shutdown()
+    watcher.shutdown()
+    directory_sizes.shutdown()
+    directory_copy.shutdown()
+    file_hashes.shutdown()
+    concurrency.shutdown()
+    file_writer.shutdown()
+    telemetry.flush()
+
+# Run in a child started with -X importtime, so the measurement starts from a cold interpreter
+_PROFILE_CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+from {package}.server import mcp
+imported = time.perf_counter()
+asyncio.run(mcp.list_tools())
+listed = time.perf_counter()
+print(json.dumps({{"import": imported - start, "list_tools": listed - imported, "from_cache": mcp.tools_from_cache}}))
+"""
+
+def profile_startup(top: int = 20) -> None:
+    """Prints the import time per top-level package, the slowest modules and the tools/list time"""
+    start = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROFILE_CHILD.format(package=__package__)],
+                           capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if child.returncode != 0:
+        raise SystemExit(child.stderr)
+    phases = json.loads(child.stdout.strip().splitlines()[-1])
+    packages: dict[str, int] = {}
+    modules = []
+    for line in child.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        own, cumulative, name = int(fields[0]), int(fields[1]), fields[2].strip()
+        packages[name.split(".")[0]] = packages.get(name.split(".")[0], 0) + own
+        modules.append((cumulative, own, name))
+
+    print(f"Start-up of a server process: {total * 1000:.0f} ms until tools/list was answered")
+    print(f"  importing the server   {phases['import'] * 1000:8.1f} ms")
+    source = "schema cache" if phases["from_cache"] else "tools built, schema cache written"
+    print(f"  tools/list             {phases['list_tools'] * 1000:8.1f} ms ({source})")
+    print("Import time per package (own time of its modules):")
+    for name, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {name:28} {own / 1000:8.1f} ms")
+    print("Slowest imports (including what they import):")
+    for cumulative, own, name in sorted(modules, reverse=True)[:top]:
+        print(f"  {name:48} {cumulative / 1000:8.1f} ms  (own {own / 1000:.1f} ms)")
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+    if args.profile_startup:
+        profile_startup()
+        return
+    from . import concurrency
+    concurrency.configure(args.max_concurrency, args.workers)
+    if args.transport == "stdio":
+        from .server import mcp
+        mcp.run(transport="stdio")
+    else:
+        asyncio.run(serve_http(args))
 
-def main():
-    mcp.run(transport="stdio")
-    
 if __name__ == "__main__":
     main()
@@ -0,0 +1,352 @@
+import asyncio
+import errno
+import os
+import shutil
+import threading
+import uuid
+from typing import Callable, Literal
+from pydantic import BaseModel, Field, model_serializer
+from .terminal import command_result
+from .concurrency import run_blocking
+from . import directory_copy
+
+# Operations accepted in one batch
+MAX_BATCH_OPERATIONS = 1000
+
+operation_name = Literal["create_file", "append_to_file", "create_directory", "copy_file", "delete_file",
+                         "copy_directory", "delete_directory", "move_file_or_directory"]
+
+SKIPPED = "Skipped, an earlier operation failed."
+
+# Operations whose destination is a second path
+_TWO_PATH_OPERATIONS = ("copy_file", "copy_directory", "move_file_or_directory")
+
+class file_operation(BaseModel):
+    op: operation_name = Field(description="Name of the file tool to run")
+    path: str = Field(description="The file or directory the tool acts on, the source for copies and moves")
+    destination: str | None = Field(default=None, description="Destination of copy_file, copy_directory and move_file_or_directory")
+    content: str = Field(default="", description="Content of create_file and append_to_file")
+    add_newline: bool = Field(default=True, description="append_to_file: add a newline before the content")
+    recursive: bool = Field(default=False, description="delete_directory: delete the contents too")
+
+class operation_result(BaseModel):
+    index: int = Field(description="Position of the operation in the batch")
+    success: bool = Field(description="Whether the operation was applied")
+    error: str | None = Field(default=None, description="Why the operation failed, was skipped or was rolled back")
+
+    @model_serializer(mode="wrap")
+    def _drop_unset(self, handler):
+        data = handler(self)
+        return {key: value for key, value in data.items() if value is not None}
+
+class batch_result(command_result):
+    results: list[operation_result] = Field(default_factory=list, description="Outcome of every operation, in batch order")
+
+def check_operations(operations: list[file_operation]) -> None:
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"A batch holds at most {MAX_BATCH_OPERATIONS} operations.")
+    for index, operation in enumerate(operations):
+        if operation.op in _TWO_PATH_OPERATIONS and not operation.destination:
+            raise ValueError(f"Operation {index} ({operation.op}) needs a destination.")
+
+# ---------------------------------------------------------------------------
+# Scheduling
+# ---------------------------------------------------------------------------
+
+def _touched_paths(operation: file_operation, cwd: str) -> list[str]:
+    paths = [operation.path]
+    if operation.op in _TWO_PATH_OPERATIONS:
+        paths.append(operation.destination)
+    return [os.path.normpath(os.path.join(cwd, path)) for path in paths]
+
+def _overlaps(first: str, second: str) -> bool:
+    """Whether the paths are the same or one is inside the other"""
+    if first == second:
+        return True
+    shorter, longer = sorted((first, second), key=len)
+    return longer.startswith(shorter.rstrip(os.sep) + os.sep)
+
+def plan_dependencies(operations: list[file_operation], cwd: str) -> list[list[int]]:
+    """
+    For every operation, the earlier operations it has to wait for: those touching the
+    same path, a directory containing it or a path inside it. The others run concurrently.
+    """
+    touched = [_touched_paths(operation, cwd) for operation in operations]
+    dependencies = []
+    for index, paths in enumerate(touched):
+        dependencies.append([earlier for earlier in range(index)
+                             if any(_overlaps(path, other) for path in paths for other in touched[earlier])])
+    return dependencies
+
+async def run_operations(operations: list[file_operation], cwd: str,
+                         execute: Callable[[file_operation], str | None], stop_on_error: bool = False) -> list[operation_result]:
+    """
+    Runs every operation on the worker pool as soon as the operations it depends on are done.
+
+    Args:
+        operations (list[file_operation]): The operations, in the order they were given.
+        cwd (str): Directory relative paths are resolved against.
+        execute (Callable): Blocking function applying one operation, returns an error message or None.
+        stop_on_error (bool): Skip the operations not started yet once one fails.
+
+    Returns:
+        list[operation_result]: The outcome of every operation, in the order they were given.
+    """
+    dependencies = plan_dependencies(operations, cwd)
+    tasks: list[asyncio.Task] = []
+    failed = False
+
+    async def run(index: int, operation: file_operation, waits_for: list[asyncio.Task]) -> operation_result:
+        nonlocal failed
+        if waits_for:
+            await asyncio.wait(waits_for)
+        if failed and stop_on_error:
+            return operation_result(index=index, success=False, error=SKIPPED)
+        error = await run_blocking(execute, operation)
+        if error is not None:
+            failed = True
+        return operation_result(index=index, success=error is None, error=error)
+
+    for index, operation in enumerate(operations):
+        tasks.append(asyncio.ensure_future(run(index, operation, [tasks[earlier] for earlier in dependencies[index]])))
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+# ---------------------------------------------------------------------------
+# Atomic batches
+# ---------------------------------------------------------------------------
+
+def _sibling(path: str, kind: str) -> str:
+    """Hidden name next to path, so renames between the two stay on one file system"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.mcp-{kind}-{uuid.uuid4().hex[:12]}")
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _existing_ancestor(path: str) -> str:
+    while not os.path.isdir(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+class file_transaction:
+    """
+    Applies file operations so that a batch can be undone as a whole.
+
+    New file contents are written to a temporary file and renamed over the target, so a
+    file is never seen half written. Whatever gets replaced or deleted is moved to a
+    staging directory until commit, and every step records how to undo it; rollback
+    replays those records backward. The staging directory sits in the closest directory
+    above every path of the batch, so no operation moves or copies it, and renames to and
+    from it stay on one file system (targets on another one get hidden sibling names).
+    """
+
+    def __init__(self, cwd: str, operations: list[file_operation] = ()):
+        self.cwd = cwd
+        self._undo: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._staging: str | None = None
+        self._staging_device: int | None = None
+        # Backups kept next to their target, removed on commit
+        self._sibling_backups: list[str] = []
+        parents = [os.path.dirname(path) for operation in operations for path in _touched_paths(operation, cwd)]
+        try:
+            self._staging_parent = _existing_ancestor(os.path.commonpath(parents)) if parents else None
+        except ValueError:
+            self._staging_parent = None  # Paths on different drives
+
+    def _staging_path(self, path: str, kind: str) -> str:
+        """Where to keep a temporary file or a backup of path"""
+        with self._lock:
+            if self._staging is None and self._staging_parent is not None:
+                staging = os.path.join(self._staging_parent, f".mcp-batch-{uuid.uuid4().hex[:12]}")
+                try:
+                    os.mkdir(staging)
+                    self._staging, self._staging_device = staging, os.stat(staging).st_dev
+                except OSError:
+                    self._staging_parent = None  # Not writable, use sibling names
+        try:
+            same_device = self._staging is not None and os.stat(_existing_ancestor(os.path.dirname(path))).st_dev == self._staging_device
+        except OSError:
+            same_device = False
+        if same_device:
+            return os.path.join(self._staging, f"{kind}-{uuid.uuid4().hex}")
+        sibling = _sibling(path, kind)
+        if kind == "backup":
+            with self._lock:
+                self._sibling_backups.append(sibling)
+        return sibling
+
+    def _record(self, undo: Callable[[], None]) -> None:
+        with self._lock:
+            self._undo.append(undo)
+
+    def _makedirs(self, directory: str) -> None:
+        """os.makedirs, recording the directories it created"""
+        missing = []
+        while directory and not os.path.isdir(directory):
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        for path in reversed(missing):
+            # Under the lock, so the removal is recorded before another operation can fill the directory
+            with self._lock:
+                try:
+                    os.mkdir(path)
+                except FileExistsError:
+                    if not os.path.isdir(path):
+                        raise
+                    continue  # Created concurrently by another operation, which undoes it
+                self._undo.append(lambda path=path: os.rmdir(path))
+
+    def _place(self, temporary: str, path: str) -> None:
+        """Moves a staged file over path, keeping what it replaces"""
+        if os.path.lexists(path):
+            if os.path.isdir(path) and not os.path.islink(path):
+                raise IsADirectoryError(f"'{path}' is a directory.")
+            backup = self._staging_path(path, "backup")
+            try:
+                # A hard link keeps the old file without a moment where path is missing
+                os.link(path, backup, follow_symlinks=False)
+            except OSError:
+                shutil.copy2(path, backup, follow_symlinks=False)
+            os.replace(temporary, path)
+            self._record(lambda: os.replace(backup, path))
+        else:
+            os.replace(temporary, path)
+            self._record(lambda: os.remove(path))
+
+    def _stage(self, path: str, write: Callable[[str], None]) -> None:
+        self._makedirs(os.path.dirname(path))
+        temporary = self._staging_path(path, "tmp")
+        try:
+            write(temporary)
+            self._place(temporary, path)
+        except BaseException:
+            _remove(temporary)
+            raise
+
+    def _set_aside(self, path: str) -> None:
+        """Deletes path by renaming it, so rollback can put it back"""
+        backup = self._staging_path(path, "backup")
+        os.rename(path, backup)
+        self._record(lambda: os.rename(backup, path))
+
+    def apply(self, operation: file_operation) -> str | None:
+        """Applies one operation, returns an error message or None"""
+        try:
+            getattr(self, "_" + operation.op)(operation, *_touched_paths(operation, self.cwd))
+            return None
+        except Exception as e:
+            return str(e)
+
+    def _create_file(self, operation: file_operation, path: str) -> None:
+        def write(temporary: str) -> None:
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(operation.content)
+        self._stage(path, write)
+
+    def _append_to_file(self, operation: file_operation, path: str) -> None:
+        def write(temporary: str) -> None:
+            if os.path.exists(path):
+                shutil.copy2(path, temporary)
+            with open(temporary, "a", encoding="utf-8") as f:
+                if operation.add_newline:
+                    f.write("\n")
+                f.write(operation.content)
+        self._stage(path, write)
+
+    def _create_directory(self, operation: file_operation, path: str) -> None:
+        self._makedirs(path)
+
+    def _copy_file(self, operation: file_operation, source: str, destination: str) -> None:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Source file '{source}' does not exist.")
+        if os.path.isdir(source):
+            raise IsADirectoryError(f"'{source}' is a directory. Use copy_directory for directories.")
+        self._stage(destination, lambda temporary: shutil.copy2(source, temporary))
+
+    def _delete_file(self, operation: file_operation, path: str) -> None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File '{path}' does not exist.")
+        if os.path.isdir(path):
+            raise IsADirectoryError(f"'{path}' is a directory. Use delete_directory for directories.")
+        self._set_aside(path)
+
+    def _copy_directory(self, operation: file_operation, source: str, destination: str) -> None:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Source directory '{source}' does not exist.")
+        if not os.path.isdir(source):
+            raise NotADirectoryError(f"'{source}' is not a directory.")
+        if os.path.exists(destination):
+            raise FileExistsError(f"Destination '{destination}' already exists.")
+        self._makedirs(os.path.dirname(destination))
+        temporary = self._staging_path(destination, "tmp")
+        try:
+            copy = directory_copy.copy_tree(source, temporary)
+            if copy.error_count:
+                raise OSError(f"{copy.error_count} entries could not be copied: {'; '.join(copy.errors)}")
+            os.rename(temporary, destination)
+        except BaseException:
+            _remove(temporary)
+            raise
+        self._record(lambda: shutil.rmtree(destination))
+
+    def _delete_directory(self, operation: file_operation, path: str) -> None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Directory '{path}' does not exist.")
+        if not os.path.isdir(path):
+            raise NotADirectoryError(f"'{path}' is not a directory.")
+        if not operation.recursive and any(os.scandir(path)):
+            raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY), path)
+        self._set_aside(path)
+
+    def _move_file_or_directory(self, operation: file_operation, source: str, destination: str) -> None:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Source '{source}' does not exist.")
+        # Like shutil.move, moving onto a directory moves into it
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        self._makedirs(os.path.dirname(destination))
+        if os.path.lexists(destination):
+            if os.path.isdir(destination) and not os.path.islink(destination):
+                raise FileExistsError(f"Destination '{destination}' already exists.")
+            self._set_aside(destination)
+        shutil.move(source, destination)
+        self._record(lambda: shutil.move(destination, source))
+
+    def _discard_staging(self) -> None:
+        if self._staging is not None:
+            shutil.rmtree(self._staging, ignore_errors=True)
+            self._staging = None
+
+    def commit(self) -> None:
+        """Drops what the batch replaced or deleted"""
+        self._undo.clear()
+        self._discard_staging()
+        for backup in self._sibling_backups:
+            _remove(backup)
+        self._sibling_backups.clear()
+
+    def rollback(self) -> list[str]:
+        """Undoes every applied step, newest first; returns the errors of steps that could not be undone"""
+        errors = []
+        for undo in reversed(self._undo):
+            try:
+                undo()
+            except OSError as e:
+                errors.append(str(e))
+        self._undo.clear()
+        self._sibling_backups.clear()
+        if not errors:
+            self._discard_staging()
+        return errors
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+from pydantic import BaseModel, Field
+from .terminal import run_result
+from .settings import env_int
+
+# Commands of one run_commands call running at the same time, unless the call asks otherwise
+default_workers = env_int("MCP_TERMINAL_GRAPH_WORKERS", os.cpu_count() or 1)
+# Nodes accepted in one graph
+MAX_GRAPH_NODES = 256
+FAILURE_POLICIES = ("fail_fast", "continue")
+
+class command_node(BaseModel):
+    id: str = Field(description="Unique name of the node, referenced by depends_on")
+    command: str = Field(description="The command to run")
+    depends_on: list[str] = Field(default_factory=list, description="Nodes that must succeed before this one starts")
+    timeout: float | None = Field(default=None, description="Seconds before the command is killed, 0 for no timeout (default: server setting)")
+
+class node_result(run_result):
+    id: str = Field(default="", description="The node this result belongs to")
+    status: str = Field(default="skipped", description="succeeded, failed, skipped (a dependency failed or fail_fast stopped the run) or cancelled")
+    started_at: float | None = Field(default=None, description="Seconds between the start of the run and the start of this node")
+
+class graph_result(run_result):
+    results: list[node_result] = Field(default_factory=list, description="One result per node, in the order the nodes were given")
+
+def check_graph(nodes: list[command_node], on_failure: str) -> None:
+    """Rejects duplicate ids, unknown dependencies and cycles"""
+    if on_failure not in FAILURE_POLICIES:
+        raise ValueError(f"on_failure must be one of: {', '.join(FAILURE_POLICIES)}.")
+    if len(nodes) > MAX_GRAPH_NODES:
+        raise ValueError(f"A graph holds at most {MAX_GRAPH_NODES} nodes.")
+    ids = set()
+    for node in nodes:
+        if node.id in ids:
+            raise ValueError(f"Node id '{node.id}' is used more than once.")
+        ids.add(node.id)
+    for node in nodes:
+        for dependency in node.depends_on:
+            if dependency not in ids:
+                raise ValueError(f"Node '{node.id}' depends on unknown node '{dependency}'.")
+    # Kahn's algorithm: whatever is never freed sits on a cycle
+    waiting = {node.id: len(set(node.depends_on)) for node in nodes}
+    dependents = {node.id: [] for node in nodes}
+    for node in nodes:
+        for dependency in set(node.depends_on):
+            dependents[dependency].append(node.id)
+    ready = [node_id for node_id, count in waiting.items() if count == 0]
+    while ready:
+        for dependent in dependents[ready.pop()]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                ready.append(dependent)
+    cycle = sorted(node_id for node_id, count in waiting.items() if count > 0)
+    if cycle:
+        raise ValueError(f"The dependencies form a cycle through: {', '.join(cycle)}.")
+
+async def run_graph(nodes: list[command_node], run: Callable[[command_node], Awaitable[run_result]],
+                    workers: int, cwd: str, on_failure: str = "fail_fast") -> list[node_result]:
+    """
+    Runs every node once all of its dependencies succeeded, at most workers at a time.
+
+    Args:
+        nodes (list[command_node]): The graph, already checked by check_graph.
+        run (Callable): Runs the command of a node.
+        workers (int): Maximum number of commands running at the same time.
+        cwd (str): The directory the commands run in, reported by the nodes that never ran.
+        on_failure (str): fail_fast cancels the running commands and starts no other once a node fails,
+            continue only skips the nodes depending on the failed one.
+
+    Returns:
+        list[node_result]: One result per node, in the order the nodes were given.
+    """
+    slots = asyncio.Semaphore(max(1, workers))
+    started = time.perf_counter()
+    results: dict[str, node_result] = {}
+    tasks: dict[str, asyncio.Task] = {}
+    stopped = asyncio.Event()
+
+    async def run_node(node: command_node) -> None:
+        dependencies = [tasks[dependency] for dependency in node.depends_on]
+        if dependencies:
+            await asyncio.wait(dependencies)
+        failed = [dependency for dependency in node.depends_on if results[dependency].status != "succeeded"]
+        if failed or stopped.is_set():
+            reason = f"Skipped, dependency '{failed[0]}' did not succeed." if failed else "Skipped, an earlier node failed."
+            results[node.id] = node_result(id=node.id, status="skipped", stderr=reason, current_directory=cwd)
+            return
+        async with slots:
+            if stopped.is_set():
+                results[node.id] = node_result(id=node.id, status="skipped", stderr="Skipped, an earlier node failed.",
+                                               current_directory=cwd)
+                return
+            started_at = round(time.perf_counter() - started, 6)
+            try:
+                result = await run(node)
+            except asyncio.CancelledError:
+                results[node.id] = node_result(id=node.id, status="cancelled", started_at=started_at,
+                                               stderr="Cancelled, another node failed.", current_directory=cwd)
+                raise
+        status = "succeeded" if result.success else "failed"
+        results[node.id] = node_result(**result.model_dump(exclude_none=True), id=node.id, status=status, started_at=started_at)
+        if not result.success and on_failure == "fail_fast":
+            stopped.set()
+            for other in tasks.values():
+                if other is not asyncio.current_task():
+                    other.cancel()
+
+    for node in _dependency_order(nodes):
+        tasks[node.id] = asyncio.ensure_future(run_node(node))
+    try:
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+    except BaseException:
+        # The call itself was cancelled, stop every command
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    for node in nodes:
+        if node.id not in results:
+            # Cancelled while waiting for its dependencies or a worker
+            results[node.id] = node_result(id=node.id, status="skipped", stderr="Skipped, an earlier node failed.",
+                                           current_directory=cwd)
+    return [results[node.id] for node in nodes]
+
+def _dependency_order(nodes: list[command_node]) -> list[command_node]:
+    """Nodes ordered so that every dependency comes before its dependents"""
+    by_id = {node.id: node for node in nodes}
+    ordered, seen = [], set()
+
+    def visit(node: command_node) -> None:
+        if node.id in seen:
+            return
+        seen.add(node.id)
+        for dependency in node.depends_on:
+            visit(by_id[dependency])
+        ordered.append(node)
+
+    for node in nodes:
+        visit(node)
+    return ordered
@@ -0,0 +1,216 @@
+import re
+from collections import deque
+from typing import NamedTuple
+from pydantic import BaseModel, Field
+from .decoding import output_decoder
+from .settings import env_bool, env_int
+
+# CSI sequences (colours, cursor movement, erase), OSC sequences (titles, hyperlinks) and two-byte escapes
+_ANSI_ESCAPE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)?|[@-Z\\-_])")
+
+class compaction_options(NamedTuple):
+    strip_ansi: bool = True
+    collapse_redraws: bool = True
+    dedupe: bool = True
+    # Lines kept from the beginning and the end of the output, None keeps every line
+    head_lines: int | None = 200
+    tail_lines: int = 200
+    # Longer lines keep their beginning and end
+    max_line_length: int = 2000
+
+# Compact the output of run_command and run_commands unless a call says otherwise
+enabled = env_bool("MCP_TERMINAL_COMPACT_OUTPUT", False)
+default_options = compaction_options(
+    strip_ansi=env_bool("MCP_TERMINAL_COMPACT_ANSI", True),
+    collapse_redraws=env_bool("MCP_TERMINAL_COMPACT_REDRAWS", True),
+    dedupe=env_bool("MCP_TERMINAL_COMPACT_DEDUPE", True),
+    head_lines=env_int("MCP_TERMINAL_COMPACT_HEAD_LINES", 200),
+    tail_lines=env_int("MCP_TERMINAL_COMPACT_TAIL_LINES", 200),
+    max_line_length=env_int("MCP_TERMINAL_COMPACT_LINE_LENGTH", 2000),
+)
+
+class compaction_report(BaseModel):
+    original_bytes: int = Field(default=0, description="UTF-8 size of stdout and stderr before compaction")
+    returned_bytes: int = Field(default=0, description="UTF-8 size of stdout and stderr as returned")
+    dropped_bytes: int = Field(default=0, description="Bytes removed by compaction, net of the markers it inserted")
+    ansi_sequences: int = Field(default=0, description="ANSI escape sequences removed")
+    redraws: int = Field(default=0, description="Carriage-return redraws collapsed to what was shown last")
+    repeated_lines: int = Field(default=0, description="Consecutive duplicate lines folded into a repeat marker")
+    shortened_lines: int = Field(default=0, description="Lines longer than the limit whose middle was cut")
+    truncated_lines: int = Field(default=0, description="Lines dropped between the head and the tail of the output")
+
+    def __add__(self, other: "compaction_report") -> "compaction_report":
+        return compaction_report(**{name: getattr(self, name) + getattr(other, name) for name in compaction_report.model_fields})
+
+def _utf8_size(text: str) -> int:
+    return len(text.encode("utf-8", errors="surrogatepass"))
+
+def _last_redraw(line: str) -> str:
+    """What a terminal shows of a line rewritten with carriage returns, for redraws spanning the whole line"""
+    for segment in reversed(line.split("\r")):
+        if segment:
+            return segment
+    return ""
+
+class output_compactor:
+    """
+    Compacts text as it arrives, line by line.
+
+    Each complete line has its ANSI escapes removed, is reduced to its last carriage-return
+    redraw and has its middle cut when it is too long; runs of identical lines become the line
+    and a repeat marker. feed() returns the lines that are final already (the head of the
+    output), the last tail_lines lines are kept until finish(), and everything in between is
+    only counted, so memory stays bounded however much is fed.
+    """
+
+    def __init__(self, options: compaction_options = default_options):
+        self.options = options
+        self.report = compaction_report()
+        self._partial = ""
+        # Characters cut from the middle of the partial line, after its first max_line_length // 2
+        self._partial_cut = 0
+        self._last: str | None = None
+        self._repeats = 0
+        self._head_lines = 0
+        self._tail: deque[str] = deque()
+        self._finished = False
+
+    def feed(self, text: str) -> str:
+        """Compacts the next piece of output and returns the compacted text that can be emitted now"""
+        if not text:
+            return ""
+        self.report.original_bytes += _utf8_size(text)
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        out = []
+        for line in lines:
+            self._line(line + "\n", out, self._partial_cut)
+            self._partial_cut = 0
+        if self.options.collapse_redraws and "\r" in self._partial:
+            # A progress bar redraws without ever ending its line, keep only the latest state
+            # (and a trailing \r, which may be the first half of \r\n)
+            ending = "\r" if self._partial.endswith("\r") else ""
+            segments = self._partial.split("\r")
+            last = max((index for index, segment in enumerate(segments) if segment), default=0)
+            self.report.redraws += len(segments) - 1 - len(ending)
+            self._partial = segments[last] + ending
+            if last:
+                self._partial_cut = 0
+        limit = self.options.max_line_length
+        if len(self._partial) > 4 * limit:
+            # A line that never ends would otherwise be held in memory entirely; keep what
+            # shortening it will keep, and enough of its end to strip escapes from
+            keep = limit // 2
+            self._partial_cut += len(self._partial) - keep - limit
+            self._partial = self._partial[:keep] + self._partial[-limit:]
+        return self._emitted(out)
+
+    def finish(self) -> str:
+        """Returns the rest of the compacted output: the last line, the truncation marker and the tail"""
+        if self._finished:
+            return ""
+        self._finished = True
+        out = []
+        if self._partial:
+            line, self._partial = self._partial, ""
+            self._line(line, out, self._partial_cut)
+        self._flush_repeats(out)
+        if self.report.truncated_lines:
+            out.append(f"... [{self.report.truncated_lines} lines truncated] ...\n")
+        out.extend(self._tail)
+        self._tail.clear()
+        return self._emitted(out)
+
+    def _emitted(self, out: list[str]) -> str:
+        text = "".join(out)
+        self.report.returned_bytes += _utf8_size(text)
+        self.report.dropped_bytes = self.report.original_bytes - self.report.returned_bytes
+        return text
+
+    def _line(self, line: str, out: list[str], cut: int = 0) -> None:
+        options = self.options
+        body, newline = (line[:-1], "\n") if line.endswith("\n") else (line, "")
+        if options.strip_ansi and "\x1b" in body:
+            body, count = _ANSI_ESCAPE.subn("", body)
+            self.report.ansi_sequences += count
+        if body.endswith("\r"):
+            body, newline = body[:-1], "\r" + newline
+        if options.collapse_redraws and "\r" in body:
+            self.report.redraws += body.count("\r")
+            body = _last_redraw(body)
+        if cut or len(body) > options.max_line_length:
+            keep = options.max_line_length // 2
+            cut += len(body) - 2 * keep
+            body = f"{body[:keep]} ... [{cut} characters truncated] ... {body[len(body) - keep:]}"
+            self.report.shortened_lines += 1
+        line = body + newline
+        if options.dedupe:
+            if line == self._last:
+                self._repeats += 1
+                return
+            self._flush_repeats(out)
+            self._last = line
+        self._emit(line, out)
+
+    def _flush_repeats(self, out: list[str]) -> None:
+        repeats, self._repeats = self._repeats, 0
+        if not repeats:
+            return
+        marker = f"[previous line repeated {repeats} more time{'s' if repeats > 1 else ''}]\n"
+        if len(marker) < repeats * len(self._last):
+            self.report.repeated_lines += repeats
+            self._emit(marker, out)
+        else:
+            # Short runs of short lines are smaller as they are
+            for _ in range(repeats):
+                self._emit(self._last, out)
+
+    def _emit(self, line: str, out: list[str]) -> None:
+        head_lines = self.options.head_lines
+        if head_lines is None or self._head_lines < head_lines:
+            self._head_lines += 1
+            out.append(line)
+            return
+        self._tail.append(line)
+        if len(self._tail) > self.options.tail_lines:
+            self._tail.popleft()
+            self.report.truncated_lines += 1
+
+def compact_text(text: str, options: compaction_options = default_options) -> tuple[str, compaction_report]:
+    compactor = output_compactor(options)
+    compacted = compactor.feed(text) + compactor.finish()
+    return compacted, compactor.report
+
+def compact_result(result, options: compaction_options = default_options):
+    """Copy of a command result with stdout and stderr compacted and the compaction report attached"""
+    stdout, stdout_report = compact_text(result.stdout, options)
+    stderr, stderr_report = compact_text(result.stderr, options)
+    return result.model_copy(update={"stdout": stdout, "stderr": stderr, "compaction": stdout_report + stderr_report})
+
+def clean_text(text: str) -> str:
+    """ANSI escapes removed and every line reduced to its last redraw, for showing recent output"""
+    lines = _ANSI_ESCAPE.sub("", text).split("\n")
+    return "\n".join(_last_redraw(line.rstrip("\r")) if "\r" in line else line for line in lines)
+
+class compacting_buffer:
+    """
+    Output buffer of a streamed command that decodes and compacts chunks as they are read,
+    in place of keeping raw head and tail bytes.
+    """
+
+    def __init__(self, decoder: output_decoder, options: compaction_options = default_options):
+        self.decoder = decoder
+        self.compactor = output_compactor(options)
+        self.total_bytes = 0
+        self._parts: list[str] = []
+
+    def write(self, data: bytes) -> None:
+        self.total_bytes += len(data)
+        text = self.compactor.feed(self.decoder.decode(data))
+        if text:
+            self._parts.append(text)
+
+    def getvalue(self) -> str:
+        text = self.compactor.feed(self.decoder.decode(b"", final=True))
+        self._parts.append(text + self.compactor.finish())
+        return "".join(self._parts)
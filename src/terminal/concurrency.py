@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .settings import env_int
+
+# Maximum number of commands allowed to run at the same time.
+# Most commands spend their time waiting on I/O, so this is not tied to the CPU count.
+max_concurrent_commands = env_int("MCP_TERMINAL_MAX_CONCURRENCY", 16)
+# Maximum number of worker threads used for blocking file-system tools
+max_workers = env_int("MCP_TERMINAL_MAX_WORKERS", min(32, (os.cpu_count() or 1) + 4))
+
+_executor: ThreadPoolExecutor | None = None
+_command_slots: asyncio.Semaphore | None = None
+
+def configure(concurrency: int | None = None, workers: int | None = None) -> None:
+    """
+    Overrides the concurrency limits. Must be called before the server starts handling requests.
+
+    Args:
+        concurrency (int | None): Maximum number of commands running at the same time.
+        workers (int | None): Maximum number of worker threads for blocking tools.
+    """
+    global max_concurrent_commands, max_workers, _executor, _command_slots
+    if concurrency:
+        max_concurrent_commands = concurrency
+        _command_slots = None
+    if workers:
+        max_workers = workers
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-terminal")
+    return _executor
+
+def command_slots() -> asyncio.Semaphore:
+    global _command_slots
+    if _command_slots is None:
+        _command_slots = asyncio.Semaphore(max_concurrent_commands)
+    return _command_slots
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function on the bounded worker pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    # Carry the context variables (the MCP request among them) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+def offload(func):
+    """
+    Turns a blocking tool function into an async one executed on the worker pool.
+    The wrapped function keeps its name, docstring and signature so it can be registered with @mcp.tool().
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+    return wrapper
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
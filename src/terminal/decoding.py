@@ -0,0 +1,154 @@
+import codecs
+import locale
+import sys
+import threading
+from collections import OrderedDict
+
+# Bytes looked at to pick an encoding, the rest of the output is only decoded
+SAMPLE_SIZE = 64 * 1024
+# Programs whose detected encoding is remembered, the least recently used one is dropped beyond this
+ENCODING_CACHE_SIZE = 256
+
+# Tried after the platform encodings; latin1 decodes anything but may produce garbage
+_FALLBACK_ENCODINGS = ("utf-8", "utf-16", "latin1")
+
+def encoding_candidates() -> list[str]:
+    """Encodings tried in order when detecting the encoding of command output, without duplicates"""
+    candidates = []
+    for name in (sys.stdout.encoding, sys.stdin.encoding, locale.getpreferredencoding(), *_FALLBACK_ENCODINGS):
+        if not name:
+            continue
+        try:
+            name = codecs.lookup(name).name
+        except LookupError:
+            continue
+        if name not in candidates:
+            candidates.append(name)
+    return candidates
+
+def detect_encoding(sample: bytes, final: bool = False) -> str:
+    """
+    First candidate encoding that decodes the sample. Unless final, the sample is
+    a prefix of the output and may end in the middle of a character.
+    """
+    for encoding in encoding_candidates():
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+            return encoding
+        except UnicodeError:
+            continue
+    return "latin1"
+
+# Bytes that do not decode become U+FFFD like with errors="replace", and are counted so
+# a wrong encoding is noticed without decoding the output a second time
+_replacements = threading.local()
+
+def _count_replacement(error: UnicodeDecodeError) -> tuple[str, int]:
+    _replacements.count = getattr(_replacements, "count", 0) + 1
+    return "\ufffd", error.end
+
+codecs.register_error("terminal.count_replace", _count_replacement)
+
+class output_decoder:
+    """
+    Decodes command output chunk by chunk.
+
+    The encoding is detected once, from the first SAMPLE_SIZE bytes (or from a known
+    encoding passed in), and every byte is then decoded exactly once by an incremental
+    decoder, so characters split between chunks are kept whole. Text is held back until
+    sample_size bytes arrived, a small one suits progress updates.
+    Bytes the encoding cannot decode are replaced and set mismatch, so callers can forget
+    an encoding that turned out wrong; when that happens within the first sample of a
+    known encoding, the sample is detected and decoded again instead.
+    """
+
+    def __init__(self, encoding: str | None = None, sample_size: int = SAMPLE_SIZE):
+        self.encoding = encoding
+        self.sample_size = sample_size
+        self.mismatch = False
+        self._decoder = self._new_decoder() if encoding else None
+        self._sample = bytearray()
+        self._started = False
+
+    def _new_decoder(self) -> codecs.IncrementalDecoder:
+        return codecs.getincrementaldecoder(self.encoding)(errors="terminal.count_replace")
+
+    def _decode(self, data: bytes, final: bool) -> str:
+        before = getattr(_replacements, "count", 0)
+        text = self._decoder.decode(data, final)
+        if getattr(_replacements, "count", 0) != before:
+            self.mismatch = True
+        return text
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        if self._decoder is None:
+            # Small chunks are held back until there is enough to tell the encoding
+            if self._sample or (len(data) < self.sample_size and not final):
+                self._sample.extend(data)
+                if len(self._sample) < self.sample_size and not final:
+                    return ""
+                data, self._sample = bytes(self._sample), bytearray()
+            self.encoding = detect_encoding(data[:SAMPLE_SIZE], final=final and len(data) <= SAMPLE_SIZE)
+            self._decoder = self._new_decoder()
+            self._started = True
+            return self._decode(data, final)
+        if self._started or len(data) > SAMPLE_SIZE:
+            self._started = True
+            return self._decode(data, final)
+        # First chunk with a remembered encoding, small enough to detect again if it is wrong
+        self._started = True
+        text = self._decode(data, final)
+        if self.mismatch:
+            self.encoding = detect_encoding(data, final=final)
+            self._decoder = self._new_decoder()
+            text = self._decoder.decode(data, final)
+        return text
+
+def decode_output(output_bytes, encoding: str | None = None) -> str:
+    """Decodes a complete output in one pass, detecting its encoding unless given"""
+    if isinstance(output_bytes, str):
+        return output_bytes
+    return output_decoder(encoding).decode(output_bytes, final=True)
+
+class encoding_cache:
+    """
+    Encodings detected for earlier outputs, so the next output of the same program
+    or session is decoded without detection. Entries that turned out wrong are dropped.
+    """
+
+    def __init__(self, size: int = ENCODING_CACHE_SIZE):
+        self.size = size
+        self._encodings: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            encoding = self._encodings.get(key)
+            if encoding is not None:
+                self._encodings.move_to_end(key)
+            return encoding
+
+    def update(self, key: str, decoder: output_decoder) -> None:
+        """Remember the encoding a finished decoder used, or forget it after a mismatch"""
+        with self._lock:
+            if decoder.mismatch or decoder.encoding is None:
+                self._encodings.pop(key, None)
+                return
+            self._encodings[key] = decoder.encoding
+            self._encodings.move_to_end(key)
+            while len(self._encodings) > self.size:
+                self._encodings.popitem(last=False)
+
+    def decode(self, key: str, output_bytes) -> str:
+        """decode_output using and updating the encoding remembered for key"""
+        if isinstance(output_bytes, str):
+            return output_bytes
+        decoder = output_decoder(self.get(key))
+        text = decoder.decode(output_bytes, final=True)
+        # Empty output says nothing about the encoding
+        if output_bytes:
+            self.update(key, decoder)
+        return text
+
+# Encodings of one-shot commands, keyed by program name
+command_encodings = encoding_cache()
@@ -0,0 +1,314 @@
+import errno
+import os
+import queue
+import shutil
+import stat
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import Field
+from .terminal import command_result
+from .settings import env_bool, env_int
+from . import file_hashes
+
+# Threads copying files; small files cost mostly metadata calls that wait on the file system
+copy_workers = env_int("MCP_TERMINAL_COPY_WORKERS", min(32, 4 * (os.cpu_count() or 1)))
+# Try copy-on-write clones first, which share the data blocks on btrfs, XFS and others
+copy_reflink = env_bool("MCP_TERMINAL_COPY_REFLINK", True)
+# Errors listed in the result, the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+_FICLONE = 0x40049409  # ioctl cloning a whole file (Linux)
+_CHUNK_SIZE = 1024 * 1024 * 1024  # Bytes per copy_file_range/sendfile call
+_BUFFER_SIZE = 1024 * 1024
+_O_BINARY = getattr(os, "O_BINARY", 0)
+# The kernel cannot offload this pair of files, copy the bytes through user space instead
+_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM)
+
+class copy_result(command_result):
+    files_copied: int | None = Field(default=None, description="Files whose content was copied")
+    files_skipped: int | None = Field(default=None, description="Files already up to date in the destination (sync only)")
+    bytes_copied: int | None = Field(default=None, description="Bytes of the copied files")
+    directories: int | None = Field(default=None, description="Directories in the copied tree")
+    copy_methods: dict[str, int] | None = Field(default=None, description="Files copied by each method: reflink, copy_file_range, sendfile or read_write")
+    errors: list[str] = Field(default_factory=list, description="Files and directories that could not be copied, at most 20")
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+# (source device, destination device) -> methods that failed between them
+_unsupported: dict[tuple[int, int], set[str]] = {}
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Separate from the tool worker pool, whose threads wait on this one
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=copy_workers, thread_name_prefix="mcp-terminal-copy")
+        return _pool
+
+def _reflink(source_fd: int, destination_fd: int) -> bool:
+    import fcntl
+    fcntl.ioctl(destination_fd, _FICLONE, source_fd)
+    return True
+
+def _copy_range(source_fd: int, destination_fd: int, offset: int) -> int:
+    while True:
+        copied = os.copy_file_range(source_fd, destination_fd, _CHUNK_SIZE, offset, offset)
+        if copied == 0:
+            return offset
+        offset += copied
+
+def _sendfile(source_fd: int, destination_fd: int, offset: int) -> int:
+    os.lseek(destination_fd, offset, os.SEEK_SET)
+    while True:
+        copied = os.sendfile(destination_fd, source_fd, offset, _CHUNK_SIZE)
+        if copied == 0:
+            return offset
+        offset += copied
+
+def _read_write(source_fd: int, destination_fd: int, offset: int) -> int:
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    os.lseek(destination_fd, offset, os.SEEK_SET)
+    buffer = bytearray(_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(source_fd, "rb", buffering=0, closefd=False) as source:
+        while True:
+            read = source.readinto(buffer)
+            if not read:
+                return offset
+            written = 0
+            while written < read:
+                written += os.write(destination_fd, view[written:read])
+            offset += read
+
+def copy_data(source_fd: int, destination_fd: int, devices: tuple[int, int]) -> str:
+    """
+    Copies the content of one open file into an empty one, letting the kernel do it when it can:
+    a reflink clone, then copy_file_range, then sendfile, then a read/write loop. A method that
+    fails between two devices is not tried again for them.
+
+    Returns:
+        str: The method that copied the data.
+    """
+    failed = _unsupported.setdefault(devices, set())
+    offset = 0
+    if copy_reflink and sys.platform.startswith("linux") and "reflink" not in failed:
+        try:
+            _reflink(source_fd, destination_fd)
+            return "reflink"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            failed.add("reflink")
+    for method, copy in (("copy_file_range", _copy_range), ("sendfile", _sendfile)):
+        if method in failed or not hasattr(os, method) or not sys.platform.startswith("linux"):
+            continue
+        try:
+            copy(source_fd, destination_fd, offset)
+            return method
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            failed.add(method)
+            # Whatever was copied before the failure stays, the next method continues after it
+            offset = os.lseek(destination_fd, 0, os.SEEK_END)
+    _read_write(source_fd, destination_fd, offset)
+    return "read_write"
+
+def copy_file(source: str, destination: str, source_info: os.stat_result, replace: bool) -> str:
+    """
+    Copies a file with its permissions and times, like shutil.copy2. An existing destination
+    is replaced atomically, through a temporary sibling renamed over it.
+
+    Returns:
+        str: The method that copied the data.
+    """
+    target = destination
+    if replace:
+        directory, name = os.path.split(destination)
+        target = os.path.join(directory, f".{name}.mcp-tmp-{uuid.uuid4().hex[:12]}")
+    try:
+        source_fd = os.open(source, os.O_RDONLY | _O_BINARY)
+        try:
+            destination_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY | (os.O_EXCL if replace else 0), 0o666)
+            try:
+                method = copy_data(source_fd, destination_fd, (source_info.st_dev, os.fstat(destination_fd).st_dev))
+            finally:
+                os.close(destination_fd)
+        finally:
+            os.close(source_fd)
+        shutil.copystat(source, target)
+        if replace:
+            os.replace(target, destination)
+    except BaseException:
+        if replace:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+        raise
+    return method
+
+class tree_copy:
+    """
+    One copy of a directory tree. The calling thread walks the source, creating directories
+    and queueing files, while copy_workers threads copy them. The counters can be read from
+    another thread to report progress.
+
+    Symlinks are followed, like shutil.copytree does by default. In sync mode the destination
+    may exist: files with the same size and modification time (or content, with checksum) are
+    skipped, others are replaced, and files only in the destination are left alone.
+    """
+
+    def __init__(self, source: str, destination: str, sync: bool = False, checksum: bool = False):
+        self.source = source
+        self.destination = destination
+        self.sync = sync
+        self.checksum = checksum
+        self.files_found = 0
+        self.bytes_found = 0
+        self.walk_done = False
+        self.files_done = 0
+        self.files_copied = 0
+        self.files_skipped = 0
+        self.bytes_done = 0
+        self.bytes_copied = 0
+        self.directories = 0
+        self.methods: dict[str, int] = {}
+        self.errors: list[str] = []
+        self.error_count = 0
+        self.cancelled = False
+        self._queue: queue.SimpleQueue[tuple[str, str, os.stat_result] | None] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+
+    def _error(self, path: str, error: OSError) -> None:
+        with self._lock:
+            self.error_count += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append(f"{path}: {error.strerror or error}")
+
+    def cancel(self) -> None:
+        """Stops queueing and copying files; those being copied are finished"""
+        self.cancelled = True
+
+    def run(self) -> None:
+        pool = _get_pool()
+        workers = [pool.submit(self._work) for _ in range(copy_workers)]
+        try:
+            directories = self._walk()
+        finally:
+            for _ in workers:
+                self._queue.put(None)
+            for worker in workers:
+                worker.result()
+        # Deepest first, so copying a directory's times is not undone by writes below it
+        for source, destination in reversed(directories):
+            try:
+                shutil.copystat(source, destination)
+            except OSError as e:
+                self._error(source, e)
+
+    def _walk(self) -> list[tuple[str, str]]:
+        skip = os.path.realpath(self.destination)
+        directories = []
+        stack = [(self.source, self.destination)]
+        while stack and not self.cancelled:
+            source, destination = stack.pop()
+            try:
+                os.makedirs(destination, exist_ok=self.sync)
+                with os.scandir(source) as it:
+                    entries = list(it)
+            except OSError as e:
+                self._error(source, e)
+                continue
+            directories.append((source, destination))
+            self.directories += 1
+            for entry in entries:
+                target = os.path.join(destination, entry.name)
+                try:
+                    if entry.is_dir():
+                        # A destination inside the source would be copied into itself
+                        if os.path.realpath(entry.path) != skip:
+                            stack.append((entry.path, target))
+                        continue
+                    info = entry.stat()
+                except OSError as e:
+                    self._error(entry.path, e)
+                    continue
+                with self._lock:
+                    self.files_found += 1
+                    self.bytes_found += info.st_size
+                self._queue.put((entry.path, target, info))
+        self.walk_done = True
+        return directories
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            source, destination, info = item
+            if self.cancelled:
+                continue
+            method = None
+            try:
+                method = self._sync_file(source, destination, info)
+            except OSError as e:
+                self._error(source, e)
+            with self._lock:
+                self.files_done += 1
+                self.bytes_done += info.st_size
+                if method is None:
+                    continue
+                if method == "skipped":
+                    self.files_skipped += 1
+                else:
+                    self.files_copied += 1
+                    self.bytes_copied += info.st_size
+                    self.methods[method] = self.methods.get(method, 0) + 1
+
+    def _sync_file(self, source: str, destination: str, info: os.stat_result) -> str | None:
+        if not stat.S_ISREG(info.st_mode):
+            raise OSError(errno.EINVAL, "Not a regular file, only files and directories are copied")
+        existing = None
+        if self.sync:
+            try:
+                existing = os.stat(destination, follow_symlinks=False)
+            except FileNotFoundError:
+                pass
+        if existing is not None:
+            if stat.S_ISDIR(existing.st_mode):
+                raise IsADirectoryError(errno.EISDIR, f"'{destination}' is a directory")
+            if stat.S_ISREG(existing.st_mode) and existing.st_size == info.st_size:
+                if existing.st_mtime_ns == info.st_mtime_ns:
+                    return "skipped"
+                if self.checksum and file_hashes.cached_digest(source) == file_hashes.cached_digest(destination):
+                    # Same content, only the times differ: fix them so the next sync skips it at once
+                    shutil.copystat(source, destination)
+                    return "skipped"
+        return copy_file(source, destination, info, replace=existing is not None)
+
+def copy_tree(source: str, destination: str, sync: bool = False, checksum: bool = False) -> tree_copy:
+    """
+    Copies the directory at source to destination with copy_workers threads.
+
+    Args:
+        source (str): Absolute path of the directory to copy.
+        destination (str): Absolute path of the copy; must not exist unless sync is set.
+        sync (bool): Update an existing destination, skipping files that are already up to date.
+        checksum (bool): In sync mode, compare the content of files whose size matches but time differs.
+
+    Returns:
+        tree_copy: The finished copy with its counters and errors.
+    """
+    copy = tree_copy(source, destination, sync, checksum)
+    copy.run()
+    return copy
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,361 @@
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, NamedTuple
+from pydantic import BaseModel, Field
+from .terminal import command_result
+from .settings import env_float, env_int
+from . import watcher
+
+# Threads listing and stating directories, most of the time is spent waiting on the file system
+size_workers = env_int("MCP_TERMINAL_SIZE_WORKERS", min(32, 4 * (os.cpu_count() or 1)))
+# Directories whose summary is remembered, the least recently used one is dropped beyond this
+size_cache_entries = env_int("MCP_TERMINAL_SIZE_CACHE_ENTRIES", 100000)
+# Seconds a directory summary is trusted while the directory's mtime is unchanged; files growing
+# in place do not change it, so this bounds how stale a size can be. Summaries of a directory
+# watched by get_changes_since are trusted until the watcher reports a change
+size_cache_ttl = env_float("MCP_TERMINAL_SIZE_CACHE_TTL", 60)
+# Largest files remembered per directory, the most get_directory_sizes can list
+MAX_TOP = 100
+
+sort_key_name = Literal["allocated", "apparent"]
+
+class size_entry(BaseModel):
+    path: str = Field(description="Path relative to the analyzed directory")
+    type: Literal["file", "directory"] = Field(description="Kind of entry")
+    apparent_size: int = Field(description="Bytes of content (st_size), summed over the subtree for directories")
+    allocated_size: int = Field(description="Bytes allocated on disk (st_blocks * 512), summed over the subtree for directories")
+    files: int | None = Field(default=None, description="Files in the subtree of a directory")
+
+class directory_sizes_result(command_result):
+    apparent_size: int | None = Field(default=None, description="Bytes of content in the whole tree")
+    allocated_size: int | None = Field(default=None, description="Bytes allocated on disk for the whole tree")
+    files: int | None = Field(default=None, description="Files in the tree, hard links to the same file counted once")
+    directories: int | None = Field(default=None, description="Directories in the tree, itself included")
+    hardlinks_deduplicated: int | None = Field(default=None, description="Extra names of already counted files, whose size was not added again")
+    entries: list[size_entry] = Field(default_factory=list, description="Largest entries directly in the directory")
+    largest_files: list[size_entry] = Field(default_factory=list, description="Largest files anywhere in the tree")
+    walked_directories: int | None = Field(default=None, description="Directories listed during this call")
+    cached_directories: int | None = Field(default=None, description="Directories whose summary came from the cache")
+    errors: int | None = Field(default=None, description="Entries that could not be read")
+
+class directory_summary(NamedTuple):
+    """What one directory holds directly, enough to total a tree without listing it again"""
+    device: int
+    inode: int
+    mtime_ns: int
+    checked_at: float
+    # The directory itself and its files with a single link
+    apparent: int
+    allocated: int
+    files: int
+    # Files with several links, as (device, inode, apparent, allocated), counted once per tree
+    linked: tuple
+    # Up to MAX_TOP largest files, as (apparent, allocated, name, (device, inode) when it has several links)
+    largest_by_apparent: tuple
+    largest_by_allocated: tuple
+    subdirectories: tuple
+    errors: int
+
+_cache: OrderedDict[str, directory_summary] = OrderedDict()
+_cache_lock = threading.Lock()
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Separate from the tool worker pool, whose threads wait on this one
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=size_workers, thread_name_prefix="mcp-terminal-sizes")
+        return _pool
+
+# Windows has no st_blocks, the apparent size stands in for the allocated one there
+_HAS_BLOCKS = hasattr(os.stat_result, "st_blocks")
+
+def _allocated(info: os.stat_result) -> int:
+    return info.st_blocks * 512 if _HAS_BLOCKS else info.st_size
+
+def _by_allocated(item: tuple) -> int:
+    return item[1]
+
+def _summarize(path: str, info: os.stat_result) -> directory_summary:
+    """Lists one directory, stating its files without following symlinks"""
+    # Before listing, so a change made while listing is never older than the summary
+    checked_at = time.monotonic()
+    apparent, allocated = info.st_size, _allocated(info)
+    files = errors = 0
+    linked, sized, subdirectories = [], [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                        continue
+                    entry_info = entry.stat(follow_symlinks=False)
+                except OSError:
+                    errors += 1
+                    continue
+                size = entry_info.st_size
+                blocks = entry_info.st_blocks * 512 if _HAS_BLOCKS else size
+                files += 1
+                link = None
+                if entry_info.st_nlink > 1:
+                    link = (entry_info.st_dev, entry_info.st_ino)
+                    linked.append((*link, size, blocks))
+                else:
+                    apparent += size
+                    allocated += blocks
+                sized.append((size, blocks, entry.name, link))
+    except OSError:
+        errors += 1
+    return directory_summary(
+        info.st_dev, info.st_ino, info.st_mtime_ns, checked_at, apparent, allocated, files, tuple(linked),
+        tuple(sorted(sized, reverse=True)[:MAX_TOP]),
+        tuple(sorted(sized, key=_by_allocated, reverse=True)[:MAX_TOP]),
+        tuple(sorted(subdirectories)), errors)
+
+def _cached(path: str, info: os.stat_result, watched_since: float | None) -> directory_summary | None:
+    with _cache_lock:
+        summary = _cache.get(path)
+        if summary is None:
+            return None
+        trusted = watched_since is not None and summary.checked_at >= watched_since
+        if (summary.device, summary.inode, summary.mtime_ns) != (info.st_dev, info.st_ino, info.st_mtime_ns) \
+                or not trusted and time.monotonic() - summary.checked_at > size_cache_ttl:
+            del _cache[path]
+            return None
+        _cache.move_to_end(path)
+        return summary
+
+def _remember(path: str, summary: directory_summary) -> None:
+    with _cache_lock:
+        _cache[path] = summary
+        _cache.move_to_end(path)
+        while len(_cache) > size_cache_entries:
+            _cache.popitem(last=False)
+
+def _visit(path: str, use_cache: bool, watched_since: float | None) -> tuple[directory_summary | None, bool]:
+    """Summary of the directory at path and whether it came from the cache; None if it cannot be read"""
+    try:
+        info = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None, False
+    if use_cache:
+        summary = _cached(path, info, watched_since)
+        if summary is not None:
+            return summary, True
+    summary = _summarize(path, info)
+    _remember(path, summary)
+    return summary, False
+
+class _tree_walk:
+    """Directories to visit, shared by the worker threads of one collect()"""
+
+    def __init__(self, workers: int, use_cache: bool, watched_since: float | None):
+        self.workers = workers
+        self.use_cache = use_cache
+        self.watched_since = watched_since
+        self.summaries: dict[str, directory_summary] = {}
+        self.walked = 0
+        self.cached = 0
+        self._queue: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def add(self, path: str) -> None:
+        with self._lock:
+            self._pending += 1
+        self._queue.put(path)
+
+    def work(self) -> None:
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            summary = from_cache = None
+            try:
+                summary, from_cache = _visit(path, self.use_cache, self.watched_since)
+                if summary is not None:
+                    self.summaries[path] = summary
+                    for name in summary.subdirectories:
+                        self.add(os.path.join(path, name))
+            finally:
+                with self._lock:
+                    if summary is not None:
+                        if from_cache:
+                            self.cached += 1
+                        else:
+                            self.walked += 1
+                    self._pending -= 1
+                    finished = self._pending == 0
+                if finished:
+                    # Nothing queued and nothing being listed that could queue more
+                    for _ in range(self.workers):
+                        self._queue.put(None)
+
+def collect(root: str, use_cache: bool = True) -> tuple[dict[str, directory_summary], int, int]:
+    """
+    Summaries of every directory below root, listed by size_workers threads in parallel.
+    Unchanged directories come from the cache and cost one stat; below a watched directory
+    they are trusted past size_cache_ttl, since the watcher drops them when they change.
+
+    Returns:
+        tuple[dict[str, directory_summary], int, int]: Summaries by path, directories listed and directories from the cache.
+    """
+    walk = _tree_walk(size_workers, use_cache, watcher.watched_since(root))
+    walk.add(root)
+    pool = _get_pool()
+    for future in [pool.submit(walk.work) for _ in range(size_workers)]:
+        future.result()
+    return walk.summaries, walk.walked, walk.cached
+
+class tree_totals(NamedTuple):
+    apparent: int
+    allocated: int
+    files: int
+    directories: int
+
+def analyze(root: str, limit: int = 20, sort_by: sort_key_name = "allocated", use_cache: bool = True) -> directory_sizes_result:
+    """
+    Totals the tree below root, hard links counted once.
+
+    Args:
+        root (str): Absolute path of the directory.
+        limit (int): Entries listed in entries and largest_files, at most MAX_TOP.
+        sort_by (str): "allocated" or "apparent", the size the lists are ordered by.
+        use_cache (bool): Reuse the summaries of directories whose mtime did not change.
+
+    Returns:
+        directory_sizes_result: Totals, the largest entries of root and the largest files of the tree.
+    """
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"'{root}' is not a directory.")
+    # Only the root is followed when it is a symlink, like du does
+    root = os.path.realpath(root)
+    limit = max(0, min(limit, MAX_TOP))
+    summaries, walked, cached = collect(root, use_cache)
+    seen_links: set[tuple[int, int]] = set()
+    duplicates = 0
+    totals: dict[str, tree_totals] = {}
+
+    # Children before parents, so every directory adds up totals already computed
+    order, stack = [], [root]
+    while stack:
+        path = stack.pop()
+        summary = summaries.get(path)
+        if summary is None:
+            continue
+        order.append(path)
+        stack.extend(os.path.join(path, name) for name in reversed(summary.subdirectories))
+    for path in reversed(order):
+        summary = summaries[path]
+        apparent, allocated, files, directories = summary.apparent, summary.allocated, summary.files, 1
+        for device, inode, size, blocks in summary.linked:
+            if (device, inode) in seen_links:
+                duplicates += 1
+                files -= 1
+                continue
+            seen_links.add((device, inode))
+            apparent += size
+            allocated += blocks
+        for name in summary.subdirectories:
+            child = totals.get(os.path.join(path, name))
+            if child is not None:
+                apparent += child.apparent
+                allocated += child.allocated
+                files += child.files
+                directories += child.directories
+        totals[path] = tree_totals(apparent, allocated, files, directories)
+
+    top = summaries[root]
+    own_files = top.largest_by_apparent if sort_by == "apparent" else top.largest_by_allocated
+    children = [size_entry(path=name, type="file", apparent_size=size, allocated_size=blocks)
+                for size, blocks, name, _ in own_files]
+    for name in top.subdirectories:
+        child = totals.get(os.path.join(root, name))
+        if child is not None:
+            children.append(size_entry(path=name, type="directory", apparent_size=child.apparent,
+                                       allocated_size=child.allocated, files=child.files))
+    sort_size = (lambda entry: entry.apparent_size) if sort_by == "apparent" else (lambda entry: entry.allocated_size)
+    entries = heapq.nlargest(limit, children, key=sort_size)
+
+    # Each directory keeps its largest files sorted, so the largest of the tree are found
+    # with a heap of limit items, stopping in every directory at the first file too small.
+    # A file with several links is listed under the first of its names only
+    heap, listed_links = [], set()
+    for path in order if limit else ():
+        summary = summaries[path]
+        for size, blocks, name, link in summary.largest_by_apparent if sort_by == "apparent" else summary.largest_by_allocated:
+            key = size if sort_by == "apparent" else blocks
+            if len(heap) >= limit and key <= heap[0][0]:
+                break
+            if link is not None:
+                if link in listed_links:
+                    continue
+                listed_links.add(link)
+            if len(heap) < limit:
+                heapq.heappush(heap, (key, size, blocks, path, name, link))
+            else:
+                dropped = heapq.heapreplace(heap, (key, size, blocks, path, name, link))
+                listed_links.discard(dropped[5])
+    largest_files = [size_entry(path=os.path.relpath(os.path.join(path, name), root), type="file",
+                                apparent_size=size, allocated_size=blocks)
+                     for _, size, blocks, path, name, _ in sorted(heap, reverse=True)]
+
+    total = totals[root]
+    return directory_sizes_result(
+        success=True,
+        stdout="",
+        stderr="",
+        returncode=0,
+        apparent_size=total.apparent,
+        allocated_size=total.allocated,
+        files=total.files,
+        directories=total.directories,
+        hardlinks_deduplicated=duplicates,
+        entries=entries,
+        largest_files=largest_files,
+        walked_directories=walked,
+        cached_directories=cached,
+        errors=sum(summary.errors for summary in summaries.values())
+    )
+
+def format_size(size: float) -> str:
+    """Bytes in a human readable unit"""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} PB"
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+def invalidate(changed: list[str], rescan: list[str]) -> None:
+    """Drops the summaries of changed directories and of the directories holding changed files"""
+    with _cache_lock:
+        if not _cache:
+            return
+        for path in changed:
+            _cache.pop(path, None)
+            _cache.pop(os.path.dirname(path), None)
+        if rescan:
+            prefixes = tuple(os.path.join(path, "") for path in rescan)
+            for path in [path for path in _cache if path in rescan or path.startswith(prefixes)]:
+                del _cache[path]
+
+watcher.add_listener(invalidate)
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
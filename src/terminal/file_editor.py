@@ -0,0 +1,312 @@
+import hashlib
+import itertools
+import operator
+import os
+import re
+import threading
+from typing import NamedTuple
+from pydantic import BaseModel, Field
+from .terminal import command_result
+from . import file_writer
+
+# Shortest base_sha256 prefix accepted, like an abbreviated git hash
+MIN_HASH_PREFIX = 8
+# Line numbers of failed matches listed in an error
+MAX_REPORTED_MATCHES = 5
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# Edits of the same file are serialized, between reading it and replacing it
+_locks = [threading.Lock() for _ in range(64)]
+
+class text_edit(BaseModel):
+    old_text: str | None = Field(default=None, description="Exact text to replace, found once in the file unless replace_all")
+    new_text: str = Field(default="", description="Replacement text, or the lines replacing start_line..end_line")
+    start_line: int | None = Field(default=None, description="First line to replace (1-based), instead of old_text")
+    end_line: int | None = Field(default=None, description="Last line to replace (inclusive); start_line - 1 inserts before start_line")
+    replace_all: bool = Field(default=False, description="Replace every occurrence of old_text")
+
+class edit_result(command_result):
+    sha256: str | None = Field(default=None, description="SHA-256 of the edited file, the base_sha256 of a following edit")
+    hunks_applied: int | None = Field(default=None, description="Diff hunks applied")
+    edits_applied: int | None = Field(default=None, description="Search/replace and line range edits applied")
+    bytes_written: int | None = Field(default=None, description="Size of the edited file")
+
+class _change(NamedTuple):
+    start: int        # Offsets in the original text
+    end: int
+    text: str         # Replacement
+    source: str       # What asked for it, for error messages
+
+class _hunk(NamedTuple):
+    header: str
+    old_start: int            # 1-based, as in the header
+    old_count: int
+    lines: list[tuple[str, str]]  # (" ", "-" or "+", text without line ending)
+    old_no_eol: bool          # The old side ends without a newline
+    new_no_eol: bool          # The new side ends without a newline
+
+class _lines:
+    """Line start offsets of a text, and its newline convention"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._starts = None
+        # Inserted lines end like the first line of the file
+        first = text.find("\n")
+        self.newline = "\r\n" if first > 0 and text[first - 1] == "\r" else "\n"
+
+    @property
+    def starts(self) -> list[int]:
+        # Only diffs and line ranges need it; built from the line lengths without a Python loop
+        if self._starts is None:
+            lengths = map(operator.add, map(len, self.text.split("\n")), itertools.repeat(1))
+            self._starts = list(itertools.accumulate(lengths, initial=0))
+            # The last start is past the end of the text, one more after a final newline
+            del self._starts[-2 if self.text.endswith("\n") or not self.text else -1:]
+        return self._starts
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def start(self, index: int) -> int:
+        """Offset of 0-based line index, the end of the text past the last line"""
+        return self.starts[index] if index < len(self.starts) else len(self.text)
+
+    def content(self, index: int) -> str:
+        line = self.text[self.start(index):self.start(index + 1)]
+        if line.endswith("\n"):
+            line = line[:-2] if line.endswith("\r\n") else line[:-1]
+        return line
+
+    def number(self, offset: int) -> int:
+        """1-based number of the line holding offset"""
+        return self.text.count("\n", 0, offset) + 1
+
+def parse_diff(diff: str) -> list[_hunk]:
+    """
+    Parses the hunks of a unified diff of one file. File headers and git extended headers
+    are skipped. The line counts of hunk headers only tell "--- " and "+++ " lines inside a
+    hunk from file headers: lines past them that still look like hunk lines are kept, so
+    hand-written diffs with wrong counts still apply.
+    """
+    hunks = []
+    lines = diff.split("\n")
+    while lines and not lines[-1]:
+        lines.pop()
+    files = 0
+    current = None
+    remaining_old = remaining_new = 0
+    for line in lines:
+        line = line[:-1] if line.endswith("\r") else line
+        match = _HUNK_HEADER.match(line)
+        inside = current is not None and (remaining_old > 0 or remaining_new > 0)
+        if match:
+            remaining_old = int(match.group(2) or 1)
+            remaining_new = int(match.group(4) or 1)
+            current = _hunk(line, int(match.group(1)), remaining_old, [], False, False)
+            hunks.append(current)
+        elif not inside and (line.startswith("--- ") or line.startswith("+++ ")):
+            if line.startswith("+++ "):
+                files += 1
+                if files > 1:
+                    raise ValueError("The diff changes several files, edit_file applies a diff of one file.")
+            current = None
+        elif current is None:
+            continue
+        elif line.startswith("\\"):
+            # "\ No newline at end of file" applies to the line before
+            if current.lines:
+                kind = current.lines[-1][0]
+                hunks[-1] = current = current._replace(old_no_eol=current.old_no_eol or kind != "+",
+                                                       new_no_eol=current.new_no_eol or kind != "-")
+        elif line[:1] in (" ", "-", "+") or (inside and not line):
+            # Editors strip the space of empty context lines
+            kind = line[:1] or " "
+            current.lines.append((kind, line[1:]))
+            remaining_old -= kind != "+"
+            remaining_new -= kind != "-"
+        elif inside:
+            raise ValueError(f"Unexpected line in hunk '{current.header}': {line!r}")
+        else:
+            # Past the end of the hunk: "diff --git", "index" and other extended headers
+            current = None
+    if not hunks:
+        raise ValueError("The diff has no hunks (lines starting with '@@ -').")
+    return hunks
+
+def _matches(lines: _lines, at: int, old: list[str], strip: bool) -> bool:
+    if strip:
+        return all(lines.content(at + index).rstrip() == text.rstrip() for index, text in enumerate(old))
+    return all(lines.content(at + index) == text for index, text in enumerate(old))
+
+def _find_hunk(lines: _lines, hunk: _hunk, old: list[str], earliest: int) -> int | None:
+    """Index of the line where the old side of hunk is, the nearest to its header's line first"""
+    last = len(lines) - len(old)
+    expected = min(max(hunk.old_start - 1, earliest), max(last, earliest))
+    # Exact matches first, then ignoring trailing whitespace, which copies of a file often lose
+    for strip in (False, True):
+        for distance in range(max(expected - earliest, last - expected) + 1):
+            for at in (expected - distance, expected + distance) if distance else (expected,):
+                if earliest <= at <= last and _matches(lines, at, old, strip):
+                    return at
+    return None
+
+def _hunk_changes(lines: _lines, hunks: list[_hunk]) -> list[_change]:
+    changes = []
+    earliest = 0
+    for number, hunk in enumerate(hunks, 1):
+        old = [text for kind, text in hunk.lines if kind != "+"]
+        if not old:
+            # Pure insertion after line old_start
+            at = hunk.old_start if hunk.old_count == 0 else hunk.old_start - 1
+            if not earliest <= at <= len(lines):
+                raise ValueError(f"Hunk {number} ({hunk.header}) inserts past the end of the file ({len(lines)} lines).")
+        else:
+            at = _find_hunk(lines, hunk, old, earliest)
+            if at is None:
+                raise ValueError(f"Hunk {number} ({hunk.header}) does not match the file: its context and removed lines "
+                                 f"were not found{' after the previous hunk' if earliest else ''}. Read the file again.")
+        end = at + len(old)
+        new = []
+        index = at
+        for kind, text in hunk.lines:
+            if kind == "+":
+                new.append(text)
+                continue
+            if kind == " ":
+                # Context keeps the file's own line, in case it only matched ignoring trailing whitespace
+                new.append(lines.content(index))
+            index += 1
+        replacement = "".join(line + lines.newline for line in new)
+        if end == len(lines) and new:
+            # The diff says whether the new last line ends with a newline, otherwise the file keeps its own
+            if hunk.old_no_eol or hunk.new_no_eol:
+                final_newline = not hunk.new_no_eol
+            else:
+                final_newline = lines.text.endswith("\n") or not lines.text
+            if not final_newline:
+                replacement = replacement[:-len(lines.newline)]
+            if at == len(lines) and lines.text and not lines.text.endswith("\n"):
+                # Appending after a last line without a newline
+                replacement = lines.newline + replacement
+        start_offset, end_offset = lines.start(at), lines.start(end)
+        changes.append(_change(start_offset, end_offset, replacement, f"hunk {number} ({hunk.header})"))
+        earliest = end
+    return changes
+
+def _normalize(text: str, newline: str) -> str:
+    return text.replace("\r\n", "\n").replace("\n", newline) if newline != "\n" else text
+
+def _edit_changes(lines: _lines, edits: list[text_edit]) -> list[_change]:
+    changes = []
+    text = lines.text
+    for number, edit in enumerate(edits, 1):
+        source = f"edit {number}"
+        new_text = _normalize(edit.new_text, lines.newline)
+        if edit.old_text is not None:
+            if edit.start_line is not None or edit.end_line is not None:
+                raise ValueError(f"Edit {number} has both old_text and a line range, use one.")
+            old_text = _normalize(edit.old_text, lines.newline)
+            if not old_text:
+                raise ValueError(f"Edit {number} has an empty old_text.")
+            offsets = []
+            offset = text.find(old_text)
+            while offset >= 0:
+                offsets.append(offset)
+                offset = text.find(old_text, offset + len(old_text))
+            if not offsets:
+                hint = ""
+                first_line = old_text.strip().split(lines.newline)[0].strip()
+                position = text.find(first_line) if first_line else -1
+                if position >= 0:
+                    hint = f" Its first line appears at line {lines.number(position)}; check the lines after it."
+                raise ValueError(f"Edit {number}: old_text was not found in the file.{hint}")
+            if len(offsets) > 1 and not edit.replace_all:
+                numbers = ", ".join(str(lines.number(offset)) for offset in offsets[:MAX_REPORTED_MATCHES])
+                raise ValueError(f"Edit {number}: old_text appears {len(offsets)} times (lines {numbers}"
+                                 f"{', ...' if len(offsets) > MAX_REPORTED_MATCHES else ''}); "
+                                 "include more surrounding text to make it unique, or set replace_all.")
+            changes += [_change(offset, offset + len(old_text), new_text, source) for offset in offsets]
+        elif edit.start_line is not None:
+            start_line = edit.start_line
+            end_line = edit.end_line if edit.end_line is not None else start_line
+            if not 1 <= start_line <= len(lines) + 1 or not start_line - 1 <= end_line <= len(lines):
+                raise ValueError(f"Edit {number}: lines {start_line}-{end_line} are outside the file ({len(lines)} lines).")
+            start, end = lines.start(start_line - 1), lines.start(end_line)
+            if new_text and not new_text.endswith("\n") and (end < len(text) or text.endswith("\n") or not text):
+                # new_text holds whole lines
+                new_text += lines.newline
+            if start == len(text) and text and not text.endswith("\n") and new_text:
+                new_text = lines.newline + new_text
+            changes.append(_change(start, end, new_text, source))
+        else:
+            raise ValueError(f"Edit {number} needs old_text or start_line.")
+    return changes
+
+def apply_changes(text: str, changes: list[_change]) -> str:
+    """Applies changes made against text, which must not overlap, in one pass"""
+    changes = sorted(changes, key=lambda change: (change.start, change.end))
+    for before, after in zip(changes, changes[1:]):
+        if after.start < before.end:
+            raise ValueError(f"{before.source} and {after.source} change overlapping parts of the file.")
+    parts = []
+    position = 0
+    for change in changes:
+        parts.append(text[position:change.start])
+        parts.append(change.text)
+        position = change.end
+    parts.append(text[position:])
+    return "".join(parts)
+
+def check_base(digest: str, base_sha256: str) -> None:
+    base = base_sha256.strip().lower()
+    if len(base) < MIN_HASH_PREFIX or not re.fullmatch(r"[0-9a-f]+", base):
+        raise ValueError(f"base_sha256 must be a hex SHA-256 digest, or at least its first {MIN_HASH_PREFIX} characters.")
+    if not digest.startswith(base):
+        raise ValueError(f"The file changed since base_sha256 was taken (its sha256 is now {digest}). "
+                         "Read it again and redo the edit against its current content.")
+
+def edit_file(path: str, diff: str = "", edits: list[text_edit] | None = None, base_sha256: str = "") -> edit_result:
+    """
+    Applies a unified diff and/or search/replace and line range edits to a file, and replaces
+    it atomically. Every hunk and edit is located in the file as it was before the call, so
+    they cannot disturb each other's line numbers; changes that overlap are refused.
+
+    Args:
+        path (str): Absolute path of the file to edit.
+        diff (str): Unified diff of the file.
+        edits (list[text_edit] | None): Search/replace and line range edits.
+        base_sha256 (str): SHA-256 (or a prefix) the file must still have, empty to skip the check.
+
+    Returns:
+        edit_result: The counts and the digest of the new content, without stdout.
+    """
+    edits = edits or []
+    if not diff and not edits:
+        raise ValueError("Nothing to do: pass a diff or edits.")
+    hunks = parse_diff(diff) if diff else []
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File '{path}' does not exist, create it with create_file.")
+    with _locks[hash(os.path.realpath(path)) % len(_locks)]:
+        with open(path, "rb") as f:
+            info = os.fstat(f.fileno())
+            data = f.read()
+        if base_sha256:
+            check_base(hashlib.sha256(data).hexdigest(), base_sha256)
+        # Undecodable bytes are kept as they are
+        lines = _lines(data.decode("utf-8", errors="surrogateescape"))
+        changes = _hunk_changes(lines, hunks) + _edit_changes(lines, edits)
+        content = apply_changes(lines.text, changes).encode("utf-8", errors="surrogateescape")
+        write = file_writer.pending_write(path)
+        try:
+            write.write_bytes(content)
+            current = os.stat(path)
+            if (current.st_ino, current.st_size, current.st_mtime_ns) != (info.st_ino, info.st_size, info.st_mtime_ns):
+                raise ValueError("The file was modified while it was being edited, nothing was written. Read it again.")
+            write.commit()
+        except BaseException:
+            write.discard()
+            raise
+    return edit_result(success=True, stdout="", stderr="", returncode=0, current_directory="",
+                       sha256=hashlib.sha256(content).hexdigest(), hunks_applied=len(hunks),
+                       edits_applied=len(edits), bytes_written=len(content))
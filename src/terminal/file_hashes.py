@@ -0,0 +1,457 @@
+import errno
+import hashlib
+import json
+import os
+import stat
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+from pydantic import BaseModel, Field
+from .terminal import command_result
+from . import settings
+from . import walker
+from .settings import env_bool, env_int
+
+# Threads hashing files; hashlib releases the GIL while it digests a buffer, so they use every core
+hash_workers = env_int("MCP_TERMINAL_HASH_WORKERS", min(32, (os.cpu_count() or 1) + 4))
+# Keep digests in the cache directory, so files unchanged since an earlier server are not read again
+hash_cache_enabled = env_bool("MCP_TERMINAL_HASH_CACHE", True)
+# Digests remembered, the least recently used one is dropped beyond this
+hash_cache_entries = env_int("MCP_TERMINAL_HASH_CACHE_ENTRIES", 200000)
+# Algorithms hash_files accepts
+ALGORITHMS = ("sha256", "sha1", "sha512", "md5", "blake2b", "blake2s", "sha3_256")
+# Bytes read from each end of same-size files to tell them apart before hashing them whole
+PARTIAL_HASH_SIZE = 64 * 1024
+# Errors listed in the result, the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+# Read buffer of every hashing thread. Files are read rather than mapped: a file truncated while
+# mapped would kill the server with SIGBUS
+_BUFFER_SIZE = 1024 * 1024
+# Files handed to a worker at once, so cheap files do not cost a future each
+_BATCH_SIZE = 32
+_MAGIC = b"MCPDIGEST1\n"
+_RECORD = struct.Struct("<QQQqqB")  # device, inode, size, mtime_ns, ctime_ns, algorithm index, then the digest
+
+class file_digest(BaseModel):
+    path: str = Field(description="Path relative to the hashed directory")
+    size: int = Field(description="Size in bytes")
+    digest: str = Field(description="Hex digest of the content")
+
+class duplicate_group(BaseModel):
+    digest: str = Field(description="Hex digest shared by the files")
+    size: int = Field(description="Size of each file in bytes")
+    paths: list[str] = Field(description="Files with this content, hard links to the same file included")
+
+class hash_result(command_result):
+    algorithm: str | None = Field(default=None, description="Hash algorithm of the digests")
+    files: list[file_digest] | None = Field(default=None, description="Digest of every hashed file, in walk order")
+    duplicates: list[duplicate_group] | None = Field(default=None, description="Groups of files with the same content, most wasted space first")
+    duplicate_bytes: int | None = Field(default=None, description="Bytes freed by keeping one file of every duplicate group")
+    files_hashed: int | None = Field(default=None, description="Files read in full during this call")
+    files_cached: int | None = Field(default=None, description="Files whose digest came from the cache")
+    partial_hashes: int | None = Field(default=None, description="Same-size files told apart by their first and last bytes only")
+    bytes_hashed: int | None = Field(default=None, description="Bytes read to compute digests")
+    truncated: bool | None = Field(default=None, description="Set when more files matched than limit")
+    errors: list[str] = Field(default_factory=list, description="Files that could not be read, at most 20")
+
+class digest_cache(settings.persistent_cache):
+    """
+    Digests keyed by (algorithm, device, inode, size, modification time, change time), so a file
+    that was not written since it was hashed is never read again. The change time cannot be set
+    back like the modification time can, by tools restoring times over new content. The least
+    recently used entries are dropped past max_entries. The cache is loaded from cache_path on
+    first use and saved back to it.
+    """
+
+    def __init__(self, cache_path: str | None, max_entries: int):
+        super().__init__(cache_path)
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, bytes] = OrderedDict()
+        self.loaded = cache_path is None
+        self.save_on_exit()
+
+    @staticmethod
+    def key(algorithm: str, info: os.stat_result) -> tuple | None:
+        # Without an inode number, two files of the same size and time could not be told apart
+        if not info.st_ino:
+            return None
+        return (algorithm, info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns, info.st_ctime_ns)
+
+    def get(self, algorithm: str, info: os.stat_result) -> bytes | None:
+        key = self.key(algorithm, info)
+        if key is None:
+            return None
+        self._load()
+        with self._lock:
+            digest = self.entries.get(key)
+            if digest is not None:
+                self.entries.move_to_end(key)
+            return digest
+
+    def put(self, algorithm: str, info: os.stat_result, digest: bytes) -> None:
+        key = self.key(algorithm, info)
+        if key is None:
+            return
+        self._load()
+        with self._lock:
+            self.entries[key] = digest
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def _load(self) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                with open(self.cache_path, "rb") as f:
+                    data = f.read()
+                self._parse(data)
+            except (OSError, ValueError, KeyError, struct.error):
+                # A missing or damaged cache only costs reading the files again
+                self.entries.clear()
+
+    def _parse(self, data: bytes) -> None:
+        if not data.startswith(_MAGIC):
+            raise ValueError("Not a digest cache")
+        offset = len(_MAGIC)
+        (length,) = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        algorithms = json.loads(data[offset:offset + length])["algorithms"]
+        offset += length
+        digest_sizes = [hashlib.new(name).digest_size for name in algorithms]
+        entries = self.entries
+        while offset < len(data):
+            device, inode, size, mtime_ns, ctime_ns, index = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            digest = data[offset:offset + digest_sizes[index]]
+            if len(digest) != digest_sizes[index]:
+                raise ValueError("Truncated digest cache")
+            offset += len(digest)
+            entries[(algorithms[index], device, inode, size, mtime_ns, ctime_ns)] = digest
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _snapshot(self) -> list[tuple[tuple, bytes]]:
+        return list(self.entries.items())
+
+    def _write(self, f: BinaryIO, items: list[tuple[tuple, bytes]]) -> None:
+        algorithms = sorted({key[0] for key, _ in items})
+        indexes = {name: index for index, name in enumerate(algorithms)}
+        header = json.dumps({"algorithms": algorithms}).encode()
+        f.write(_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"".join(_RECORD.pack(device, inode, size, mtime_ns, ctime_ns, indexes[algorithm]) + digest
+                         for (algorithm, device, inode, size, mtime_ns, ctime_ns), digest in items))
+
+_cache: digest_cache | None = None
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_buffers = threading.local()
+
+def get_cache() -> digest_cache:
+    global _cache
+    with _pool_lock:
+        if _cache is None:
+            path = os.path.join(settings.cache_dir, "digests.bin") if hash_cache_enabled else None
+            _cache = digest_cache(path, hash_cache_entries)
+        return _cache
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Separate from the tool worker pool, whose threads wait on this one
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix="mcp-terminal-hash")
+        return _pool
+
+def _buffer() -> memoryview:
+    view = getattr(_buffers, "view", None)
+    if view is None:
+        view = _buffers.view = memoryview(bytearray(_BUFFER_SIZE))
+    return view
+
+def _check_regular(info: os.stat_result) -> None:
+    if not stat.S_ISREG(info.st_mode):
+        raise OSError(errno.EINVAL, "Not a regular file")
+
+def _read_digest(path: str, algorithm: str) -> tuple[bytes, os.stat_result, bool]:
+    """
+    Hashes a whole file in large reads, each digested without holding the GIL.
+
+    Returns:
+        tuple: The digest, the status of the file when it was opened, and whether it was left
+        unchanged while it was read (only then may the digest be cached).
+    """
+    hasher = hashlib.new(algorithm)
+    view = _buffer()
+    with open(path, "rb", buffering=0) as f:
+        info = os.fstat(f.fileno())
+        _check_regular(info)
+        while True:
+            read = f.readinto(view)
+            if not read:
+                break
+            hasher.update(view[:read])
+        after = os.fstat(f.fileno())
+    unchanged = (after.st_size, after.st_mtime_ns, after.st_ctime_ns) == (info.st_size, info.st_mtime_ns, info.st_ctime_ns)
+    return hasher.digest(), info, unchanged
+
+def _partial_digest(path: str) -> bytes:
+    # The first and last bytes differ between most same-size files that are not copies
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb", buffering=0) as f:
+        hasher.update(f.read(PARTIAL_HASH_SIZE))
+        f.seek(-PARTIAL_HASH_SIZE, os.SEEK_END)
+        hasher.update(f.read(PARTIAL_HASH_SIZE))
+    return hasher.digest()
+
+class hash_run:
+    """Counters and errors of one hash_files call, updated from the hashing threads"""
+
+    def __init__(self, algorithm: str, use_cache: bool):
+        self.algorithm = algorithm
+        self.cache = get_cache() if use_cache else None
+        self.files_hashed = 0
+        self.files_cached = 0
+        self.partial_hashes = 0
+        self.bytes_hashed = 0
+        self.errors: list[str] = []
+        self.error_count = 0
+        self._lock = threading.Lock()
+
+    def error(self, path: str, error: OSError) -> None:
+        with self._lock:
+            self.error_count += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append(f"{path}: {error.strerror or error}")
+
+    def lookup(self, info: os.stat_result) -> bytes | None:
+        """The cached digest of a file, without counting it as used"""
+        return self.cache.get(self.algorithm, info) if self.cache is not None else None
+
+    def cached(self, info: os.stat_result, digest: bytes | None = None) -> bytes | None:
+        if digest is None:
+            digest = self.lookup(info)
+        if digest is not None:
+            with self._lock:
+                self.files_cached += 1
+        return digest
+
+    def digest(self, path: str) -> bytes | None:
+        try:
+            digest, info, unchanged = _read_digest(path, self.algorithm)
+        except OSError as e:
+            self.error(path, e)
+            return None
+        if unchanged and self.cache is not None:
+            self.cache.put(self.algorithm, info, digest)
+        with self._lock:
+            self.files_hashed += 1
+            self.bytes_hashed += info.st_size
+        return digest
+
+    def partial(self, path: str) -> bytes | None:
+        try:
+            digest = _partial_digest(path)
+        except OSError as e:
+            self.error(path, e)
+            return None
+        with self._lock:
+            self.partial_hashes += 1
+            self.bytes_hashed += 2 * PARTIAL_HASH_SIZE
+        return digest
+
+    def map(self, fn, paths: list[str]) -> list[bytes | None]:
+        """Applies fn to every path on the hash workers, in batches, keeping the order"""
+        if len(paths) <= 1:
+            return [fn(path) for path in paths]
+        batches = [paths[start:start + _BATCH_SIZE] for start in range(0, len(paths), _BATCH_SIZE)]
+        results = []
+        for batch in _get_pool().map(lambda batch: [fn(path) for path in batch], batches):
+            results.extend(batch)
+        return results
+
+    def finish(self, result: hash_result) -> hash_result:
+        if self.cache is not None:
+            self.cache.save_if_due()
+        result.algorithm = self.algorithm
+        result.files_hashed = self.files_hashed
+        result.files_cached = self.files_cached
+        result.bytes_hashed = self.bytes_hashed
+        result.errors = self.errors
+        if self.error_count > len(self.errors):
+            result.errors.append(f"... and {self.error_count - len(self.errors)} more")
+        return result
+
+def check_algorithm(algorithm: str) -> None:
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}', use one of: {', '.join(ALGORITHMS)}.")
+
+def _stat(entry: os.DirEntry) -> os.stat_result:
+    # Directory entries carry no inode number on Windows, which the cache keys on
+    return os.stat(entry.path) if sys.platform == "win32" else entry.stat()
+
+def _files(root: str, pattern: str, recursive: bool, respect_ignore: bool, run: hash_run, limit: int | None = None):
+    """Yields (relative path, absolute path, status) of the regular files to hash, at most limit"""
+    if not os.path.isdir(root):
+        info = os.stat(root)
+        _check_regular(info)
+        yield "", root, info
+        return
+    count = 0
+    for entry in walker.walk(root, pattern, recursive=recursive, respect_ignore=respect_ignore):
+        try:
+            info = _stat(entry)
+            _check_regular(info)
+        except OSError as e:
+            run.error(entry.path, e)
+            continue
+        if limit is not None and count == limit:
+            # One more than limit, to tell the caller there are more
+            yield None
+            return
+        count += 1
+        yield entry.path[len(root):].lstrip(os.sep), entry.path, info
+
+def hash_tree(root: str, pattern: str = "*", recursive: bool = True, algorithm: str = "sha256",
+              respect_ignore: bool = False, use_cache: bool = True, limit: int = 1000) -> hash_result:
+    """
+    Hashes the files below root (or root itself, when it is a file) in walk order, reading
+    only those whose digest is not cached.
+
+    Args:
+        root (str): Absolute path of the directory or file to hash.
+        pattern (str): Glob the names of the hashed files match.
+        recursive (bool): Whether to hash files in subdirectories.
+        algorithm (str): One of ALGORITHMS.
+        respect_ignore (bool): Skip files excluded by .gitignore/.ignore files.
+        use_cache (bool): Take digests of unchanged files from the cache, and add the new ones.
+        limit (int): Most files hashed; truncated is set when more match.
+
+    Returns:
+        hash_result: The digests, with paths relative to root ("" for a file root).
+    """
+    check_algorithm(algorithm)
+    run = hash_run(algorithm, use_cache)
+    files = list(_files(root, pattern, recursive, respect_ignore, run, limit))
+    truncated = bool(files) and files[-1] is None
+    if truncated:
+        files.pop()
+    digests = [run.cached(info) for _, _, info in files]
+    missing = [index for index, digest in enumerate(digests) if digest is None]
+    for index, digest in zip(missing, run.map(run.digest, [files[index][1] for index in missing])):
+        digests[index] = digest
+    result = hash_result(success=True, stdout="", stderr="", returncode=0, current_directory="",
+                         files=[file_digest(path=relative, size=info.st_size, digest=digest.hex())
+                                for (relative, _, info), digest in zip(files, digests) if digest is not None],
+                         truncated=truncated or None)
+    return run.finish(result)
+
+def find_duplicates(root: str, pattern: str = "*", recursive: bool = True, algorithm: str = "sha256",
+                    respect_ignore: bool = False, use_cache: bool = True, limit: int = 1000) -> hash_result:
+    """
+    Finds files with the same content below root, reading as little as possible: files are
+    grouped by size, same-size files by a hash of their first and last PARTIAL_HASH_SIZE bytes,
+    and only files still alike are hashed in full. Empty files are ignored, and hard links to
+    the same file only make a group with another file.
+
+    Args:
+        Same as hash_tree, except limit, the most groups returned.
+
+    Returns:
+        hash_result: The duplicate groups, largest waste first, with paths relative to root.
+    """
+    check_algorithm(algorithm)
+    run = hash_run(algorithm, use_cache)
+    # size -> (device, inode) -> relative paths, the first absolute path of each inode is read
+    by_size: dict[int, dict[tuple[int, int], list[str]]] = {}
+    absolute: dict[tuple[int, int], tuple[str, os.stat_result]] = {}
+    for relative, path, info in _files(root, pattern, recursive, respect_ignore, run):
+        if not info.st_size:
+            continue
+        # Without inode numbers every path stands for a different file
+        inode = (info.st_dev, info.st_ino) if info.st_ino else (path, 0)
+        by_size.setdefault(info.st_size, {}).setdefault(inode, []).append(relative)
+        absolute.setdefault(inode, (path, info))
+    candidates = {size: inodes for size, inodes in by_size.items() if len(inodes) > 1}
+
+    # Digests already known settle whole size groups without reading a byte
+    full: dict[tuple[int, int], bytes] = {}
+    known: dict[tuple[int, int], bytes] = {}
+    unsettled = []
+    for size, inodes in candidates.items():
+        digests = {inode: run.lookup(absolute[inode][1]) for inode in inodes}
+        if all(digests.values()):
+            full.update({inode: run.cached(absolute[inode][1], digest) for inode, digest in digests.items()})
+        else:
+            known.update((inode, digest) for inode, digest in digests.items() if digest is not None)
+            unsettled.append(size)
+
+    # Small files are read in full anyway, larger ones are first compared by their ends
+    to_hash = []
+    partial_inodes = []
+    for size in unsettled:
+        if size <= 2 * PARTIAL_HASH_SIZE:
+            to_hash += candidates[size]
+        else:
+            partial_inodes += candidates[size]
+    partial_groups: dict[tuple[int, bytes], list[tuple[int, int]]] = {}
+    for inode, digest in zip(partial_inodes, run.map(run.partial, [absolute[inode][0] for inode in partial_inodes])):
+        if digest is not None:
+            partial_groups.setdefault((absolute[inode][1].st_size, digest), []).append(inode)
+    for inodes in partial_groups.values():
+        if len(inodes) > 1:
+            to_hash += inodes
+
+    def digest_of(inode: tuple[int, int]) -> bytes | None:
+        path, info = absolute[inode]
+        return run.cached(info, known.get(inode)) if inode in known else run.digest(path)
+
+    for inode, digest in zip(to_hash, run.map(digest_of, to_hash)):
+        if digest is not None:
+            full[inode] = digest
+
+    groups: dict[tuple[int, bytes], list[tuple[int, int]]] = {}
+    for inode, digest in full.items():
+        groups.setdefault((absolute[inode][1].st_size, digest), []).append(inode)
+    duplicates = []
+    for (size, digest), inodes in groups.items():
+        if len(inodes) > 1:
+            paths = sorted(relative for inode in inodes for relative in by_size[size][inode])
+            duplicates.append((size * (len(inodes) - 1), duplicate_group(digest=digest.hex(), size=size, paths=paths)))
+    duplicates.sort(key=lambda item: (-item[0], item[1].paths[0]))
+    result = hash_result(success=True, stdout="", stderr="", returncode=0, current_directory="",
+                         duplicates=[group for _, group in duplicates[:limit]],
+                         duplicate_bytes=sum(wasted for wasted, _ in duplicates),
+                         partial_hashes=run.partial_hashes,
+                         truncated=len(duplicates) > limit or None)
+    return run.finish(result)
+
+def cached_digest(path: str, algorithm: str = "sha256") -> bytes:
+    """Digest of one file, from the cache when the file did not change since it was hashed"""
+    cache = get_cache()
+    digest = cache.get(algorithm, os.stat(path))
+    if digest is None:
+        digest, info, unchanged = _read_digest(path, algorithm)
+        if unchanged:
+            cache.put(algorithm, info, digest)
+    return digest
+
+def shutdown() -> None:
+    global _pool
+    if _cache is not None:
+        _cache.save_if_dirty()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
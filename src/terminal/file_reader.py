@@ -0,0 +1,242 @@
+import array
+import bisect
+import codecs
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+from pydantic import Field
+from .terminal import command_result
+from . import watcher
+
+# read_file returns at most this many bytes unless asked for more
+DEFAULT_MAX_READ_BYTES = 1024 * 1024
+# Files at least this large are mapped instead of being read into memory
+MMAP_THRESHOLD = 1024 * 1024
+# Granularity of the line index: one newline count per block keeps it small for huge files,
+# and finding a line costs a bisect plus a scan of at most one block
+LINE_INDEX_BLOCK_SIZE = 64 * 1024
+# Line indexes kept, the least recently used one is dropped beyond this
+LINE_INDEX_CACHE_SIZE = 32
+
+class read_result(command_result):
+    size: int | None = Field(default=None, description="Size of the whole file in bytes")
+    offset: int | None = Field(default=None, description="Byte offset of the returned content in the file")
+    next_offset: int | None = Field(default=None, description="Byte offset following the returned content, absent at the end of the file")
+    start_line: int | None = Field(default=None, description="Line number of the first returned line, when known")
+    end_line: int | None = Field(default=None, description="Line number of the last returned line, when known")
+    total_lines: int | None = Field(default=None, description="Number of lines in the file, when known")
+    truncated: bool | None = Field(default=None, description="Set when the requested range was cut at max_bytes")
+    sha256: str | None = Field(default=None, description="SHA-256 of the file when the whole of it was returned, the base_sha256 of edit_file")
+
+class file_slice(NamedTuple):
+    data: bytes
+    offset: int               # Byte offset of data in the file
+    size: int                 # Size of the whole file
+    start_line: int | None    # Line number of the first line in data, when known
+    end_line: int | None      # Line number of the last line in data, when known
+    total_lines: int | None   # Number of lines in the file, when the line index was used
+    truncated: bool           # The requested range was cut at max_bytes
+
+    @property
+    def end(self) -> int:
+        return self.offset + len(self.data)
+
+class line_index(NamedTuple):
+    mtime_ns: int
+    size: int
+    block_lines: array.array  # Newlines before the start of each block
+    total_lines: int
+
+_line_indexes: OrderedDict[str, line_index] = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+def _build_line_index(data, st: os.stat_result) -> line_index:
+    block_lines = array.array("Q")
+    lines = 0
+    size = st.st_size
+    for start in range(0, size, LINE_INDEX_BLOCK_SIZE):
+        block_lines.append(lines)
+        lines += data[start:start + LINE_INDEX_BLOCK_SIZE].count(b"\n")
+    # A last line without a trailing newline still counts
+    if size and data[size - 1:size] != b"\n":
+        lines += 1
+    return line_index(st.st_mtime_ns, size, block_lines, lines)
+
+def get_line_index(path: str, data, st: os.stat_result) -> line_index:
+    """Line index of a file, cached until its modification time or size changes"""
+    with _line_indexes_lock:
+        index = _line_indexes.get(path)
+        if index is not None and index.mtime_ns == st.st_mtime_ns and index.size == st.st_size:
+            _line_indexes.move_to_end(path)
+            return index
+    index = _build_line_index(data, st)
+    with _line_indexes_lock:
+        _line_indexes[path] = index
+        _line_indexes.move_to_end(path)
+        while len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return index
+
+def invalidate(changed: list[str], rescan: list[str]) -> None:
+    """Drops the line indexes of files the watcher saw change"""
+    with _line_indexes_lock:
+        if not _line_indexes:
+            return
+        for path in changed:
+            _line_indexes.pop(path, None)
+        if rescan:
+            prefixes = tuple(os.path.join(path, "") for path in rescan)
+            for path in [path for path in _line_indexes if path.startswith(prefixes)]:
+                del _line_indexes[path]
+
+watcher.add_listener(invalidate)
+
+def _line_start(data, index: line_index, line: int) -> int:
+    """Offset of the first byte of a 1-based line, the file size when the file is shorter"""
+    newlines = line - 1
+    if newlines <= 0:
+        return 0
+    block = bisect.bisect_left(index.block_lines, newlines) - 1
+    position = block * LINE_INDEX_BLOCK_SIZE
+    for _ in range(newlines - index.block_lines[block]):
+        position = data.find(b"\n", position)
+        if position == -1:
+            return index.size
+        position += 1
+    return position
+
+def _advance_lines(data, start: int, size: int, count: int, max_end: int) -> tuple[int, int]:
+    """Offset after count lines from start, stopping at max_end; returns (end, complete lines)"""
+    position = start
+    for complete in range(count):
+        if position >= size:
+            return size, complete
+        newline = data.find(b"\n", position, max_end)
+        if newline == -1:
+            # Either the last line has no newline, or the line goes past max_end
+            if max_end >= size:
+                return size, complete + 1
+            return position, complete
+        position = newline + 1
+    return position, count
+
+def _tail_start(data, size: int, count: int, max_bytes: int) -> tuple[int, int]:
+    """Offset where the last count lines begin, found by searching backward; returns (start, lines)"""
+    end = size - 1 if data[size - 1:size] == b"\n" else size
+    lower = max(0, size - max_bytes)
+    position = end
+    for found in range(count):
+        newline = data.rfind(b"\n", lower, position)
+        if newline == -1:
+            if lower == 0 or data[lower - 1:lower] == b"\n":
+                return lower, found + 1
+            if found == 0:
+                return lower, 0  # The last line alone is longer than max_bytes
+            # Drop the line cut by max_bytes
+            return data.find(b"\n", lower, size) + 1, found
+        position = newline
+    return position + 1, count
+
+def _check_arguments(offset, length, start_line, end_line, head, tail) -> None:
+    modes = [offset is not None or length is not None, start_line is not None or end_line is not None,
+             head is not None, tail is not None]
+    if sum(modes) > 1:
+        raise ValueError("Use only one of offset/length, start_line/end_line, head or tail.")
+    for name, value in (("offset", offset), ("length", length)):
+        if value is not None and value < 0:
+            raise ValueError(f"{name} must not be negative.")
+    for name, value in (("start_line", start_line), ("end_line", end_line), ("head", head), ("tail", tail)):
+        if value is not None and value < 1:
+            raise ValueError(f"{name} must be at least 1.")
+    if start_line is not None and end_line is not None and end_line < start_line:
+        raise ValueError("end_line must not be before start_line.")
+
+def read_range(path: str, offset: int | None = None, length: int | None = None,
+               start_line: int | None = None, end_line: int | None = None,
+               head: int | None = None, tail: int | None = None,
+               max_bytes: int = DEFAULT_MAX_READ_BYTES) -> file_slice:
+    """
+    Reads part of a file without loading the rest of it.
+
+    Args:
+        path (str): The file to read.
+        offset (int | None): First byte to read.
+        length (int | None): Number of bytes to read from offset.
+        start_line (int | None): First line to read (1-based).
+        end_line (int | None): Last line to read (inclusive).
+        head (int | None): Read the first head lines.
+        tail (int | None): Read the last tail lines, found by searching backward from the end.
+        max_bytes (int): Largest slice returned; line reads are cut at a line boundary when possible.
+
+    Returns:
+        file_slice: The bytes read and where they are in the file.
+    """
+    _check_arguments(offset, length, start_line, end_line, head, tail)
+    max_bytes = max(1, max_bytes)
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if size == 0:
+            return file_slice(b"", 0, 0, None, None, 0, False)
+        if size >= MMAP_THRESHOLD:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+        try:
+            return _slice(path, data, st, offset, length, start_line, end_line, head, tail, max_bytes)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+def _slice(path, data, st, offset, length, start_line, end_line, head, tail, max_bytes) -> file_slice:
+    size = st.st_size
+    if tail is not None:
+        start, lines = _tail_start(data, size, tail, max_bytes)
+        truncated = start > 0 and (lines < tail or data[start - 1:start] != b"\n")
+        return file_slice(data[start:size], start, size, None, None, None, truncated)
+
+    if offset is None and length is None:
+        # Line reads, reading the whole file is one too
+        total_lines = None
+        first_line = 1
+        start = 0
+        if start_line is not None and start_line > 1:
+            index = get_line_index(path, data, st)
+            total_lines = index.total_lines
+            first_line = start_line
+            start = _line_start(data, index, start_line)
+        count = head if head is not None else (end_line - first_line + 1 if end_line is not None else size)
+        end, lines = _advance_lines(data, start, size, count, min(size, start + max_bytes))
+        truncated = False
+        if lines == 0 and start < size:
+            # A single line longer than max_bytes
+            end, lines, truncated = start + max_bytes, 1, True
+        elif lines < count and end < size:
+            truncated = True
+        last_line = first_line + lines - 1 if lines else None
+        return file_slice(data[start:end], start, size, first_line if lines else None, last_line, total_lines, truncated)
+
+    start = min(offset or 0, size)
+    end = size if length is None else min(size, start + length)
+    truncated = end - start > max_bytes
+    if truncated:
+        end = start + max_bytes
+    return file_slice(data[start:end], start, size, None, None, None, truncated)
+
+def decode_slice(file_part: file_slice) -> tuple[str, int, int]:
+    """
+    Decodes a slice as UTF-8, dropping a character split by the slice edges.
+    Returns (text, offset of the first decoded byte, offset after the last decoded byte).
+    """
+    data = file_part.data
+    front = 0
+    if file_part.offset:
+        # Continuation bytes belong to a character that started before the slice
+        while front < min(3, len(data)) and 0x80 <= data[front] < 0xC0:
+            front += 1
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    text = decoder.decode(data[front:], final=file_part.end >= file_part.size)
+    pending = len(decoder.getstate()[0])
+    return text, file_part.offset + front, file_part.end - pending
@@ -0,0 +1,271 @@
+import atexit
+import os
+import stat
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pydantic import Field
+from .terminal import command_result
+from .settings import env_bool, env_int, env_float
+
+# Files kept open for append_to_file, the least recently used one is closed beyond this
+append_handle_limit = env_int("MCP_TERMINAL_APPEND_HANDLES", 16)
+# Seconds an append handle stays open without being used
+append_idle_timeout = env_float("MCP_TERMINAL_APPEND_IDLE_TIMEOUT", 5)
+# Flush written files to disk before they replace their target
+fsync_writes = env_bool("MCP_TERMINAL_WRITE_FSYNC", True)
+# Seconds an unfinished chunked write is kept after its last chunk
+chunked_write_timeout = env_float("MCP_TERMINAL_CHUNKED_WRITE_TIMEOUT", 600)
+
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+class write_result(command_result):
+    write_id: str | None = Field(default=None, description="Pass back with the next chunk of an unfinished chunked write")
+    bytes_written: int | None = Field(default=None, description="Bytes written to the file so far")
+
+def _encode(content: str) -> bytes:
+    # Same bytes as a file opened in text mode with UTF-8
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    return content.encode("utf-8")
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _open(path: str, flags: int) -> int:
+    """os.open, creating the missing parent directories only when the first attempt says so"""
+    try:
+        return os.open(path, flags | _O_BINARY, 0o666)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return os.open(path, flags | _O_BINARY, 0o666)
+
+def _fsync_directory(directory: str) -> None:
+    """Makes a rename in directory durable; not possible (nor needed) on Windows"""
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class pending_write:
+    """
+    A file written to a temporary sibling and moved over its target once complete,
+    so readers only ever see the old or the whole new content.
+    """
+
+    def __init__(self, path: str):
+        self.requested = path
+        # Writing through a symlink replaces the file it points to, not the link
+        self.path = os.path.realpath(path) if os.path.islink(path) else path
+        if os.path.isdir(self.path):
+            raise IsADirectoryError(f"'{self.path}' is a directory.")
+        directory, name = os.path.split(self.path)
+        self.temporary = os.path.join(directory, f".{name}.mcp-tmp-{uuid.uuid4().hex[:12]}")
+        self.fd = _open(self.temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        self.bytes_written = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(self, content: str) -> None:
+        self.write_bytes(_encode(content))
+
+    def write_bytes(self, data: bytes) -> None:
+        _write_all(self.fd, data)
+        self.bytes_written += len(data)
+        self.last_used = time.monotonic()
+
+    def commit(self) -> None:
+        if fsync_writes:
+            os.fsync(self.fd)
+        fd, self.fd = self.fd, -1
+        os.close(fd)
+        try:
+            # A replaced file keeps its permissions
+            os.chmod(self.temporary, stat.S_IMODE(os.stat(self.path).st_mode))
+        except FileNotFoundError:
+            pass
+        append_handles.release(self.path)
+        os.replace(self.temporary, self.path)
+        if fsync_writes:
+            _fsync_directory(os.path.dirname(self.path))
+
+    def discard(self) -> None:
+        if self.fd >= 0:
+            fd, self.fd = self.fd, -1
+            os.close(fd)
+        try:
+            os.remove(self.temporary)
+        except OSError:
+            pass
+
+_writes: dict[str, pending_write] = {}
+_writes_lock = threading.Lock()
+
+def _expire_writes() -> None:
+    deadline = time.monotonic() - chunked_write_timeout
+    with _writes_lock:
+        expired = [write_id for write_id, write in _writes.items() if write.last_used < deadline]
+        expired = [_writes.pop(write_id) for write_id in expired]
+    for write in expired:
+        with write.lock:
+            write.discard()
+
+def write_file(path: str, content: str, write_id: str | None = None, final: bool = True) -> tuple[str | None, int]:
+    """
+    Writes content to path atomically, in one call or in chunks over several.
+
+    Args:
+        path (str): Absolute path of the file to write.
+        content (str): The content, or the next chunk of it.
+        write_id (str | None): Id returned for the previous chunk, None starts a new write.
+        final (bool): Whether this is the last chunk; the file is replaced only then.
+
+    Returns:
+        tuple[str | None, int]: The id to pass with the next chunk (None once final) and the bytes written so far.
+    """
+    _expire_writes()
+    if write_id:
+        with _writes_lock:
+            write = _writes.get(write_id)
+        if write is None:
+            raise ValueError(f"Unknown write id '{write_id}', it was finished, discarded or expired.")
+        if os.path.abspath(path) != os.path.abspath(write.requested):
+            raise ValueError(f"Write '{write_id}' is for '{write.requested}', not '{path}'.")
+    else:
+        write = pending_write(path)
+        write_id = uuid.uuid4().hex
+    with write.lock:
+        try:
+            if write.fd < 0:
+                raise ValueError(f"Write '{write_id}' was finished or discarded.")
+            write.write(content)
+            if final:
+                write.commit()
+        except BaseException:
+            write.discard()
+            with _writes_lock:
+                _writes.pop(write_id, None)
+            raise
+    with _writes_lock:
+        if final:
+            _writes.pop(write_id, None)
+            return None, write.bytes_written
+        _writes[write_id] = write
+    return write_id, write.bytes_written
+
+class append_handle_cache:
+    """
+    Files kept open for appending, least recently used first.
+
+    Writes are unbuffered, so other readers see every append at once; keeping the descriptor
+    only saves the open, close and directory checks of each call. Before reusing one, the path
+    is checked to still be the same file, since it may have been deleted, moved or replaced
+    since. Handles unused for idle_timeout seconds are closed in the background.
+    """
+
+    def __init__(self, limit: int, idle_timeout: float):
+        self.limit = limit
+        self.idle_timeout = idle_timeout
+        # path -> (fd, device, inode, last used)
+        self._handles: OrderedDict[str, tuple[int, int, int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+
+    def append(self, path: str, data: bytes) -> None:
+        with self._lock:
+            entry = self._handles.pop(path, None)
+            if entry is not None:
+                try:
+                    info = os.stat(path)
+                    stale = (info.st_dev, info.st_ino) != entry[1:3]
+                except OSError:
+                    stale = True
+                if stale:
+                    os.close(entry[0])
+                    entry = None
+            if entry is None:
+                fd = _open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+                info = os.fstat(fd)
+                entry = (fd, info.st_dev, info.st_ino, 0.0)
+            try:
+                _write_all(entry[0], data)
+            except BaseException:
+                os.close(entry[0])
+                raise
+            now = time.monotonic()
+            self._handles[path] = (*entry[:3], now)
+            while len(self._handles) > self.limit:
+                os.close(self._handles.popitem(last=False)[1][0])
+            self._close_idle(now)
+            self._schedule()
+
+    def _close_idle(self, now: float) -> None:
+        while self._handles:
+            path, (fd, _, _, last_used) = next(iter(self._handles.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._handles[path]
+            os.close(fd)
+
+    def _schedule(self) -> None:
+        if self._timer is None and self._handles:
+            self._timer = threading.Timer(self.idle_timeout, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._close_idle(time.monotonic())
+            self._schedule()
+
+    def release(self, path: str) -> None:
+        """Closes the handles of path and of files below it, before it is deleted, moved or replaced"""
+        with self._lock:
+            if not self._handles:
+                return
+            prefix = os.path.join(path, "")
+            for name in [name for name in self._handles if name == path or name.startswith(prefix)]:
+                os.close(self._handles.pop(name)[0])
+
+    def close_all(self) -> None:
+        """Flushes every open file to disk and closes it"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._handles:
+                fd = self._handles.popitem(last=False)[1][0]
+                try:
+                    os.fsync(fd)
+                except OSError:
+                    pass
+                os.close(fd)
+
+append_handles = append_handle_cache(append_handle_limit, append_idle_timeout)
+
+def append_file(path: str, content: str, add_newline: bool = True) -> None:
+    append_handles.append(path, _encode("\n" + content if add_newline else content))
+
+def shutdown() -> None:
+    """Closes the append handles and removes the temporary files of unfinished chunked writes"""
+    append_handles.close_all()
+    with _writes_lock:
+        writes = list(_writes.values())
+        _writes.clear()
+    for write in writes:
+        with write.lock:
+            write.discard()
+
+atexit.register(shutdown)
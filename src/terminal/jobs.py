@@ -0,0 +1,245 @@
+import asyncio
+import atexit
+import contextvars
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import time
+from pydantic import Field
+from .terminal import command_result, _prepare_command, _shell_argv
+from .decoding import output_decoder
+
+# Output kept per job, older output is dropped once a job prints more than this
+JOB_BUFFER_SIZE = 1024 * 1024
+# Finished jobs are forgotten after this many seconds, or sooner when there are too many of them
+FINISHED_JOB_TTL = 60 * 60
+MAX_FINISHED_JOBS = 32
+_READ_CHUNK_SIZE = 64 * 1024
+# Jobs belong to the client session that started it; stateless HTTP servers have no sessions
+# to tell clients apart and share them (set by __main__)
+shared = False
+
+class job_result(command_result):
+    job_id: str = Field(default="", description="Identifier of the background job")
+    status: str = Field(default="unknown", description="running, exited or failed")
+    next_cursor: int = Field(default=0, description="Pass this cursor to get_job_output to fetch only newer output")
+    dropped_bytes: int = Field(default=0, description="Output between the requested cursor and the oldest buffered byte that was discarded")
+
+class ring_buffer:
+    """Bounded byte buffer addressed by absolute offsets, so readers can resume from a cursor"""
+
+    def __init__(self, capacity : int = JOB_BUFFER_SIZE):
+        self.capacity = capacity
+        self.data = bytearray()
+        self.start = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.data)
+
+    def write(self, chunk : bytes) -> None:
+        self.data.extend(chunk)
+        overflow = len(self.data) - self.capacity
+        if overflow > 0:
+            del self.data[:overflow]
+            self.start += overflow
+
+    def read(self, cursor : int, max_bytes : int) -> tuple[bytes, int, int]:
+        """Returns (data, next cursor, bytes dropped before the data)"""
+        dropped = max(0, self.start - cursor)
+        cursor = max(cursor, self.start)
+        offset = cursor - self.start
+        chunk = bytes(self.data[offset:offset + max_bytes])
+        if offset + max_bytes < len(self.data):
+            # More output follows, stop at a line boundary so no character is split
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                chunk = chunk[:newline + 1]
+        return chunk, cursor + len(chunk), dropped
+
+class background_job:
+    def __init__(self, job_id : str, command : str, cwd : str, process : asyncio.subprocess.Process, owner : str = ""):
+        self.job_id = job_id
+        self.owner = owner
+        self.command = command
+        self.cwd = cwd
+        self.process = process
+        self.output = ring_buffer()
+        self.started_at = time.time()
+        self.finished_at : float | None = None
+        self.done = asyncio.Event()
+        self.error = ""
+        self.encoding : str | None = None
+        self._task = asyncio.create_task(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            while True:
+                chunk = await self.process.stdout.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.output.write(chunk)
+            await self.process.wait()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+            self.done.set()
+
+    @property
+    def status(self) -> str:
+        if not self.done.is_set():
+            return "running"
+        return "failed" if self.error else "exited"
+
+    @property
+    def returncode(self) -> int | None:
+        return self.process.returncode
+
+    def result(self, stdout : str = "", next_cursor : int | None = None, dropped_bytes : int = 0) -> job_result:
+        returncode = self.returncode
+        return job_result(
+            success = self.status == "running" or returncode == 0,
+            stdout = stdout,
+            stderr = self.error,
+            returncode = returncode if returncode is not None else 0,
+            current_directory = self.cwd,
+            job_id = self.job_id,
+            status = self.status,
+            next_cursor = self.output.end if next_cursor is None else next_cursor,
+            dropped_bytes = dropped_bytes
+        )
+
+    def describe(self) -> str:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        code = "" if self.returncode is None else f" (code {self.returncode})"
+        return f"{self.job_id}  {self.status}{code}  {elapsed:.1f}s  {self.command}"
+
+_jobs : dict[str, background_job] = {}
+_job_ids = itertools.count(1)
+
+def _collect_garbage() -> None:
+    """Forget finished jobs that expired, and the oldest ones beyond MAX_FINISHED_JOBS"""
+    now = time.time()
+    finished = sorted((job for job in list(_jobs.values()) if job.finished_at is not None), key=lambda job: job.finished_at)
+    excess = len(finished) - MAX_FINISHED_JOBS
+    for index, job in enumerate(finished):
+        if index < excess or now - job.finished_at > FINISHED_JOB_TTL:
+            _jobs.pop(job.job_id, None)
+
+async def start_job(command : str, cwd : str, env : dict[str, str] | None = None, owner : str = "") -> background_job:
+    """
+    Starts a command in the background. Stdout and stderr are merged into one buffer.
+
+    Args:
+        command (str): The command to run.
+        cwd (str): The working directory of the command.
+        env (dict[str, str] | None): Environment of the command (default: the server's environment).
+        owner (str): The session the job belongs to, only that session can reach it (see get_job).
+
+    Returns:
+        background_job: The started job.
+    """
+    _collect_garbage()
+    # Spawned from an empty context: the loop callbacks of the process and the output pump would
+    # otherwise keep the request's context, and with it the client session, alive as long as the job runs
+    job = await asyncio.create_task(_spawn(command, cwd, env, "" if shared else owner), context=contextvars.Context())
+    _jobs[job.job_id] = job
+    return job
+
+async def _spawn(command : str, cwd : str, env : dict[str, str] | None, owner : str) -> background_job:
+    _, command_str = _prepare_command(command)
+    kwargs = {}
+    if sys.platform == "win32":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        # Own process group so signals reach everything the shell starts
+        kwargs["start_new_session"] = True
+    process = await asyncio.create_subprocess_exec(*_shell_argv(command_str),
+                                                   env=os.environ if env is None else env,
+                                                   stdin=subprocess.DEVNULL,
+                                                   stdout=subprocess.PIPE,
+                                                   stderr=subprocess.STDOUT,
+                                                   cwd=cwd,
+                                                   **kwargs)
+    return background_job(str(next(_job_ids)), command, cwd, process, owner)
+
+def get_job(job_id : str, owner : str = "") -> background_job:
+    job = _jobs.get(job_id)
+    # A job of another session is reported like a missing one
+    if job is None or job.owner != ("" if shared else owner):
+        raise ValueError(f"Job '{job_id}' does not exist or was already cleaned up.")
+    return job
+
+def list_jobs(owner : str = "") -> list[background_job]:
+    _collect_garbage()
+    owner = "" if shared else owner
+    return [job for job in list(_jobs.values()) if job.owner == owner]
+
+def read_job_output(job : background_job, cursor : int, max_bytes : int) -> job_result:
+    data, next_cursor, dropped = job.output.read(cursor, max_bytes)
+    # The encoding is detected on the first read and reused for the later ones
+    decoder = output_decoder(job.encoding)
+    text = decoder.decode(data, final=True)
+    if data:
+        job.encoding = None if decoder.mismatch else decoder.encoding
+    return job.result(text, next_cursor, dropped)
+
+async def wait_job(job : background_job, timeout : float) -> bool:
+    """Waits until the job finishes or the timeout expires, returns whether it finished"""
+    try:
+        await asyncio.wait_for(job.done.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+def signal_job(job : background_job, signal_name : str) -> bool:
+    """Sends a signal (e.g. SIGTERM, SIGINT, SIGKILL) to the job's process group, returns False if it already finished"""
+    if job.returncode is not None:
+        return False
+    name = signal_name.upper()
+    if not name.startswith("SIG"):
+        name = "SIG" + name
+    if sys.platform == "win32":
+        # No POSIX signals on Windows, terminate the shell process instead
+        if name in ("SIGTERM", "SIGKILL"):
+            job.process.kill()
+            return True
+    sig = getattr(signal, name, None)
+    if not isinstance(sig, signal.Signals):
+        raise ValueError(f"Unknown signal '{signal_name}'.")
+    if sys.platform == "win32":
+        job.process.send_signal(sig)
+        return True
+    try:
+        os.killpg(job.process.pid, sig)
+    except ProcessLookupError:
+        return False
+    return True
+
+def kill_running_jobs() -> None:
+    """Jobs run in their own process group and would outlive the server otherwise"""
+    for job in list(_jobs.values()):
+        if job.returncode is None:
+            try:
+                signal_job(job, "SIGKILL")
+            except (OSError, ValueError):
+                pass
+
+def discard_session_jobs(owner : str) -> None:
+    """Kills and forgets the jobs of a client session that went away, nobody can reach them anymore"""
+    if shared:
+        return
+    for job in list(_jobs.values()):
+        if job.owner != owner:
+            continue
+        _jobs.pop(job.job_id, None)
+        if job.returncode is None:
+            try:
+                signal_job(job, "SIGKILL")
+            except (OSError, ValueError):
+                pass
+
+atexit.register(kill_running_jobs)
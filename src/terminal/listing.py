@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import heapq
+import json
+import os
+import stat
+from datetime import datetime
+from typing import NamedTuple
+from pydantic import BaseModel, Field, model_serializer
+from .terminal import command_result
+from . import walker
+
+# Entries returned per call unless the caller asks for another page size
+DEFAULT_PAGE_SIZE = 1000
+# After a page, find_files keeps counting matches up to this many to report a total
+TOTAL_COUNT_LIMIT = 100_000
+OUTPUT_FORMATS = ("text", "records")
+
+class directory_entry(BaseModel):
+    path: str = Field(description="Entry name, or path relative to the current directory")
+    type: str = Field(description="file, directory or other")
+    symlink: bool | None = Field(default=None, description="Set when the entry is a symbolic link")
+    size: int | None = Field(default=None, description="Size in bytes, 0 for directories")
+    modified: str | None = Field(default=None, description="Last modification time")
+    mode: str | None = Field(default=None, description="Permissions, as shown by ls -l")
+
+    @model_serializer(mode="wrap")
+    def _drop_unset(self, handler):
+        data = handler(self)
+        return {key: value for key, value in data.items() if value is not None}
+
+class listing_result(command_result):
+    entries: list[directory_entry] | None = Field(default=None, description="The entries of this page when output_format is records")
+    next_cursor: str | None = Field(default=None, description="Pass as cursor to get the next page, absent on the last page")
+    total: int | None = Field(default=None, description="Number of entries in the whole listing")
+    total_is_lower_bound: bool | None = Field(default=None, description="Set when counting stopped early and there are more than total entries")
+
+class page(NamedTuple):
+    entries: list[os.DirEntry]
+    offset: int
+    total: int
+    total_is_lower_bound: bool
+    next_cursor: str | None
+
+# ---------------------------------------------------------------------------
+# Cursors
+# ---------------------------------------------------------------------------
+
+def _fingerprint(query: dict) -> str:
+    return hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()[:12]
+
+def encode_cursor(query: dict, after: str, offset: int) -> str:
+    """
+    Opaque continuation token. It holds the last entry returned rather than a position,
+    so entries created or deleted between calls do not shift the following pages.
+    """
+    payload = json.dumps({"q": _fingerprint(query), "after": after, "offset": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, query: dict) -> tuple[str | None, int]:
+    """Returns (last entry of the previous page, entries before this page), (None, 0) without a cursor"""
+    if not cursor:
+        return None, 0
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        fingerprint, after, offset = data["q"], data["after"], int(data["offset"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if fingerprint != _fingerprint(query):
+        raise ValueError("The cursor belongs to a different listing, repeat the call without it.")
+    return after, offset
+
+def check_page_arguments(limit: int, output_format: str) -> None:
+    if limit < 1:
+        raise ValueError("limit must be at least 1.")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of: {', '.join(OUTPUT_FORMATS)}.")
+
+# ---------------------------------------------------------------------------
+# Pages
+# ---------------------------------------------------------------------------
+
+def _entry_name(entry: os.DirEntry) -> str:
+    return entry.name
+
+def directory_page(entries, query: dict, limit: int, after: str | None, offset: int) -> page:
+    """
+    The next page of one directory, sorted by name.
+
+    The entries are streamed through a bounded heap, so memory depends on limit rather
+    than on the size of the directory, and the total is counted in the same pass.
+    """
+    total = 0
+
+    def remaining():
+        nonlocal total
+        for entry in entries:
+            total += 1
+            if after is None or entry.name > after:
+                yield entry
+
+    selected = heapq.nsmallest(limit + 1, remaining(), key=_entry_name)
+    more = len(selected) > limit
+    selected = selected[:limit]
+    next_cursor = encode_cursor(query, selected[-1].name, offset + limit) if more else None
+    return page(selected, offset, total, False, next_cursor)
+
+def walk_page(entries, query: dict, limit: int, offset: int, root: str, count_limit: int = TOTAL_COUNT_LIMIT) -> page:
+    """
+    The next page of a walk started after the cursor's entry (see walker.walk start_after).
+    The rest of the walk is only counted, up to count_limit entries.
+    """
+    entries = iter(entries)
+    selected = []
+    for entry in entries:
+        selected.append(entry)
+        if len(selected) >= limit:
+            break
+    remaining = 0
+    for _ in entries:
+        remaining += 1
+        if remaining >= count_limit:
+            break
+    lower_bound = remaining >= count_limit
+    next_cursor = None
+    if remaining:
+        after = walker.relative_path(selected[-1].path, root)
+        next_cursor = encode_cursor(query, after, offset + len(selected))
+    return page(selected, offset, offset + len(selected) + remaining, lower_bound, next_cursor)
+
+def describe_entry(entry: os.DirEntry, path: str, details: bool = False) -> directory_entry:
+    """Record for an entry; only details need a stat call"""
+    is_dir = entry.is_dir()
+    record = directory_entry(
+        path = path,
+        type = "directory" if is_dir else "file" if entry.is_file() else "other",
+        symlink = entry.is_symlink() or None
+    )
+    if details:
+        try:
+            stat_info = entry.stat()
+        except OSError:
+            # Broken symlink, describe the link itself
+            stat_info = entry.stat(follow_symlinks=False)
+        record.size = stat_info.st_size if not is_dir else 0
+        record.modified = datetime.fromtimestamp(stat_info.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+        record.mode = stat.filemode(stat_info.st_mode)
+    return record
+
+def page_summary(result_page: page, noun: str = "entries") -> str:
+    """One line telling which part of the listing was returned and how to get the rest"""
+    total = f"more than {result_page.total:,}" if result_page.total_is_lower_bound else f"{result_page.total:,}"
+    if not result_page.entries:
+        return f"No more {noun} ({total} in total)."
+    first = result_page.offset + 1
+    last = result_page.offset + len(result_page.entries)
+    summary = f"Showing {noun} {first:,}-{last:,} of {total}."
+    if result_page.next_cursor:
+        summary += f' Pass cursor="{result_page.next_cursor}" to get the next page.'
+    return summary
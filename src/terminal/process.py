@@ -0,0 +1,175 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import NamedTuple
+from . import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PIPE_LIMIT = 64 * 1024
+
+class process_usage(NamedTuple):
+    wall_time: float
+    cpu_time: float | None
+    peak_rss: int | None
+
+def _limited_argv(argv : list[str]) -> list[str]:
+    """
+    argv run under the configured rlimits, or argv itself when no limit is set.
+    A small shell sets the limits and execs the command: a preexec_fn runs Python between
+    fork and exec, which can deadlock on a lock held by another thread of the server.
+    """
+    if resource is None:
+        return argv
+    limits = []
+    if settings.cpu_time_limit:
+        limits.append(f"ulimit -t {settings.cpu_time_limit}")
+    if settings.memory_limit_mb:
+        # Kilobytes
+        limits.append(f"ulimit -v {settings.memory_limit_mb * 1024}")
+    if settings.file_size_limit_mb:
+        # 512-byte blocks, as POSIX shells count them
+        limits.append(f"ulimit -f {settings.file_size_limit_mb * 2048}")
+    if not limits:
+        return argv
+    return ["/bin/sh", "-c", " && ".join(limits) + ' && exec "$@"', "sh", *argv]
+
+async def _pipe_reader(loop : asyncio.AbstractEventLoop, pipe) -> tuple[asyncio.StreamReader, asyncio.BaseTransport]:
+    reader = asyncio.StreamReader(limit=_PIPE_LIMIT, loop=loop)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop), pipe)
+    return reader, transport
+
+async def _wait4(pid : int) -> tuple[int, int, object]:
+    """Reap a child without blocking the loop, returning (pid, status, rusage) like os.wait4"""
+    loop = asyncio.get_running_loop()
+    pidfd = None
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+    if pidfd is None:
+        return await loop.run_in_executor(None, os.wait4, pid, 0)
+    try:
+        # The pidfd becomes readable once the process exits
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(pidfd)
+        return os.wait4(pid, 0)
+    finally:
+        os.close(pidfd)
+
+def _own_peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+
+def _rusage_to_usage(wall_time : float, rusage, rss_floor : int) -> process_usage:
+    # The kernel attributes the parent's memory to a freshly forked child, so a peak
+    # not above the server's own peak says nothing about the command itself
+    peak_rss = None
+    if rusage.ru_maxrss > rss_floor:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    return process_usage(wall_time, rusage.ru_utime + rusage.ru_stime, peak_rss)
+
+class spawned_process:
+    """
+    A child process running in its own process group, with async pipes.
+
+    On POSIX the child is reaped with wait4 so its CPU time and peak RSS
+    (including the processes it waited for) can be reported.
+    """
+
+    def __init__(self):
+        self.pid = 0
+        self.stdout : asyncio.StreamReader | None = None
+        self.stderr : asyncio.StreamReader | None = None
+        self.returncode : int | None = None
+        self.usage : process_usage | None = None
+        self._popen : subprocess.Popen | None = None
+        self._process : asyncio.subprocess.Process | None = None
+        self._transports : list[asyncio.BaseTransport] = []
+        self._started = 0.0
+        self._rss_floor = 0
+
+    @classmethod
+    async def start(cls, argv : list[str], cwd : str, env = None, merge_stderr : bool = False) -> "spawned_process":
+        self = cls()
+        env = os.environ if env is None else env
+        stderr = subprocess.STDOUT if merge_stderr else subprocess.PIPE
+        self._started = time.perf_counter()
+        if sys.platform == "win32":
+            self._process = await asyncio.create_subprocess_exec(*argv,
+                                                                 env=env,
+                                                                 stdin=subprocess.DEVNULL,
+                                                                 stdout=subprocess.PIPE,
+                                                                 stderr=stderr,
+                                                                 cwd=cwd,
+                                                                 creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+            self.pid = self._process.pid
+            self.stdout = self._process.stdout
+            self.stderr = self._process.stderr
+            return self
+
+        # Own session so the whole tree can be killed, and so asyncio's child watcher does not reap it
+        self._rss_floor = _own_peak_rss()
+        self._popen = subprocess.Popen(_limited_argv(argv),
+                                       env=env,
+                                       stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE,
+                                       stderr=stderr,
+                                       cwd=cwd,
+                                       start_new_session=True)
+        self.pid = self._popen.pid
+        loop = asyncio.get_running_loop()
+        try:
+            self.stdout, transport = await _pipe_reader(loop, self._popen.stdout)
+            self._transports.append(transport)
+            if not merge_stderr:
+                self.stderr, transport = await _pipe_reader(loop, self._popen.stderr)
+                self._transports.append(transport)
+        except BaseException:
+            self.kill_tree()
+            await self.wait()
+            self.close()
+            raise
+        return self
+
+    async def wait(self) -> int:
+        """Waits for the process to exit, sets returncode and usage"""
+        if self.returncode is not None:
+            return self.returncode
+        if self._process is not None:
+            self.returncode = await self._process.wait()
+            self.usage = process_usage(time.perf_counter() - self._started, None, None)
+            return self.returncode
+        _, status, rusage = await _wait4(self.pid)
+        self.usage = _rusage_to_usage(time.perf_counter() - self._started, rusage, self._rss_floor)
+        self.returncode = os.waitstatus_to_exitcode(status)
+        # Let Popen know the child is gone so it never waits on a recycled pid
+        self._popen.returncode = self.returncode
+        return self.returncode
+
+    def kill_tree(self) -> None:
+        """Kills the process and everything in its process group"""
+        if sys.platform == "win32":
+            if self._process is not None and self._process.returncode is None:
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(self.pid)], capture_output=True)
+            return
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def close(self) -> None:
+        for transport in self._transports:
+            transport.close()
+        self._transports.clear()
@@ -0,0 +1,330 @@
+import mmap
+import os
+import re
+import sys
+from collections import deque
+from typing import NamedTuple
+from .settings import env_int
+from . import walker
+
+# Files at least this large are scanned through mmap instead of being read into memory
+MMAP_THRESHOLD = 1024 * 1024
+# Bytes sniffed for NUL to decide whether a file is binary
+BINARY_SNIFF_SIZE = 8192
+# Lines longer than this are shortened in the results (minified files, data dumps)
+MAX_LINE_LENGTH = 500
+# Below this many candidate files the search runs in the calling thread
+PARALLEL_THRESHOLD = 256
+_BATCH_SIZE = 64
+
+search_processes = env_int("MCP_TERMINAL_SEARCH_PROCESSES", os.cpu_count() or 1)
+
+class search_match(NamedTuple):
+    path: str
+    line_number: int
+    line: str
+    is_context: bool
+
+class search_outcome(NamedTuple):
+    matches: list[search_match]
+    match_count: int
+    files_scanned: int
+    truncated: bool
+
+class _matcher(NamedTuple):
+    text_pattern: re.Pattern
+    bytes_pattern: re.Pattern | None
+    # Literal ASCII queries match UTF-8 bytes exactly; regexes only do on pure ASCII content
+    # since "." or [^x] would otherwise match a single byte of a multi-byte character
+    bytes_always_exact: bool
+    # Literal ASCII query (lowercased when case-insensitive), searched with bytes.find
+    literal: bytes | None
+    case_sensitive: bool
+    context_lines: int
+
+def _compile(search_text: str, use_regex: bool, case_sensitive: bool, context_lines: int) -> _matcher:
+    flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+    source = search_text if use_regex else re.escape(search_text)
+    bytes_pattern = re.compile(source.encode(), flags) if search_text.isascii() else None
+    literal = None
+    if not use_regex and search_text.isascii() and search_text:
+        literal = (search_text if case_sensitive else search_text.lower()).encode()
+    return _matcher(re.compile(source, flags), bytes_pattern, not use_regex, literal, case_sensitive, context_lines)
+
+# ---------------------------------------------------------------------------
+# Traversal
+# ---------------------------------------------------------------------------
+
+def iter_candidate_files(root: str, file_pattern: str = "*", recursive: bool = True, respect_ignore: bool = True,
+                         ignore_patterns: list[str] | None = None):
+    """Yield files under root matching file_pattern, in a stable (sorted) order"""
+    for entry in walker.walk(root, file_pattern, recursive=recursive, respect_ignore=respect_ignore,
+                             ignore_patterns=ignore_patterns):
+        yield entry.path
+
+# ---------------------------------------------------------------------------
+# Scanning
+# ---------------------------------------------------------------------------
+
+def _is_binary(data) -> bool:
+    return b"\0" in data[:BINARY_SNIFF_SIZE]
+
+def _shorten(line: str) -> str:
+    return line if len(line) <= MAX_LINE_LENGTH else line[:MAX_LINE_LENGTH] + "..."
+
+def _scan_text(path: str, text: str, matcher: _matcher, limit: int) -> tuple[list[search_match], int]:
+    """Find matching lines in decoded text. Only matching lines are split, not the whole file."""
+    results = []
+    count = 0
+    line_number = 1
+    position = 0
+    lines_cache = None
+    last_line_start = -1
+    for match in matcher.text_pattern.finditer(text):
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        if line_start == last_line_start:
+            continue  # Several matches on the same line
+        line_number += text.count("\n", position, line_start)
+        position = line_start
+        last_line_start = line_start
+        count += 1
+        if matcher.context_lines:
+            if lines_cache is None:
+                lines_cache = text.split("\n")
+            first = max(1, line_number - matcher.context_lines)
+            last = min(len(lines_cache), line_number + matcher.context_lines)
+            for number in range(first, last + 1):
+                if results and results[-1].line_number >= number:
+                    continue
+                results.append(search_match(path, number, _shorten(lines_cache[number - 1].rstrip()), number != line_number))
+        else:
+            line_end = text.find("\n", match.start())
+            line = text[line_start:line_end if line_end != -1 else len(text)]
+            results.append(search_match(path, line_number, _shorten(line.rstrip()), False))
+        if count >= limit:
+            break
+    return results, count
+
+def _count_newlines(data, start: int, end: int) -> int:
+    if isinstance(data, bytes):
+        return data.count(b"\n", start, end)
+    return data[start:end].count(b"\n")  # mmap has no count()
+
+def _line_starts_around(data, line_start: int, context_lines: int) -> tuple[int, list[int]]:
+    """Start offsets of the lines around the line at line_start, and how many precede it"""
+    before = []
+    start = line_start
+    while len(before) < context_lines and start > 0:
+        start = data.rfind(b"\n", 0, start - 1) + 1
+        before.append(start)
+    starts = before[::-1] + [line_start]
+    end = line_start
+    for _ in range(context_lines):
+        end = data.find(b"\n", end)
+        if end == -1 or end + 1 >= len(data):
+            break
+        end += 1
+        starts.append(end)
+    return len(before), starts
+
+def _iter_match_starts(data, matcher: _matcher):
+    """Offsets of matches in bytes; literal queries use bytes.find, which is much faster than a regex"""
+    if matcher.literal is not None and (matcher.case_sensitive or isinstance(data, bytes)):
+        # bytes.lower() only folds ASCII, so offsets are unchanged
+        haystack = data if matcher.case_sensitive else data.lower()
+        position = haystack.find(matcher.literal)
+        while position != -1:
+            yield position
+            # Continue on the next line, one result per line is reported anyway
+            position = haystack.find(b"\n", position)
+            if position == -1:
+                return
+            position = haystack.find(matcher.literal, position)
+        return
+    for match in matcher.bytes_pattern.finditer(data):
+        yield match.start()
+
+def _scan_bytes(path: str, data, matcher: _matcher, limit: int) -> tuple[list[search_match], int]:
+    """Same as _scan_text on raw bytes (or an mmap), decoding only the reported lines"""
+    results = []
+    count = 0
+    line_number = 1
+    position = 0
+    last_line_start = -1
+    size = len(data)
+    for match_start in _iter_match_starts(data, matcher):
+        line_start = data.rfind(b"\n", 0, match_start) + 1
+        if line_start == last_line_start:
+            continue  # Several matches on the same line
+        line_number += _count_newlines(data, position, line_start)
+        position = line_start
+        last_line_start = line_start
+        count += 1
+        before, starts = _line_starts_around(data, line_start, matcher.context_lines)
+        for index, start in enumerate(starts):
+            number = line_number - before + index
+            if results and results[-1].line_number >= number and results[-1].path == path:
+                continue
+            line_end = data.find(b"\n", start)
+            line = data[start:line_end if line_end != -1 else size]
+            results.append(search_match(path, number, _shorten(line.decode("utf-8", errors="ignore").rstrip()), number != line_number))
+        if count >= limit:
+            break
+    return results, count
+
+def _scan(path: str, data, matcher: _matcher, limit: int) -> tuple[list[search_match], int]:
+    if matcher.bytes_pattern is not None:
+        if matcher.bytes_always_exact or (isinstance(data, bytes) and data.isascii()):
+            return _scan_bytes(path, data, matcher, limit)
+    if not isinstance(data, bytes):
+        data = data[:]
+    return _scan_text(path, data.decode("utf-8", errors="ignore"), matcher, limit)
+
+def search_file(path: str, matcher: _matcher, limit: int) -> tuple[list[search_match], int]:
+    """Search one file, returns (matches including context lines, number of matching lines)"""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return [], 0
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if _is_binary(data):
+                        return [], 0
+                    return _scan(path, data, matcher, limit)
+            data = f.read()
+    except (OSError, ValueError):
+        return [], 0
+    if _is_binary(data):
+        return [], 0
+    return _scan(path, data, matcher, limit)
+
+def _search_batch(paths: list[str], matcher: _matcher, limit: int) -> tuple[list[search_match], int]:
+    results = []
+    count = 0
+    for path in paths:
+        matches, found = search_file(path, matcher, limit - count)
+        results.extend(matches)
+        count += found
+        if count >= limit:
+            break
+    return results, count
+
+_pool: "ProcessPoolExecutor | None" = None
+
+def _get_pool() -> "ProcessPoolExecutor":
+    global _pool
+    if _pool is None:
+        # Imported on first use, most sessions never search a tree large enough to need the pool
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # fork is unsafe in a threaded server, forkserver keeps worker startup cheap on POSIX
+        method = "spawn" if sys.platform == "win32" else "forkserver"
+        _pool = ProcessPoolExecutor(max_workers=search_processes, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+def _batches(paths, size: int):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def search_files(root: str, search_text: str, file_pattern: str = "*", recursive: bool = True,
+                 case_sensitive: bool = True, use_regex: bool = False, context_lines: int = 0,
+                 max_results: int = 1000, respect_ignore: bool = True,
+                 ignore_patterns: list[str] | None = None, paths=None) -> search_outcome:
+    """
+    Searches file contents under root.
+
+    Binary files are skipped, .gitignore/.ignore files are honored, and the search
+    stops as soon as max_results matching lines were found. Large trees are scanned
+    in parallel on a process pool.
+
+    Args:
+        root (str): The directory to search in.
+        search_text (str): The text or regular expression to search for.
+        file_pattern (str): Glob matched against file names (or relative paths when it contains "/").
+        recursive (bool): Whether to descend into subdirectories.
+        case_sensitive (bool): Whether matching is case sensitive.
+        use_regex (bool): Treat search_text as a regular expression.
+        context_lines (int): Lines of context reported around each match.
+        max_results (int): Stop after this many matching lines.
+        respect_ignore (bool): Skip files excluded by .gitignore/.ignore files.
+        ignore_patterns (list[str] | None): Extra gitignore-style patterns to exclude.
+        paths (Iterable[str] | None): Candidate files to scan instead of walking root.
+
+    Returns:
+        search_outcome: The matches in walk order.
+    """
+    matcher = _compile(search_text, use_regex, case_sensitive, max(0, context_lines))
+    if paths is None:
+        paths = iter_candidate_files(root, file_pattern, recursive, respect_ignore, ignore_patterns)
+    paths = iter(paths)
+    limit = max(1, max_results)
+
+    # Look ahead to decide whether a process pool is worth its overhead
+    head = []
+    for path in paths:
+        head.append(path)
+        if len(head) >= PARALLEL_THRESHOLD:
+            break
+    results: list[search_match] = []
+    count = 0
+    scanned = 0
+
+    if len(head) < PARALLEL_THRESHOLD or search_processes <= 1:
+        for path in _chain(head, paths):
+            matches, found = search_file(path, matcher, limit - count)
+            scanned += 1
+            results.extend(matches)
+            count += found
+            if count >= limit:
+                return search_outcome(results, count, scanned, True)
+        return search_outcome(results, count, scanned, False)
+
+    pool = _get_pool()
+    pending = deque()
+    batches = _batches(_chain(head, paths), _BATCH_SIZE)
+    # Keep a bounded number of batches in flight so an early stop wastes little work
+    for batch in batches:
+        pending.append((len(batch), pool.submit(_search_batch, batch, matcher, limit)))
+        if len(pending) >= 2 * search_processes:
+            break
+    while pending:
+        size, future = pending.popleft()
+        matches, found = future.result()
+        scanned += size
+        results.extend(matches)
+        count += found
+        if count >= limit:
+            for _, other in pending:
+                other.cancel()
+            return search_outcome(_trim(results, limit), limit, scanned, True)
+        batch = next(batches, None)
+        if batch is not None:
+            pending.append((len(batch), pool.submit(_search_batch, batch, matcher, limit - count)))
+    return search_outcome(results, count, scanned, False)
+
+def _chain(head: list, rest):
+    yield from head
+    yield from rest
+
+def _trim(results: list[search_match], limit: int) -> list[search_match]:
+    """Drop matches (and their trailing context) beyond limit, batches may overshoot it"""
+    count = 0
+    for index, match in enumerate(results):
+        if not match.is_context:
+            count += 1
+            if count > limit:
+                return results[:index]
+    return results
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,580 @@
+import array
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from typing import BinaryIO
+from . import search
+from . import settings
+from . import walker
+from . import watcher
+from .settings import env_bool
+
+# Opt-in: search_in_files builds a trigram index for every directory it searches
+search_index_enabled = env_bool("MCP_TERMINAL_SEARCH_INDEX")
+# Larger files are not indexed, they are scanned by every search
+MAX_INDEXED_FILE_SIZE = 4 * 1024 * 1024
+# Indexes kept in memory, the least recently used one is dropped beyond this
+MAX_INDEXES = 4
+# Postings are rebuilt once this fraction of the file ids belongs to deleted or changed files
+_COMPACT_RATIO = 0.25
+_APPLY_BATCH_SIZE = 256
+_MAGIC = b"MCPTRIGRAM1\n"
+
+# File states
+_DEAD = 0
+_INDEXED = 1
+_UNINDEXED = 2  # Too large or unreadable, always a candidate
+
+def _trigrams_of(data: bytes):
+    """Distinct trigrams of ASCII-lowercased bytes, packed in 24-bit integers"""
+    data = data.lower()
+    return ((a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:])))
+
+def _read_trigrams(path: str, size: int) -> array.array | None:
+    """Trigrams of a file, empty for binaries (never searched), None when the file cannot be indexed"""
+    if size > MAX_INDEXED_FILE_SIZE:
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if search._is_binary(data):
+        return array.array("I")
+    return array.array("I", _trigrams_of(data))
+
+class trigram_index(settings.persistent_cache):
+    """
+    Trigram index of the files under one root, as walked by search_in_files.
+
+    Posting lists are arrays of file ids. A changed file gets a new id and its old
+    id is marked dead, so updates only append; dead ids are dropped when the
+    postings are compacted. The index is persisted under the cache directory and
+    brought up to date from file mtimes and sizes.
+    """
+
+    def __init__(self, root: str):
+        name = hashlib.sha1(root.encode("utf-8", errors="surrogateescape")).hexdigest()[:20]
+        super().__init__(os.path.join(settings.cache_dir, "search-index", name + ".idx"))
+        self.root = root
+        self.files: list[str] = []
+        self.states = bytearray()
+        self.mtimes = array.array("q")
+        self.sizes = array.array("q")
+        self.postings: dict[int, array.array] = {}
+        self.by_path: dict[str, int] = {}
+        self.unindexed: set[int] = set()
+        self.dead = 0
+        self.ready = threading.Event()
+        self.error = ""
+        self.refresh_started = 0.0
+        self.stale = False  # The watcher saw a file below root change
+        self._update_lock = threading.Lock()  # One refresh at a time
+
+    @property
+    def file_count(self) -> int:
+        return len(self.files) - self.dead
+
+    def start(self) -> None:
+        threading.Thread(target=self._build, name="mcp-terminal-index", daemon=True).start()
+
+    def _build(self) -> None:
+        try:
+            try:
+                self.load()
+            except (OSError, ValueError, KeyError, EOFError, struct.error):
+                pass  # Missing, stale or corrupt: index from scratch
+            self.refresh()
+            self.save()
+            self.ready.set()
+            self.save_on_exit()
+        except Exception as e:
+            self.error = str(e)
+
+    def refresh(self, requested_at: float | None = None) -> int:
+        """
+        Re-stat the tree and re-index changed files, returns the number of files added, changed or removed.
+        Skipped when a refresh started after requested_at (a time.monotonic()) and nothing changed since.
+        """
+        with self._update_lock:
+            if requested_at is not None and not self.stale and self.refresh_started >= requested_at:
+                return 0  # Another thread refreshed while this one waited
+            self.refresh_started = time.monotonic()
+            self.stale = False
+            seen = set()
+            changed = []
+            prefix = len(self.root)
+            for entry in walker.walk(self.root, respect_ignore=True):
+                path = entry.path
+                relative = path[prefix:].lstrip(os.sep)
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                file_id = self.by_path.get(relative)
+                if file_id is not None and self.mtimes[file_id] == st.st_mtime_ns and self.sizes[file_id] == st.st_size:
+                    seen.add(file_id)
+                else:
+                    changed.append((relative, path, st))
+            removed = [file_id for file_id in self.by_path.values() if file_id not in seen]
+
+            with self._lock:
+                for file_id in removed:
+                    self._remove(file_id)
+            # Read files in batches so a first build never holds every file's trigrams at once
+            for start in range(0, len(changed), _APPLY_BATCH_SIZE):
+                batch = [(relative, st, _read_trigrams(path, st.st_size))
+                         for relative, path, st in changed[start:start + _APPLY_BATCH_SIZE]]
+                with self._lock:
+                    for relative, st, trigrams in batch:
+                        self._add(relative, st, trigrams)
+
+            updated = len(removed) + len(changed)
+            if updated:
+                self.dirty = True
+                if self.dead > _COMPACT_RATIO * len(self.files):
+                    with self._lock:
+                        self._compact()
+        if updated and self.ready.is_set():
+            self.save_if_due()
+        return updated
+
+    def _add(self, relative: str, st: os.stat_result, trigrams: array.array | None) -> None:
+        file_id = len(self.files)
+        self.files.append(relative)
+        self.mtimes.append(st.st_mtime_ns)
+        self.sizes.append(st.st_size)
+        self.by_path[relative] = file_id
+        if trigrams is None:
+            self.states.append(_UNINDEXED)
+            self.unindexed.add(file_id)
+            return
+        self.states.append(_INDEXED)
+        postings = self.postings
+        for trigram in trigrams:
+            posting = postings.get(trigram)
+            if posting is None:
+                postings[trigram] = array.array("I", (file_id,))
+            else:
+                posting.append(file_id)
+
+    def _remove(self, file_id: int) -> None:
+        self.states[file_id] = _DEAD
+        self.unindexed.discard(file_id)
+        self.dead += 1
+        if self.by_path.get(self.files[file_id]) == file_id:
+            del self.by_path[self.files[file_id]]
+
+    def _compact(self) -> None:
+        """Renumber the live files and drop dead ids from the postings"""
+        remap = array.array("i", [-1]) * len(self.files)
+        files, states, mtimes, sizes = [], bytearray(), array.array("q"), array.array("q")
+        for file_id, state in enumerate(self.states):
+            if state == _DEAD:
+                continue
+            remap[file_id] = len(files)
+            files.append(self.files[file_id])
+            states.append(state)
+            mtimes.append(self.mtimes[file_id])
+            sizes.append(self.sizes[file_id])
+        postings = {}
+        for trigram, posting in self.postings.items():
+            live = array.array("I", (remap[file_id] for file_id in posting if remap[file_id] >= 0))
+            if live:
+                postings[trigram] = live
+        self.files, self.states, self.mtimes, self.sizes, self.postings = files, states, mtimes, sizes, postings
+        self.by_path = {relative: file_id for file_id, relative in enumerate(files)}
+        self.unindexed = {file_id for file_id, state in enumerate(states) if state == _UNINDEXED}
+        self.dead = 0
+
+    def candidates(self, trigrams: set[int], file_pattern: str = "*", recursive: bool = True) -> list[str]:
+        """Files that contain every trigram (or could not be indexed), in walk order"""
+        requested_at = time.monotonic()
+        # Below a directory watched with inotify, the index is trusted until the watcher reports a
+        # change; elsewhere the tree is re-stated before every search, a new file would be missed
+        watched_since = watcher.watched_since(self.root)
+        if watched_since is not None:
+            # Changes made before this search are queued in the kernel, recording them marks the index stale
+            watcher.drain()
+        trusted = watched_since is not None and self.refresh_started >= watched_since
+        if self.stale or not trusted:
+            self.refresh(requested_at)
+        with self._lock:
+            if trigrams:
+                postings = [self.postings.get(trigram) for trigram in trigrams]
+                if any(posting is None for posting in postings):
+                    file_ids = set()
+                else:
+                    postings.sort(key=len)
+                    file_ids = set(postings[0])
+                    for posting in postings[1:]:
+                        if not file_ids:
+                            break
+                        file_ids.intersection_update(posting)
+                file_ids.update(self.unindexed)
+            else:
+                file_ids = range(len(self.files))
+            states = self.states
+            relatives = [self.files[file_id] for file_id in file_ids if states[file_id] != _DEAD]
+
+        pattern = walker.name_pattern(file_pattern)
+        matching = []
+        for relative in relatives:
+            if not recursive and os.sep in relative:
+                continue
+            name = relative.rpartition(os.sep)[2]
+            if not pattern.match(name, relative.replace(os.sep, "/")):
+                continue
+            matching.append(relative)
+        matching.sort(key=lambda relative: walker.walk_order_key(relative.replace(os.sep, "/")))
+        return [os.path.join(self.root, relative) for relative in matching]
+
+    def _snapshot(self) -> tuple[bytes, bytes, tuple[array.array, ...]]:
+        keys = array.array("I", sorted(self.postings))
+        counts = array.array("I", (len(self.postings[key]) for key in keys))
+        ids = array.array("I")
+        for key in keys:
+            ids.extend(self.postings[key])
+        meta = json.dumps({
+            "root": self.root,
+            "byteorder": sys.byteorder,
+            "files": self.files,
+        }).encode("utf-8", errors="surrogateescape")
+        return meta, bytes(self.states), (self.mtimes, self.sizes, keys, counts, ids)
+
+    def _write(self, f: BinaryIO, snapshot: tuple[bytes, bytes, tuple[array.array, ...]]) -> None:
+        meta, states, tables = snapshot
+        f.write(_MAGIC)
+        f.write(struct.pack("<Q", len(meta)))
+        f.write(meta)
+        f.write(struct.pack("<Q", len(states)))
+        f.write(states)
+        for table in tables:
+            f.write(struct.pack("<Q", len(table)))
+            table.tofile(f)
+
+    def load(self) -> None:
+        with open(self.cache_path, "rb") as f:
+            data = memoryview(f.read())
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Not a search index")
+        offset = len(_MAGIC)
+
+        def read_block(item_size: int) -> memoryview:
+            nonlocal offset
+            (length,) = struct.unpack_from("<Q", data, offset)
+            offset += 8
+            block = data[offset:offset + length * item_size]
+            if len(block) != length * item_size:
+                raise EOFError("Truncated search index")
+            offset += len(block)
+            return block
+
+        meta = json.loads(bytes(read_block(1)).decode("utf-8", errors="surrogateescape"))
+        if meta["root"] != self.root or meta["byteorder"] != sys.byteorder:
+            raise ValueError("Search index belongs to another root or platform")
+        states = bytearray(read_block(1))
+        tables = []
+        for typecode in ("q", "q", "I", "I", "I"):
+            table = array.array(typecode)
+            table.frombytes(read_block(table.itemsize))
+            tables.append(table)
+        mtimes, sizes, keys, counts, ids = tables
+        files = meta["files"]
+        if not len(files) == len(states) == len(mtimes) == len(sizes) or len(keys) != len(counts):
+            raise ValueError("Inconsistent search index")
+
+        postings = {}
+        position = 0
+        for key, count in zip(keys, counts):
+            postings[key] = ids[position:position + count]
+            position += count
+        with self._lock:
+            self.files, self.states, self.mtimes, self.sizes, self.postings = files, states, mtimes, sizes, postings
+            self.by_path = {relative: file_id for file_id, relative in enumerate(files) if states[file_id] != _DEAD}
+            self.unindexed = {file_id for file_id, state in enumerate(states) if state == _UNINDEXED}
+            self.dead = states.count(_DEAD)
+
+    def describe(self) -> str:
+        if self.error:
+            return f"Indexing {self.root} failed: {self.error}"
+        if not self.ready.is_set():
+            return f"Indexing {self.root} in the background"
+        return (f"Index of {self.root}: {self.file_count} files, {len(self.postings)} trigrams, "
+                f"{len(self.unindexed)} files too large to index")
+
+# ---------------------------------------------------------------------------
+# Query trigrams
+# ---------------------------------------------------------------------------
+
+# Under re.IGNORECASE these also match non-ASCII characters (İ ı K ſ), which
+# the ASCII-lowercased index does not fold
+_UNICODE_FOLDED = frozenset("iks")
+_QUANTIFIER = re.compile(r"\{(\d*)(?:,\d*)?\}")
+_LITERAL_ESCAPES = {"a": "\a", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+# Hexadecimal digits of a character code escape
+_HEX_ESCAPES = {"x": 2, "u": 4, "U": 8}
+
+class _regex_scan:
+    """
+    Just enough of a regex parser to find the literal runs every match contains.
+    Patterns are compiled first, so only valid syntax is scanned; anything not understood
+    breaks the current run, which only costs narrowing.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.position = 0
+        self.flags: set[str] = set()
+
+    def sequence(self) -> tuple[list[tuple[str, object, int, bool]], bool]:
+        """Atoms up to the closing parenthesis, as (kind, value, minimum repeat, quantified), and whether it has alternatives"""
+        pattern, atoms, alternation = self.pattern, [], False
+        while self.position < len(pattern):
+            char = pattern[self.position]
+            if char == ")":
+                break
+            if char == "|":
+                alternation = True
+                self.position += 1
+                continue
+            if char == "(":
+                atom = self.group()
+            elif char == "[":
+                self.skip_class()
+                atom = ("other", None)
+            elif char == "\\":
+                atom = self.escape()
+            else:
+                self.position += 1
+                atom = ("zero", None) if char in "^$" else ("other", None) if char == "." else ("literal", char)
+            minimum, quantified = self.quantifier()
+            atoms.append((*atom, minimum, quantified))
+        return atoms, alternation
+
+    def quantifier(self) -> tuple[int, bool]:
+        pattern, position = self.pattern, self.position
+        if position >= len(pattern):
+            return 1, False
+        char = pattern[position]
+        if char in "*?+":
+            minimum, position = (1 if char == "+" else 0), position + 1
+        else:
+            match = _QUANTIFIER.match(pattern, position) if char == "{" else None
+            if match is None:
+                return 1, False
+            minimum, position = int(match.group(1) or 0), match.end()
+        # Lazy and possessive forms
+        if position < len(pattern) and pattern[position] in "?+":
+            position += 1
+        self.position = position
+        return minimum, True
+
+    def escape(self) -> tuple[str, object]:
+        pattern, start = self.pattern, self.position
+        char = pattern[start + 1]
+        self.position = start + 2
+        if char in _LITERAL_ESCAPES:
+            return "literal", _LITERAL_ESCAPES[char]
+        if char in "bBAZ":
+            return "zero", None
+        if char in _HEX_ESCAPES:
+            end = self.position + _HEX_ESCAPES[char]
+            code = int(pattern[self.position:end], 16)
+            self.position = end
+            return "literal", chr(code)
+        if char == "N":
+            self.position = pattern.index("}", self.position) + 1
+        elif char.isdigit():
+            # Octal codes and group numbers; skipping too many digits only drops literals
+            while self.position < len(pattern) and self.position - start < 4 and pattern[self.position].isdigit():
+                self.position += 1
+        if char.isascii() and char.isalnum():
+            return "other", None
+        return "literal", char
+
+    def skip_class(self) -> None:
+        pattern = self.pattern
+        position = self.position + 1
+        if position < len(pattern) and pattern[position] == "^":
+            position += 1
+        if position < len(pattern) and pattern[position] == "]":
+            position += 1
+        while pattern[position] != "]":
+            position += 2 if pattern[position] == "\\" else 1
+        self.position = position + 1
+
+    def skip_group(self) -> None:
+        """Past the closing parenthesis of the group starting at position"""
+        depth = 0
+        pattern = self.pattern
+        while True:
+            char = pattern[self.position]
+            if char == "\\":
+                self.position += 2
+                continue
+            if char == "[":
+                self.skip_class()
+                continue
+            self.position += 1
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def group(self) -> tuple[str, object]:
+        pattern, start = self.pattern, self.position
+        if not pattern.startswith("(?", start):
+            self.position += 1
+            return self.group_body()
+        marker = pattern[start + 2]
+        if marker in ":>":
+            self.position = start + 3
+            return self.group_body()
+        if pattern.startswith("P<", start + 2):
+            self.position = pattern.index(">", start) + 1
+            return self.group_body()
+        if marker in "aiLmsux-":
+            end = start + 2
+            while pattern[end] not in ":)":
+                end += 1
+            if pattern[end] == ")":
+                # Global flags
+                self.flags.update(pattern[start + 2:end])
+                self.position = end + 1
+                return "zero", None
+            # Scoped flags change how the part matches, it is not narrowed on
+            self.position = end + 1
+            self.group_body()
+            return "other", None
+        # Comments, lookarounds, conditionals and named backreferences
+        self.skip_group()
+        return ("zero", None) if marker == "#" else ("other", None)
+
+    def group_body(self) -> tuple[str, object]:
+        atoms, alternation = self.sequence()
+        self.position += 1  # The closing parenthesis
+        return ("other", None) if alternation else ("group", atoms)
+
+def _regex_literals(pattern: str, ignore_case: bool) -> tuple[list[str], bool]:
+    """Literal strings every match of the regex contains, and whether the regex ignores case"""
+    try:
+        re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        scan = _regex_scan(pattern)
+        atoms, alternation = scan.sequence()
+    except (re.error, RecursionError, IndexError, ValueError):
+        return [], ignore_case
+    ignore_case = ignore_case or "i" in scan.flags
+    if alternation or "x" in scan.flags:
+        # Any alternative may match, and verbose patterns give whitespace another meaning
+        return [], ignore_case
+    literals = []
+    current = []
+
+    def flush():
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+    def walk(atoms):
+        for kind, value, minimum, quantified in atoms:
+            if minimum == 0 or kind == "other":
+                # Optional parts, classes, wildcards and lookarounds break the literal
+                flush()
+            elif quantified:
+                flush()
+                walk([(kind, value, 1, False)])
+                flush()
+            elif kind == "literal":
+                current.append(value)
+            elif kind == "group":
+                walk(value)
+            # Zero width, the literals around it stay adjacent
+
+    walk(atoms)
+    flush()
+    return literals, ignore_case
+
+def required_trigrams(search_text: str, use_regex: bool = False, case_sensitive: bool = True) -> set[int]:
+    """Trigrams every matching file contains; empty when the query is too short or too loose to narrow anything"""
+    ignore_case = not case_sensitive
+    literals = [search_text]
+    if use_regex:
+        literals, ignore_case = _regex_literals(search_text, ignore_case)
+    # Literal ASCII queries are matched on bytes, everything else on decoded text with Unicode case folding
+    unicode_folding = ignore_case and (use_regex or not search_text.isascii())
+    trigrams = set()
+    for literal in literals:
+        segment = []
+        for char in literal + "\0":
+            if char == "\0" or (ignore_case and (not char.isascii() or (unicode_folding and char.lower() in _UNICODE_FOLDED))):
+                if len(segment) >= 3:
+                    trigrams.update(_trigrams_of("".join(segment).encode("utf-8", errors="surrogatepass")))
+                segment = []
+            else:
+                segment.append(char)
+    return trigrams
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+_indexes: dict[str, trigram_index] = {}
+_registry_lock = threading.Lock()
+
+def get_index(root: str, create: bool = False) -> trigram_index | None:
+    """Returns the index of root, starting a background build when create is set and there is none"""
+    with _registry_lock:
+        index = _indexes.pop(root, None)
+        if index is None:
+            if not create:
+                return None
+            index = trigram_index(root)
+            index.start()
+            while len(_indexes) >= MAX_INDEXES:
+                _indexes.pop(next(iter(_indexes)))
+        _indexes[root] = index  # Most recently used last
+        return index
+
+def candidate_files(root: str, search_text: str, file_pattern: str = "*", recursive: bool = True,
+                    case_sensitive: bool = True, use_regex: bool = False) -> list[str] | None:
+    """
+    Narrows the files search.search_files has to scan for a query, using the index of root.
+
+    Args:
+        root (str): The directory searched.
+        search_text (str): The text or regular expression searched for.
+        file_pattern (str): Glob the files must match.
+        recursive (bool): Whether files in subdirectories are searched.
+        case_sensitive (bool): Whether matching is case sensitive.
+        use_regex (bool): Whether search_text is a regular expression.
+
+    Returns:
+        list[str] | None: Candidate files in walk order, or None when no ready index applies
+        and the tree has to be walked (the index is then built in the background if enabled).
+    """
+    if file_pattern.startswith("."):
+        return None  # The index only covers the files a default walk sees, hidden ones are not
+    index = get_index(root, create=search_index_enabled)
+    if index is None or not index.ready.is_set():
+        return None
+    return index.candidates(required_trigrams(search_text, use_regex, case_sensitive), file_pattern, recursive)
+
+def invalidate(changed: list[str], rescan: list[str]) -> None:
+    """Marks the indexes with a file the watcher saw change as needing a refresh"""
+    with _registry_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        prefix = os.path.join(index.root, "")
+        if any(path.startswith(prefix) for path in changed) \
+                or any(path.startswith(prefix) or prefix.startswith(os.path.join(path, "")) for path in rescan):
+            index.stale = True
+
+watcher.add_listener(invalidate)
@@ -1,39 +1,163 @@
+import asyncio
+import hashlib
 import os
 import shlex
 import shutil
 import stat
 import sys
 import platform
-import glob
+import time
 from datetime import datetime
-from mcp.server.fastmcp import FastMCP
-from .terminal import terminal_run_command, command_result
+from mcp.server.fastmcp import Context
+from .terminal import terminal_run_command_async, terminal_stream_command, command_result, run_result
+from .concurrency import offload, command_slots, run_blocking
+from .decoding import output_decoder
+from . import settings
+from . import shell_session
+from . import walker
+from . import listing
+from .listing import listing_result
+from . import file_reader
+from .file_reader import read_result
+from . import jobs
+from .jobs import job_result
+from . import session_state
+from . import batch
+from .batch import batch_result, file_operation
+from . import command_graph
+from .command_graph import command_node, graph_result
+from . import telemetry
+from .telemetry import server_stats
+from . import compaction
+from . import file_writer
+from .file_writer import write_result
+from . import file_editor
+from .file_editor import edit_result, text_edit
+from . import directory_sizes
+from .directory_sizes import directory_sizes_result
+from . import directory_copy
+from .directory_copy import copy_result
+from . import watcher
+from .watcher import changes_result
+from . import file_hashes
+from .file_hashes import hash_result
+from .tool_registry import terminal_mcp
 
-mcp = FastMCP("Terminal MCP", "1.0.2")
-current_directory = os.getcwd() # Initialize with the current working directory
+# Tools are built on first use, see tool_registry
+mcp = terminal_mcp("Terminal MCP", "1.0.2")
 
 @mcp.tool()
-def run_command(command: str) -> command_result:
+async def run_command(command: str, stream_output: bool = False, timeout: float | None = None,
+                      compact_output: bool | None = None, ctx: Context = None) -> run_result:
     """
     Runs a command in the terminal and returns the result.
+    The command and every process it started are killed when it exceeds its timeout.
     
     Args:
         command (str): The command to run.
+        stream_output (bool): Send output to the client as progress notifications while the command runs,
+            and keep only the beginning and end of long output in the result (default: False).
+        timeout (float | None): Seconds before the command is killed, 0 for no timeout (default: server setting, 600).
+        compact_output (bool | None): Strip ANSI escapes, collapse progress-bar redraws and repeated lines,
+            and keep only the first and last lines of long output; the result reports what was removed
+            (default: server setting, off).
         
     Returns:
-        command_result: The result of the command execution.
+        run_result: The result of the command execution, including wall time, CPU time and peak memory.
     """
-    # If the command is a change directory command,
-    global current_directory
+    state = session_state.current()
+    current_directory = state.cwd
+    timeout = settings.command_timeout if timeout is None else timeout
+    options = _compaction_options(compact_output)
+    if stream_output:
+        async with command_slots():
+            return await terminal_stream_command(command, current_directory, on_output=_progress_reporter(ctx, options is not None),
+                                                 timeout=timeout, env=state.env, compaction=options)
+    if _use_persistent_shell():
+        # The session shell handles cd itself and reports the resulting directory
+        session = shell_session.get_shell_session(current_directory, state.shell_session_id, state.env)
+        session.cwd = current_directory
+        result = await session.run(command, timeout=timeout)
+        state.cwd = result.current_directory
+        return _compacted(result, options)
     command = shlex.split(command) # Ensure command is a list
     if command[0] == "cd":
         path = command[1] if len(command) > 1 else ""
-        return set_working_directory(path)
+        return run_result(**(await set_working_directory(path)).model_dump())
     else:
-        return terminal_run_command(command, current_directory, change_directory=False)
+        # Bound the number of child processes running at the same time
+        async with command_slots():
+            result = await terminal_run_command_async(command, current_directory, change_directory=False, timeout=timeout, env=state.env)
+        return _compacted(result, options)
+
+def _compaction_options(compact_output: bool | None) -> compaction.compaction_options | None:
+    """Options to compact command output with, None to return it as the command printed it"""
+    return compaction.default_options if (compaction.enabled if compact_output is None else compact_output) else None
+
+def _compacted(result: run_result, options: compaction.compaction_options | None) -> run_result:
+    if options is None:
+        return result
+    return compaction.compact_result(result, options)
 
 @mcp.tool()
-def set_working_directory(path: str) -> command_result:
+async def run_commands(commands: list[command_node], on_failure: str = "fail_fast", max_workers: int | None = None,
+                       compact_output: bool | None = None) -> graph_result:
+    """
+    Runs several commands in one call, concurrently where their dependencies allow.
+    Each command runs like run_command does without stream_output, in the current directory;
+    a cd inside a command does not carry over to the others.
+    
+    Args:
+        commands (list[command_node]): The commands, each with an id, the command, the ids it depends_on
+            and an optional timeout. A command starts once all of its dependencies succeeded.
+        on_failure (str): "fail_fast" kills the running commands and starts no other once one fails,
+            "continue" only skips the commands depending on the failed one (default: "fail_fast").
+        max_workers (int | None): Maximum number of commands running at the same time (default: CPU count).
+        compact_output (bool | None): Compact the output of every command like run_command does (default: server setting, off).
+        
+    Returns:
+        graph_result: One result per command, in the order given, with its status, start time and wall time.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    try:
+        command_graph.check_graph(commands, on_failure)
+        cwd, env = current_directory, state.env
+        options = _compaction_options(compact_output)
+
+        async def run(node: command_node) -> run_result:
+            timeout = settings.command_timeout if node.timeout is None else node.timeout
+            # Bound the number of child processes running at the same time, across all calls
+            async with command_slots():
+                result = await terminal_run_command_async(node.command, cwd, change_directory=False, timeout=timeout, env=env)
+            return _compacted(result, options)
+
+        start = time.perf_counter()
+        results = await command_graph.run_graph(commands, run, max_workers or command_graph.default_workers, cwd, on_failure)
+        counts = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        success = counts.get("succeeded", 0) == len(results)
+        return graph_result(
+            success=success,
+            stdout=", ".join(f"{count} {status}" for status, count in counts.items()) + ".",
+            stderr="" if success else "Not every command succeeded.",
+            returncode=0 if success else 1,
+            current_directory=current_directory,
+            wall_time=round(time.perf_counter() - start, 6),
+            results=results
+        )
+    except Exception as e:
+        return graph_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
+@mcp.tool()
+async def set_working_directory(path: str) -> command_result:
     """
     Changes the current working directory.
     
@@ -43,10 +167,217 @@ def set_working_directory(path: str) -> command_result:
     Returns:
         command_result: The result of the change directory command.
     """
-    global current_directory 
-    result = terminal_run_command(["cd", path], cwd=current_directory, change_directory=True)
-    current_directory = result.current_directory  # Update the global current directory
-    return result
+    state = session_state.current()
+    current_directory = state.cwd
+    # Validate the path directly instead of spawning a shell just to run `cd`
+    target = os.path.abspath(os.path.join(current_directory, os.path.expanduser(path)))
+    if not os.path.isdir(target):
+        message = f"Directory '{target}' does not exist." if not os.path.exists(target) else f"'{target}' is not a directory."
+        return command_result(
+            success=False,
+            stdout="",
+            stderr=message,
+            returncode=1,
+            current_directory=current_directory
+        )
+    state.cwd = target  # Update the directory of this session
+    return command_result(
+        success=True,
+        stdout="",
+        stderr="",
+        returncode=0,
+        current_directory=target
+    )
+
+@mcp.tool()
+async def start_background_job(command: str) -> job_result:
+    """
+    Starts a command in the background and returns immediately with a job ID.
+    Use this for dev servers, watchers and long builds; stdout and stderr are merged.
+    
+    Args:
+        command (str): The command to run.
+        
+    Returns:
+        job_result: The started job, including its job_id.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    try:
+        job = await jobs.start_job(command, current_directory, state.env, state.session_id)
+        return job.result(stdout=f"Job {job.job_id} started.")
+    except Exception as e:
+        return job_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
+@mcp.tool()
+def list_background_jobs() -> command_result:
+    """
+    Lists background jobs with their status, exit code and runtime.
+    Finished jobs are cleaned up automatically after a while.
+    
+    Returns:
+        command_result: The result containing one line per job.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    job_list = jobs.list_jobs(state.session_id)
+    output = "\n".join(job.describe() for job in job_list) if job_list else "No background jobs."
+    return command_result(
+        success=True,
+        stdout=output,
+        stderr="",
+        returncode=0,
+        current_directory=current_directory
+    )
+
+@mcp.tool()
+def get_job_output(job_id: str, cursor: int = 0, max_bytes: int = 65536) -> job_result:
+    """
+    Fetches the output of a background job produced since a cursor.
+    
+    Args:
+        job_id (str): The job ID returned by start_background_job.
+        cursor (int): Output offset to start from, pass the previous next_cursor to get only new output (default: 0).
+        max_bytes (int): Maximum number of bytes to return (default: 65536).
+        
+    Returns:
+        job_result: The output in stdout, the job status and the next cursor.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    try:
+        return jobs.read_job_output(jobs.get_job(job_id, state.session_id), cursor, max_bytes)
+    except Exception as e:
+        return job_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory,
+            job_id=job_id
+        )
+
+@mcp.tool()
+async def wait_for_job(job_id: str, timeout: float = 30) -> job_result:
+    """
+    Waits until a background job finishes or the timeout expires.
+    
+    Args:
+        job_id (str): The job ID returned by start_background_job.
+        timeout (float): Maximum number of seconds to wait (default: 30).
+        
+    Returns:
+        job_result: The job status, its status is still "running" if the timeout expired.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    try:
+        job = jobs.get_job(job_id, state.session_id)
+        await jobs.wait_job(job, timeout)
+        return job.result()
+    except Exception as e:
+        return job_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory,
+            job_id=job_id
+        )
+
+@mcp.tool()
+def signal_job(job_id: str, signal_name: str = "SIGTERM") -> job_result:
+    """
+    Sends a signal to a background job and all processes it started. Use SIGKILL to kill it.
+    
+    Args:
+        job_id (str): The job ID returned by start_background_job.
+        signal_name (str): The signal to send, e.g. SIGTERM, SIGINT, SIGKILL (default: SIGTERM).
+        
+    Returns:
+        job_result: The job status after sending the signal.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    try:
+        job = jobs.get_job(job_id, state.session_id)
+        if not jobs.signal_job(job, signal_name):
+            return job.result(stdout=f"Job {job_id} already finished.")
+        return job.result(stdout=f"Sent {signal_name} to job {job_id}.")
+    except Exception as e:
+        return job_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory,
+            job_id=job_id
+        )
+
+@mcp.tool()
+async def restart_shell_session() -> command_result:
+    """
+    Restarts the persistent shell session, discarding its state (variables, functions, activated environments).
+    Only relevant when the server runs with MCP_TERMINAL_PERSISTENT_SHELL enabled.
+    
+    Returns:
+        command_result: The result of the restart.
+    """
+    state = session_state.current()
+    current_directory = state.cwd
+    closed = await shell_session.close_shell_session(state.shell_session_id)
+    return command_result(
+        success=True,
+        stdout="Shell session restarted." if closed else "No shell session was running.",
+        stderr="",
+        returncode=0,
+        current_directory=current_directory
+    )
+
+def _use_persistent_shell() -> bool:
+    return shell_session.persistent_shell_enabled and shell_session.persistent_shell_supported()
+
+# Output is forwarded at most this often, and at most this many characters per notification
+_PROGRESS_INTERVAL = 0.25
+_PROGRESS_MESSAGE_LIMIT = 8 * 1024
+
+def _progress_reporter(ctx: Context | None, compact: bool = False):
+    """
+    Build an on_output callback that forwards command output as throttled progress notifications,
+    without ANSI escapes and superseded progress-bar redraws when compact
+    """
+    try:
+        if ctx is None or ctx.request_context.meta is None or ctx.request_context.meta.progressToken is None:
+            return None
+    except ValueError:
+        # Called outside of an MCP request
+        return None
+
+    state = {"bytes": 0, "pending": "", "last_sent": 0.0}
+    # One decoder per stream, so characters split between chunks are not mangled;
+    # the encoding is told from the first chunk to avoid holding progress back
+    decoders = {"stdout": output_decoder(sample_size=1), "stderr": output_decoder(sample_size=1)}
+
+    async def on_output(stream: str, chunk: bytes) -> None:
+        state["bytes"] += len(chunk)
+        text = decoders[stream].decode(chunk)
+        # Only the most recent output is worth showing, older pending text is dropped
+        state["pending"] = (state["pending"] + text)[-_PROGRESS_MESSAGE_LIMIT:]
+        now = time.monotonic()
+        if now - state["last_sent"] >= _PROGRESS_INTERVAL:
+            state["last_sent"] = now
+            message, state["pending"] = state["pending"], ""
+            if compact:
+                message = compaction.clean_text(message)
+            await ctx.report_progress(progress=state["bytes"], message=message)
+
+    return on_output
 
 @mcp.tool()
 def get_working_directory() -> str:
@@ -56,10 +387,10 @@ def get_working_directory() -> str:
     Returns:
         str: The current working directory.
     """
-    global current_directory 
-    return current_directory
+    return session_state.current().cwd
 
 @mcp.tool()
+@offload
 def create_directory(directory_path: str) -> command_result:
     """
     Creates a directory at the specified path.
@@ -71,7 +402,7 @@ def create_directory(directory_path: str) -> command_result:
         command_result: The result of the directory creation command.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         directory_path = os.path.join(current_directory, directory_path)
         os.makedirs(directory_path, exist_ok=True)
         return command_result(
@@ -91,34 +422,79 @@ def create_directory(directory_path: str) -> command_result:
         )
 
 @mcp.tool()
-def create_file(file_path: str, content: str) -> command_result:
+@offload
+def create_file(file_path: str, content: str, write_id: str | None = None, final: bool = True) -> write_result:
     """
-    Creates a file with the specified content.
+    Creates a file with the specified content, replacing it atomically if it exists:
+    the content goes to a temporary file that is flushed to disk and renamed over the target.
+    Large content can be sent in chunks: pass final=False with every chunk but the last,
+    and the write_id returned by the first call with the following ones.
     
     Args:
         file_path (str): The path to the file to create.
-        content (str): The content to write to the file.
+        content (str): The content to write to the file, or the next chunk of it.
+        write_id (str | None): The write_id returned for the previous chunk (default: start a new file).
+        final (bool): Whether this is the last chunk, the file only appears once it is sent (default: True).
         
     Returns:
-        command_result: The result of the file creation command.
+        write_result: The result of the file creation command, with the write_id to continue an unfinished write.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         file_path = os.path.join(current_directory, file_path)
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        # Write the content to the file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return command_result(
+        write_id, bytes_written = file_writer.write_file(file_path, content, write_id, final)
+        return write_result(
             success=True,
-            stdout=f"File '{file_path}' created successfully.",
+            stdout=f"File '{file_path}' created successfully." if final else f"{bytes_written} bytes of '{file_path}' written so far.",
             stderr="",
             returncode=0,
+            current_directory=current_directory,
+            write_id=write_id,
+            bytes_written=bytes_written
+        )
+    except Exception as e:
+        return write_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
             current_directory=current_directory
         )
+
+@mcp.tool()
+@offload
+def edit_file(file_path: str, diff: str = "", edits: list[text_edit] | None = None, base_sha256: str = "") -> edit_result:
+    """
+    Changes part of an existing file without sending all of it, then replaces it atomically.
+    Takes a unified diff, and/or edits that each replace an exact old_text (which must appear once,
+    unless replace_all) or the lines start_line..end_line. Hunks and edits are all located in the
+    file as it was before the call, and must not overlap. Nothing is written if any of them fails.
+    
+    Args:
+        file_path (str): The path to the file to edit.
+        diff (str): A unified diff of the file ("@@ -12,3 +12,4 @@" hunks); hunks that moved are found near their line.
+        edits (list[text_edit] | None): Search/replace edits {old_text, new_text, replace_all} and line range edits
+            {start_line, end_line, new_text}; end_line = start_line - 1 inserts before start_line.
+        base_sha256 (str): The sha256 returned by read_file or a previous edit_file; the edit is refused if the
+            file changed since (default: no check).
+        
+    Returns:
+        edit_result: The result of the edit, with the sha256 of the new content.
+    """
+    try:
+        current_directory = session_state.current().cwd
+        file_path = os.path.join(current_directory, file_path)
+        result = file_editor.edit_file(file_path, diff, edits, base_sha256)
+        applied = []
+        if result.hunks_applied:
+            applied.append(f"{result.hunks_applied} hunk{'s' if result.hunks_applied != 1 else ''}")
+        if result.edits_applied:
+            applied.append(f"{result.edits_applied} edit{'s' if result.edits_applied != 1 else ''}")
+        result.stdout = f"Applied {' and '.join(applied)} to '{file_path}', now {result.bytes_written} bytes (sha256 {result.sha256})."
+        result.current_directory = current_directory
+        return result
     except Exception as e:
-        return command_result(
+        return edit_result(
             success=False,
             stdout="",
             stderr=str(e),
@@ -127,6 +503,7 @@ def create_file(file_path: str, content: str) -> command_result:
         )
 
 @mcp.tool()
+@offload
 def append_to_file(file_path: str, content: str, add_newline: bool = True) -> command_result:
     """
     Appends content to a file, optionally adding a newline.
@@ -140,16 +517,10 @@ def append_to_file(file_path: str, content: str, add_newline: bool = True) -> co
         command_result: The result of the append operation.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         file_path = os.path.join(current_directory, file_path)
-        
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        with open(file_path, 'a', encoding='utf-8') as f:
-            if add_newline:
-                f.write("\n")
-            f.write(content)
+        # Repeated appends to a file reuse its open handle
+        file_writer.append_file(file_path, content, add_newline)
         
         return command_result(
             success=True,
@@ -168,31 +539,55 @@ def append_to_file(file_path: str, content: str, add_newline: bool = True) -> co
         )
 
 @mcp.tool()
-def read_file(file_path: str) -> command_result:
+@offload
+def read_file(file_path: str, offset: int | None = None, length: int | None = None,
+              start_line: int | None = None, end_line: int | None = None,
+              head: int | None = None, tail: int | None = None,
+              max_bytes: int = file_reader.DEFAULT_MAX_READ_BYTES) -> read_result:
     """
-    Reads the content of a file.
+    Reads the content of a file, or part of it.
+    Use at most one of: offset/length, start_line/end_line, head or tail. Without any of them the
+    file is read from the start. At most max_bytes are returned; when the content was cut,
+    truncated is set and next_offset (or end_line) tells where to continue.
     
     Args:
         file_path (str): The path to the file to read.
+        offset (int | None): Byte offset to start reading at.
+        length (int | None): Number of bytes to read from offset.
+        start_line (int | None): First line to read (1-based).
+        end_line (int | None): Last line to read (inclusive).
+        head (int | None): Read only the first head lines.
+        tail (int | None): Read only the last tail lines.
+        max_bytes (int): Maximum number of bytes returned (default: 1048576).
         
     Returns:
-        command_result: The result of the file read command.
+        read_result: The result of the file read command, with the position of the content in the file.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         file_path = os.path.join(current_directory, file_path)
-        # Read the content of the file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return command_result(
+        # Only the requested part is read; large files are mapped rather than loaded
+        file_part = file_reader.read_range(file_path, offset=offset, length=length,
+                                           start_line=start_line, end_line=end_line,
+                                           head=head, tail=tail, max_bytes=max_bytes)
+        content, content_offset, content_end = file_reader.decode_slice(file_part)
+        return read_result(
             success=True,
             stdout=content,
             stderr="",
             returncode=0,
-            current_directory=current_directory
+            current_directory=current_directory,
+            size=file_part.size,
+            offset=content_offset,
+            next_offset=content_end if content_end < file_part.size else None,
+            start_line=file_part.start_line,
+            end_line=file_part.end_line,
+            total_lines=file_part.total_lines,
+            truncated=file_part.truncated or None,
+            sha256=hashlib.sha256(file_part.data).hexdigest() if file_part.offset == 0 and len(file_part.data) == file_part.size else None
         )
     except Exception as e:
-        return command_result(
+        return read_result(
             success=False,
             stdout="",
             stderr=str(e),
@@ -201,6 +596,7 @@ def read_file(file_path: str) -> command_result:
         )
         
 @mcp.tool()
+@offload
 def delete_file(file_path: str) -> command_result:
     """
     Deletes a file.
@@ -212,11 +608,12 @@ def delete_file(file_path: str) -> command_result:
         command_result: The result of the file deletion command.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         file_path = os.path.join(current_directory, file_path)
         # Delete the file
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File '{file_path}' does not exist.")
+        file_writer.append_handles.release(file_path)
         os.remove(file_path)
         return command_result(
             success=True,
@@ -235,6 +632,7 @@ def delete_file(file_path: str) -> command_result:
         )
 
 @mcp.tool()
+@offload
 def copy_file(source_path: str, destination_path: str) -> command_result:
     """
     Copies a file from source to destination.
@@ -247,7 +645,7 @@ def copy_file(source_path: str, destination_path: str) -> command_result:
         command_result: The result of the file copy operation.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         source_path = os.path.join(current_directory, source_path)
         destination_path = os.path.join(current_directory, destination_path)
         
@@ -260,6 +658,7 @@ def copy_file(source_path: str, destination_path: str) -> command_result:
         # Ensure destination directory exists
         os.makedirs(os.path.dirname(destination_path), exist_ok=True)
         
+        file_writer.append_handles.release(destination_path)
         shutil.copy2(source_path, destination_path)
         
         return command_result(
@@ -279,70 +678,85 @@ def copy_file(source_path: str, destination_path: str) -> command_result:
         )
 
 @mcp.tool()
-def find_files(pattern: str, search_path: str = ".", recursive: bool = True, case_sensitive: bool = True) -> command_result:
+@offload
+def find_files(pattern: str, search_path: str = ".", recursive: bool = True, case_sensitive: bool = True,
+               max_depth: int | None = None, respect_ignore_files: bool = False, follow_symlinks: bool = False,
+               limit: int = listing.DEFAULT_PAGE_SIZE, cursor: str = "", output_format: str = "text") -> listing_result:
     """
     Searches for files matching a pattern using glob syntax.
+    Results come in pages of at most limit entries, in a stable order.
     
     Args:
-        pattern (str): The glob pattern to search for (e.g., "*.py", "test_*.txt").
+        pattern (str): The glob pattern to search for (e.g., "*.py", "test_*.txt", "src/*/test_*.py").
         search_path (str): The directory to search in (default: current directory).
         recursive (bool): Whether to search recursively in subdirectories.
         case_sensitive (bool): Whether the search should be case sensitive.
+        max_depth (int | None): How many directory levels below search_path to descend (default: unlimited).
+        respect_ignore_files (bool): Whether to skip files excluded by .gitignore/.ignore files (default: False).
+        follow_symlinks (bool): Whether to descend into symlinked directories (default: False).
+        limit (int): Maximum number of entries returned (default: 1000).
+        cursor (str): The next_cursor of a previous call with the same arguments, to get the next page.
+        output_format (str): "text" for one path per line in stdout, "records" for structured entries.
         
     Returns:
-        command_result: The result containing matching file paths.
+        listing_result: The result containing matching file paths, the total count and the next page cursor.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         search_path = os.path.join(current_directory, search_path)
         search_path = os.path.abspath(search_path)
+        listing.check_page_arguments(limit, output_format)
         
         if not os.path.exists(search_path):
             raise FileNotFoundError(f"Search path '{search_path}' does not exist.")
         
-        if recursive:
-            search_pattern = os.path.join(search_path, "**", pattern)
-            matches = glob.glob(search_pattern, recursive=True)
-        else:
-            search_pattern = os.path.join(search_path, pattern)
-            matches = glob.glob(search_pattern)
-        
-        if not case_sensitive and sys.platform != "win32":
-            # For case-insensitive search on non-Windows systems
-            import fnmatch
-            all_files = []
-            if recursive:
-                for root, dirs, files in os.walk(search_path):
-                    for file in files:
-                        all_files.append(os.path.join(root, file))
-            else:
-                all_files = [os.path.join(search_path, f) for f in os.listdir(search_path) 
-                           if os.path.isfile(os.path.join(search_path, f))]
-            
-            matches = [f for f in all_files if fnmatch.fnmatch(os.path.basename(f).lower(), pattern.lower())]
-        
-        # Convert to relative paths for cleaner output
+        # Like glob, matching ignores case on Windows
+        case_sensitive = case_sensitive and sys.platform != "win32"
+        query = {"tool": "find_files", "path": search_path, "pattern": pattern, "recursive": recursive,
+                 "case_sensitive": case_sensitive, "max_depth": max_depth,
+                 "respect_ignore_files": respect_ignore_files, "follow_symlinks": follow_symlinks}
+        after, offset = listing.decode_cursor(cursor, query)
+        entries = walker.walk(search_path, pattern, recursive=recursive, max_depth=max_depth,
+                              include_dirs=True, respect_ignore=respect_ignore_files,
+                              follow_symlinks=follow_symlinks, case_sensitive=case_sensitive,
+                              start_after=after)
+        result_page = listing.walk_page(entries, query, limit, offset, search_path)
+        
+        # Relative paths for cleaner output, computed once for the search path
+        try:
+            base = os.path.relpath(search_path, current_directory)
+        except ValueError:
+            # If relative path can't be computed, use absolute path
+            base = search_path
         relative_matches = []
-        for match in matches:
-            try:
-                rel_path = os.path.relpath(match, current_directory)
-                relative_matches.append(rel_path)
-            except ValueError:
-                # If relative path can't be computed, use absolute path
-                relative_matches.append(match)
-        
-        output = "\
-".join(sorted(relative_matches)) if relative_matches else "No files found matching the pattern."
+        for entry in result_page.entries:
+            relative = entry.path[len(search_path):].lstrip(os.sep)
+            relative_matches.append(relative if base == "." else os.path.join(base, relative))
+        
+        records = None
+        if output_format == "records":
+            records = [listing.describe_entry(entry, path) for entry, path in zip(result_page.entries, relative_matches)]
+            output = listing.page_summary(result_page, "files")
+        elif not result_page.total:
+            output = "No files found matching the pattern."
+        else:
+            output = "\n".join(relative_matches)
+            if result_page.next_cursor or result_page.offset:
+                output += "\n" + listing.page_summary(result_page, "files")
         
-        return command_result(
+        return listing_result(
             success=True,
             stdout=output,
             stderr="",
             returncode=0,
-            current_directory=current_directory
+            current_directory=current_directory,
+            entries=records,
+            next_cursor=result_page.next_cursor,
+            total=result_page.total,
+            total_is_lower_bound=result_page.total_is_lower_bound or None
         )
     except Exception as e:
-        return command_result(
+        return listing_result(
             success=False,
             stdout="",
             stderr=str(e),
@@ -351,9 +765,13 @@ def find_files(pattern: str, search_path: str = ".", recursive: bool = True, cas
         )
 
 @mcp.tool()
-def search_in_files(search_text: str, file_pattern: str = "*", search_path: str = ".", case_sensitive: bool = True, recursive: bool = True) -> command_result:
+@offload
+def search_in_files(search_text: str, file_pattern: str = "*", search_path: str = ".", case_sensitive: bool = True, recursive: bool = True,
+                    use_regex: bool = False, context_lines: int = 0, max_results: int = 1000, respect_ignore_files: bool = True) -> command_result:
     """
     Searches for text within files matching a pattern.
+    Binary files are skipped and files excluded by .gitignore/.ignore files are not searched.
+    Once build_search_index has indexed search_path, only files that can contain the text are read.
     
     Args:
         search_text (str): The text to search for.
@@ -361,48 +779,47 @@ def search_in_files(search_text: str, file_pattern: str = "*", search_path: str
         search_path (str): The directory to search in (default: current directory).
         case_sensitive (bool): Whether the search should be case sensitive.
         recursive (bool): Whether to search recursively in subdirectories.
+        use_regex (bool): Whether search_text is a regular expression (default: False).
+        context_lines (int): Number of lines to show before and after each match (default: 0).
+        max_results (int): Stop after this many matching lines (default: 1000).
+        respect_ignore_files (bool): Whether to skip files excluded by .gitignore/.ignore files (default: True).
         
     Returns:
         command_result: The result containing search results with file paths and line numbers.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         search_path = os.path.join(current_directory, search_path)
         search_path = os.path.abspath(search_path)
         
         if not os.path.exists(search_path):
             raise FileNotFoundError(f"Search path '{search_path}' does not exist.")
         
-        # Get matching files
-        if recursive:
-            pattern_path = os.path.join(search_path, "**", file_pattern)
-            files = glob.glob(pattern_path, recursive=True)
-        else:
-            pattern_path = os.path.join(search_path, file_pattern)
-            files = glob.glob(pattern_path)
+        # Loaded on first use, most sessions never search
+        from . import search, search_index
         
-        # Filter to only include actual files
-        files = [f for f in files if os.path.isfile(f)]
+        # A trigram index of the directory, when one is ready, narrows the files to scan
+        candidates = None
+        if respect_ignore_files and os.path.isdir(search_path):
+            candidates = search_index.candidate_files(search_path, search_text, file_pattern, recursive,
+                                                      case_sensitive, use_regex)
         
-        results = []
-        search_term = search_text if case_sensitive else search_text.lower()
+        outcome = search.search_files(search_path, search_text, file_pattern, recursive=recursive,
+                                      case_sensitive=case_sensitive, use_regex=use_regex,
+                                      context_lines=context_lines, max_results=max_results,
+                                      respect_ignore=respect_ignore_files, paths=candidates)
         
-        for file_path in files:
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line_num, line in enumerate(f, 1):
-                        line_to_check = line if case_sensitive else line.lower()
-                        if search_term in line_to_check:
-                            rel_path = os.path.relpath(file_path, current_directory)
-                            results.append(f"{rel_path}:{line_num}: {line.rstrip()}")
-            except (UnicodeDecodeError, PermissionError, IsADirectoryError):
-                # Skip files that can't be read
-                continue
-        
-        if results:
-            output = f"Found {len(results)} matches:\
-" + "\
-".join(results)
+        results = []
+        for match in outcome.matches:
+            rel_path = os.path.relpath(match.path, current_directory)
+            separator = "-" if match.is_context else ":"
+            results.append(f"{rel_path}{separator}{match.line_number}{separator} {match.line}")
+        
+        if outcome.match_count:
+            header = f"Found {outcome.match_count} matches"
+            if outcome.truncated:
+                header += f" (stopped at max_results={max_results})"
+            output = header + ":\n" + "\n".join(results)
         else:
             output = f"No matches found for '{search_text}' in files matching '{file_pattern}'"
         
@@ -423,6 +840,47 @@ def search_in_files(search_text: str, file_pattern: str = "*", search_path: str
         )
 
 @mcp.tool()
+def build_search_index(path: str = ".") -> command_result:
+    """
+    Builds a trigram index of a directory in the background so repeated search_in_files calls
+    on it only read files that can contain the searched text. The index is kept up to date
+    from file modification times and stored on disk for later sessions.
+    
+    Args:
+        path (str): The directory to index (default: current directory).
+        
+    Returns:
+        command_result: The result containing the state of the index.
+    """
+    try:
+        current_directory = session_state.current().cwd
+        path = os.path.join(current_directory, path)
+        path = os.path.abspath(path)
+        
+        if not os.path.isdir(path):
+            raise NotADirectoryError(f"Path '{path}' is not a directory.")
+        
+        from . import search_index
+        index = search_index.get_index(path, create=True)
+        
+        return command_result(
+            success=not index.error,
+            stdout=index.describe(),
+            stderr=index.error,
+            returncode=1 if index.error else 0,
+            current_directory=current_directory
+        )
+    except Exception as e:
+        return command_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
+@mcp.tool()
+@offload
 def get_file_info(file_path: str) -> command_result:
     """
     Gets detailed information about a file or directory.
@@ -434,7 +892,7 @@ def get_file_info(file_path: str) -> command_result:
         command_result: The result containing file information.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         file_path = os.path.join(current_directory, file_path)
         file_path = os.path.abspath(file_path)
         
@@ -491,8 +949,7 @@ def get_file_info(file_path: str) -> command_result:
         
         return command_result(
             success=True,
-            stdout="\
-".join(output_lines),
+            stdout="\n".join(output_lines),
             stderr="",
             returncode=0,
             current_directory=current_directory
@@ -507,22 +964,29 @@ def get_file_info(file_path: str) -> command_result:
         )
 
 @mcp.tool()
-def list_directory(path: str = ".", show_hidden: bool = False, show_details: bool = False) -> command_result:
+@offload
+def list_directory(path: str = ".", show_hidden: bool = False, show_details: bool = False,
+                   limit: int = listing.DEFAULT_PAGE_SIZE, cursor: str = "", output_format: str = "text") -> listing_result:
     """
     Lists the contents of a directory with optional detailed information.
+    Entries are sorted by name and come in pages of at most limit entries.
     
     Args:
         path (str): The directory path to list (default: current directory).
         show_hidden (bool): Whether to show hidden files and directories.
         show_details (bool): Whether to show detailed file information (size, permissions, dates).
+        limit (int): Maximum number of entries returned (default: 1000).
+        cursor (str): The next_cursor of a previous call with the same arguments, to get the next page.
+        output_format (str): "text" for one entry per line in stdout, "records" for structured entries.
         
     Returns:
-        command_result: The result containing directory listing.
+        listing_result: The result containing directory listing, the total count and the next page cursor.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         target_path = os.path.join(current_directory, path) if path != "." else current_directory
         target_path = os.path.abspath(target_path)
+        listing.check_page_arguments(limit, output_format)
         
         if not os.path.exists(target_path):
             raise FileNotFoundError(f"Directory '{target_path}' does not exist.")
@@ -530,40 +994,99 @@ def list_directory(path: str = ".", show_hidden: bool = False, show_details: boo
         if not os.path.isdir(target_path):
             raise NotADirectoryError(f"'{target_path}' is not a directory.")
         
-        items = []
-        for item in os.listdir(target_path):
-            if not show_hidden and item.startswith('.'):
-                continue
-            
-            item_path = os.path.join(target_path, item)
-            
-            if show_details:
-                stat_info = os.stat(item_path)
-                is_dir = os.path.isdir(item_path)
-                size = stat_info.st_size if not is_dir else 0
-                modified = datetime.fromtimestamp(stat_info.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Get permissions in readable format
-                mode = stat.filemode(stat_info.st_mode)
-                
-                item_info = f"{mode} {size:>10} {modified} {item}{'/' if is_dir else ''}"
-            else:
-                item_info = f"{item}{'/' if os.path.isdir(item_path) else ''}"
-            
-            items.append(item_info)
-        
-        output = "\
-".join(sorted(items)) if items else "Directory is empty"
-        
-        return command_result(
+        query = {"tool": "list_directory", "path": target_path, "show_hidden": show_hidden}
+        after, offset = listing.decode_cursor(cursor, query)
+        # One scandir call; entry types come with the listing, only details need a stat per entry
+        entries = walker.walk(target_path, recursive=False, include_dirs=True, include_hidden=show_hidden,
+                              include_other=True, follow_symlinks=True, sort=False)
+        result_page = listing.directory_page(entries, query, limit, after, offset)
+        records = [listing.describe_entry(entry, entry.name, show_details) for entry in result_page.entries]
+        
+        if output_format == "records":
+            output = listing.page_summary(result_page)
+        elif not result_page.total:
+            output = "Directory is empty"
+        else:
+            items = []
+            for record in records:
+                suffix = '/' if record.type == "directory" else ''
+                if show_details:
+                    items.append(f"{record.mode} {record.size:>10} {record.modified} {record.path}{suffix}")
+                else:
+                    items.append(f"{record.path}{suffix}")
+            output = "\n".join(items)
+            if result_page.next_cursor or result_page.offset:
+                output += "\n" + listing.page_summary(result_page)
+        
+        return listing_result(
             success=True,
             stdout=output,
             stderr="",
             returncode=0,
+            current_directory=current_directory,
+            entries=records if output_format == "records" else None,
+            next_cursor=result_page.next_cursor,
+            total=result_page.total
+        )
+    except Exception as e:
+        return listing_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
             current_directory=current_directory
         )
+
+def _prepare_directory_copy(current_directory: str, source_path: str, destination_path: str,
+                            sync: bool, checksum: bool) -> directory_copy.tree_copy:
+    source_path = os.path.abspath(os.path.join(current_directory, source_path))
+    destination_path = os.path.abspath(os.path.join(current_directory, destination_path))
+    
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"Source directory '{source_path}' does not exist.")
+    
+    if not os.path.isdir(source_path):
+        raise NotADirectoryError(f"'{source_path}' is not a directory.")
+    
+    if os.path.exists(destination_path) and not (sync and os.path.isdir(destination_path)):
+        raise FileExistsError(f"Destination '{destination_path}' already exists.")
+    
+    if sync:
+        # Files about to be replaced must not stay open for appending
+        file_writer.append_handles.release(destination_path)
+    return directory_copy.tree_copy(source_path, destination_path, sync, checksum)
+
+def _directory_copy_result(copy: directory_copy.tree_copy, current_directory: str) -> copy_result:
+    summary = f"{copy.files_copied} files ({directory_sizes.format_size(copy.bytes_copied)}) copied"
+    if copy.sync:
+        summary += f", {copy.files_skipped} already up to date"
+    summary += f" from '{copy.source}' to '{copy.destination}'."
+    stderr = ""
+    if copy.error_count:
+        stderr = f"{copy.error_count} entries could not be copied:\n" + "\n".join(copy.errors)
+    return copy_result(
+        success=copy.error_count == 0,
+        stdout=summary,
+        stderr=stderr,
+        returncode=0 if copy.error_count == 0 else 1,
+        current_directory=current_directory,
+        files_copied=copy.files_copied,
+        files_skipped=copy.files_skipped,
+        bytes_copied=copy.bytes_copied,
+        directories=copy.directories,
+        copy_methods=copy.methods,
+        errors=copy.errors
+    )
+
+def _copy_directory(source_path: str, destination_path: str) -> copy_result:
+    """copy_directory on the calling thread, for batch_file_operations"""
+    try:
+        current_directory = session_state.current().cwd
+        copy = _prepare_directory_copy(current_directory, source_path, destination_path, False, False)
+        copy.run()
+        return _directory_copy_result(copy, current_directory)
     except Exception as e:
-        return command_result(
+        return copy_result(
             success=False,
             stdout="",
             stderr=str(e),
@@ -572,42 +1095,40 @@ def list_directory(path: str = ".", show_hidden: bool = False, show_details: boo
         )
 
 @mcp.tool()
-def copy_directory(source_path: str, destination_path: str) -> command_result:
+async def copy_directory(source_path: str, destination_path: str, sync: bool = False, checksum: bool = False,
+                         ctx: Context = None) -> copy_result:
     """
-    Copies a directory recursively from source to destination.
+    Copies a directory recursively from source to destination, several files at a time, using
+    copy-on-write clones or in-kernel copies where the file system supports them.
     
     Args:
         source_path (str): The path of the source directory.
         destination_path (str): The path of the destination directory.
+        sync (bool): Update an existing destination instead of failing: files with the same size and
+            modification time are skipped, the others copied over; files only in the destination are kept (default: False).
+        checksum (bool): With sync, compare the content of same-size files whose modification time differs
+            and skip the identical ones (default: False).
         
     Returns:
-        command_result: The result of the directory copy operation.
+        copy_result: The result of the directory copy operation, with the files copied and skipped.
     """
     try:
-        global current_directory
-        source_path = os.path.join(current_directory, source_path)
-        destination_path = os.path.join(current_directory, destination_path)
-        
-        if not os.path.exists(source_path):
-            raise FileNotFoundError(f"Source directory '{source_path}' does not exist.")
-        
-        if not os.path.isdir(source_path):
-            raise NotADirectoryError(f"'{source_path}' is not a directory.")
-        
-        if os.path.exists(destination_path):
-            raise FileExistsError(f"Destination '{destination_path}' already exists.")
-        
-        shutil.copytree(source_path, destination_path)
-        
-        return command_result(
-            success=True,
-            stdout=f"Directory copied from '{source_path}' to '{destination_path}' successfully.",
-            stderr="",
-            returncode=0,
-            current_directory=current_directory
-        )
+        current_directory = session_state.current().cwd
+        copy = _prepare_directory_copy(current_directory, source_path, destination_path, sync, checksum)
+        report = _copy_progress_reporter(ctx)
+        task = asyncio.ensure_future(run_blocking(copy.run))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=_PROGRESS_INTERVAL)
+                if report is not None and not task.done():
+                    await report(copy)
+            await task
+        except asyncio.CancelledError:
+            copy.cancel()
+            raise
+        return _directory_copy_result(copy, current_directory)
     except Exception as e:
-        return command_result(
+        return copy_result(
             success=False,
             stdout="",
             stderr=str(e),
@@ -615,7 +1136,26 @@ def copy_directory(source_path: str, destination_path: str) -> command_result:
             current_directory=current_directory
         )
 
+def _copy_progress_reporter(ctx: Context | None):
+    """Build a callback sending the bytes and files copied so far as a progress notification, None without a progress token"""
+    try:
+        if ctx is None or ctx.request_context.meta is None or ctx.request_context.meta.progressToken is None:
+            return None
+    except ValueError:
+        # Called outside of an MCP request
+        return None
+
+    async def report(copy: directory_copy.tree_copy) -> None:
+        # The total is only known once the whole source was walked
+        total = copy.bytes_found if copy.walk_done else None
+        found = f"{copy.files_found}" if copy.walk_done else f"{copy.files_found}+"
+        await ctx.report_progress(progress=copy.bytes_done, total=total,
+                                  message=f"{copy.files_done}/{found} files, {directory_sizes.format_size(copy.bytes_done)}")
+
+    return report
+
 @mcp.tool()
+@offload
 def delete_directory(directory_path: str, recursive: bool = False) -> command_result:
     """
     Deletes a directory.
@@ -628,7 +1168,7 @@ def delete_directory(directory_path: str, recursive: bool = False) -> command_re
         command_result: The result of the directory deletion operation.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         directory_path = os.path.join(current_directory, directory_path)
         
         if not os.path.exists(directory_path):
@@ -637,6 +1177,7 @@ def delete_directory(directory_path: str, recursive: bool = False) -> command_re
         if not os.path.isdir(directory_path):
             raise NotADirectoryError(f"'{directory_path}' is not a directory.")
         
+        file_writer.append_handles.release(directory_path)
         if recursive:
             shutil.rmtree(directory_path)
             message = f"Directory '{directory_path}' and all its contents deleted successfully."
@@ -661,6 +1202,7 @@ def delete_directory(directory_path: str, recursive: bool = False) -> command_re
         )
 
 @mcp.tool()
+@offload
 def move_file_or_directory(source_path: str, destination_path: str) -> command_result:
     """
     Moves (renames) a file or directory from source to destination.
@@ -673,7 +1215,7 @@ def move_file_or_directory(source_path: str, destination_path: str) -> command_r
         command_result: The result of the move operation.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         source_path = os.path.join(current_directory, source_path)
         destination_path = os.path.join(current_directory, destination_path)
         
@@ -683,6 +1225,8 @@ def move_file_or_directory(source_path: str, destination_path: str) -> command_r
         # Ensure destination directory exists
         os.makedirs(os.path.dirname(destination_path), exist_ok=True)
         
+        file_writer.append_handles.release(source_path)
+        file_writer.append_handles.release(destination_path)
         shutil.move(source_path, destination_path)
         
         return command_result(
@@ -701,7 +1245,88 @@ def move_file_or_directory(source_path: str, destination_path: str) -> command_r
             current_directory=current_directory
         )
 
+def _run_file_tool(operation: file_operation) -> str | None:
+    """Runs one batched operation through its tool, returns the error message or None"""
+    if operation.op == "create_file":
+        result = create_file.__wrapped__(operation.path, operation.content)
+    elif operation.op == "append_to_file":
+        result = append_to_file.__wrapped__(operation.path, operation.content, operation.add_newline)
+    elif operation.op == "create_directory":
+        result = create_directory.__wrapped__(operation.path)
+    elif operation.op == "copy_file":
+        result = copy_file.__wrapped__(operation.path, operation.destination)
+    elif operation.op == "delete_file":
+        result = delete_file.__wrapped__(operation.path)
+    elif operation.op == "copy_directory":
+        result = _copy_directory(operation.path, operation.destination)
+    elif operation.op == "delete_directory":
+        result = delete_directory.__wrapped__(operation.path, operation.recursive)
+    else:
+        result = move_file_or_directory.__wrapped__(operation.path, operation.destination)
+    return None if result.success else result.stderr
+
+@mcp.tool()
+async def batch_file_operations(operations: list[file_operation], atomic: bool = False) -> batch_result:
+    """
+    Runs many file operations in one call. Operations on unrelated paths run concurrently,
+    the ones touching the same path (or a directory containing it) run in the given order.
+    
+    Args:
+        operations (list[file_operation]): The operations, each naming a tool (create_file, append_to_file,
+            create_directory, copy_file, delete_file, copy_directory, delete_directory, move_file_or_directory)
+            and its arguments: path, destination, content, add_newline or recursive.
+        atomic (bool): Apply all operations or none: file contents are staged in temporary files and renamed
+            into place, and if any operation fails the ones already applied are rolled back (default: False).
+        
+    Returns:
+        batch_result: The outcome of every operation, in the order given; failed ones carry an error.
+    """
+    try:
+        current_directory = session_state.current().cwd
+        batch.check_operations(operations)
+        cwd = current_directory
+        if atomic:
+            # Staged files are renamed over their targets, which open append handles would block on Windows
+            for operation in operations:
+                for path in (operation.path, operation.destination):
+                    if path:
+                        file_writer.append_handles.release(os.path.normpath(os.path.join(cwd, path)))
+            transaction = batch.file_transaction(cwd, operations)
+            results = await batch.run_operations(operations, cwd, transaction.apply, stop_on_error=True)
+            failed = [result for result in results if not result.success and result.error != batch.SKIPPED]
+            if failed:
+                rollback_errors = await run_blocking(transaction.rollback)
+                for result in results:
+                    if result.success:
+                        result.success, result.error = False, "Rolled back."
+                stderr = f"Operation {failed[0].index} failed, no operation was applied: {failed[0].error}"
+                if rollback_errors:
+                    stderr += "\nRollback was incomplete: " + "; ".join(rollback_errors)
+                return batch_result(success=False, stdout="", stderr=stderr, returncode=1,
+                                    current_directory=current_directory, results=results)
+            await run_blocking(transaction.commit)
+        else:
+            results = await batch.run_operations(operations, cwd, _run_file_tool)
+        failed_count = sum(1 for result in results if not result.success)
+        return batch_result(
+            success=failed_count == 0,
+            stdout=f"{len(results) - failed_count} of {len(results)} operations succeeded.",
+            stderr="" if failed_count == 0 else f"{failed_count} operations failed.",
+            returncode=0 if failed_count == 0 else 1,
+            current_directory=current_directory,
+            results=results
+        )
+    except Exception as e:
+        return batch_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
 @mcp.tool()
+@offload
 def get_disk_usage(path: str = ".") -> command_result:
     """
     Gets disk usage information for a path.
@@ -713,7 +1338,7 @@ def get_disk_usage(path: str = ".") -> command_result:
         command_result: The result containing disk usage information.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         path = os.path.join(current_directory, path)
         path = os.path.abspath(path)
         
@@ -721,14 +1346,7 @@ def get_disk_usage(path: str = ".") -> command_result:
             raise FileNotFoundError(f"Path '{path}' does not exist.")
         
         usage = shutil.disk_usage(path)
-        
-        def format_bytes(bytes_val):
-            """Convert bytes to human readable format"""
-            for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-                if bytes_val < 1024.0:
-                    return f"{bytes_val:.1f} {unit}"
-                bytes_val /= 1024.0
-            return f"{bytes_val:.1f} PB"
+        format_bytes = directory_sizes.format_size
         
         total = usage.total
         used = usage.used
@@ -745,8 +1363,7 @@ def get_disk_usage(path: str = ".") -> command_result:
         
         return command_result(
             success=True,
-            stdout="\
-".join(output_lines),
+            stdout="\n".join(output_lines),
             stderr="",
             returncode=0,
             current_directory=current_directory
@@ -761,6 +1378,170 @@ def get_disk_usage(path: str = ".") -> command_result:
         )
 
 @mcp.tool()
+@offload
+def get_directory_sizes(path: str = ".", limit: int = 20, sort_by: str = "allocated", use_cache: bool = True) -> directory_sizes_result:
+    """
+    Finds what takes up space below a directory, like `du`, walking subdirectories in parallel.
+    Reports the apparent size (bytes of content) and the allocated size (blocks on disk) of the tree,
+    counting hard-linked files once. Directories unchanged since an earlier call are not listed again.
+    
+    Args:
+        path (str): The directory to analyze (default: current directory).
+        limit (int): Number of largest entries of the directory and largest files of the tree to list, at most 100 (default: 20).
+        sort_by (str): "allocated" or "apparent", the size entries are ordered by (default: "allocated").
+        use_cache (bool): Reuse the sizes of directories whose modification time did not change; files growing
+            in place do not change it, pass False to re-read everything (default: True).
+        
+    Returns:
+        directory_sizes_result: Totals, the largest entries directly in the directory and the largest files below it.
+    """
+    try:
+        current_directory = session_state.current().cwd
+        path = os.path.abspath(os.path.join(current_directory, path))
+        if sort_by not in ("allocated", "apparent"):
+            raise ValueError(f"Unknown sort_by '{sort_by}', use 'allocated' or 'apparent'.")
+        
+        result = directory_sizes.analyze(path, limit, sort_by, use_cache)
+        size_of = (lambda entry: entry.apparent_size) if sort_by == "apparent" else (lambda entry: entry.allocated_size)
+        format_size = directory_sizes.format_size
+        output_lines = [f"{format_size(size_of(entry)):>10}  {entry.path}{'/' if entry.type == 'directory' else ''}" for entry in result.entries]
+        output_lines.append(f"{format_size(size_of(result)):>10}  total ({sort_by}) in {path}, "
+                            f"{result.files:,} files in {result.directories:,} directories")
+        if result.largest_files:
+            output_lines.append("Largest files:")
+            output_lines += [f"{format_size(size_of(entry)):>10}  {entry.path}" for entry in result.largest_files]
+        result.stdout = "\n".join(output_lines)
+        result.current_directory = current_directory
+        return result
+    except Exception as e:
+        return directory_sizes_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
+@mcp.tool()
+@offload
+def get_changes_since(cursor: str = "", path: str = ".", limit: int = 1000) -> changes_result:
+    """
+    Lists the files and directories created, modified or deleted below a directory since a cursor,
+    to find out what a command touched without listing or searching the tree again.
+    The first call, without a cursor, starts watching the directory (inotify on Linux, polling
+    elsewhere) and returns the cursor to pass after running commands.
+    
+    Args:
+        cursor (str): next_cursor of the previous call, empty to start watching (default: "").
+        path (str): The watched directory, the same with every cursor (default: current directory).
+        limit (int): Maximum number of changes to return, the rest follow next_cursor (default: 1000).
+        
+    Returns:
+        changes_result: The changes, oldest first, and the next cursor. Many changes below one directory
+        are merged into a "rescan" of it; list that directory again to see what it holds now.
+    """
+    try:
+        current_directory = session_state.current().cwd
+        path = os.path.abspath(os.path.join(current_directory, path))
+        
+        result = watcher.changes_since(path, cursor, limit)
+        if not cursor:
+            output_lines = [f"Watching {path} ({result.backend}), pass cursor=\"{result.next_cursor}\" to get what changes from now on"]
+        else:
+            output_lines = [f"{change.kind:9} {change.path}{os.sep if change.is_directory and change.path != '.' else ''}"
+                            for change in result.changes]
+            count = len(result.changes)
+            output_lines.append(f"{count} change{'s' if count != 1 else ''} in {path}"
+                                + (f", more follow cursor=\"{result.next_cursor}\"" if result.has_more else ""))
+        result.stdout = "\n".join(output_lines)
+        result.current_directory = current_directory
+        return result
+    except Exception as e:
+        return changes_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
+@mcp.tool()
+@offload
+def hash_files(path: str = ".", pattern: str = "*", recursive: bool = True, algorithm: str = "sha256",
+               find_duplicates: bool = False, respect_ignore_files: bool = False, use_cache: bool = True,
+               limit: int = 1000) -> hash_result:
+    """
+    Computes content digests of files in parallel, like `sha256sum` over a tree, or finds duplicate files.
+    Digests are cached by device, inode, size and file times, so unchanged files are not read again.
+    
+    Args:
+        path (str): The directory whose files to hash, or a single file (default: current directory).
+        pattern (str): Glob the hashed files match (e.g., "*.whl", "dist/*") (default: "*").
+        recursive (bool): Whether to hash files in subdirectories (default: True).
+        algorithm (str): sha256, sha1, sha512, md5, blake2b, blake2s or sha3_256 (default: "sha256").
+        find_duplicates (bool): Report groups of files with the same content instead of every digest; same-size
+            files are first compared by their first and last 64 KB, so most files are never read in full (default: False).
+        respect_ignore_files (bool): Whether to skip files excluded by .gitignore/.ignore files (default: False).
+        use_cache (bool): Reuse digests of files unchanged since they were hashed (default: True).
+        limit (int): Maximum number of files hashed, or of duplicate groups returned (default: 1000).
+        
+    Returns:
+        hash_result: The digests in `sha256sum` format in stdout and as records, or the duplicate groups.
+    """
+    try:
+        current_directory = session_state.current().cwd
+        path = os.path.abspath(os.path.join(current_directory, path))
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Path '{path}' does not exist.")
+        
+        run = file_hashes.find_duplicates if find_duplicates else file_hashes.hash_tree
+        result = run(path, pattern, recursive, algorithm, respect_ignore_files, use_cache, limit)
+        
+        # Paths relative to the current directory, like find_files
+        try:
+            base = os.path.relpath(path, current_directory)
+        except ValueError:
+            base = path
+        
+        def display(relative: str) -> str:
+            return base if not relative else relative if base == "." else os.path.join(base, relative)
+        
+        format_size = directory_sizes.format_size
+        if find_duplicates:
+            output_lines = []
+            for group in result.duplicates:
+                output_lines.append(f"{len(group.paths)} files of {format_size(group.size)}, {algorithm} {group.digest}")
+                group.paths = [display(relative) for relative in group.paths]
+                output_lines += [f"  {relative}" for relative in group.paths]
+            output_lines.append(f"{len(result.duplicates)} duplicate groups, {format_size(result.duplicate_bytes)} in extra copies"
+                                + (f", only the first {limit} listed" if result.truncated else ""))
+        else:
+            output_lines = []
+            for entry in result.files:
+                entry.path = display(entry.path)
+                output_lines.append(f"{entry.digest}  {entry.path}")
+            if result.truncated:
+                output_lines.append(f"Only the first {limit} files were hashed, narrow the pattern or raise limit.")
+        output_lines.append(f"{result.files_hashed} files read ({format_size(result.bytes_hashed)}), {result.files_cached} from the cache")
+        if result.errors:
+            output_lines.append("Files that could not be read:")
+            output_lines += result.errors
+        result.stdout = "\n".join(output_lines)
+        result.current_directory = current_directory
+        return result
+    except Exception as e:
+        return hash_result(
+            success=False,
+            stdout="",
+            stderr=str(e),
+            returncode=1,
+            current_directory=current_directory
+        )
+
+@mcp.tool()
+@offload
 def get_system_info() -> command_result:
     """
     Gets system information including OS, Python version, and environment details.
@@ -769,7 +1550,8 @@ def get_system_info() -> command_result:
         command_result: The result containing system information.
     """
     try:
-        global current_directory
+        state = session_state.current()
+        current_directory, env = state.cwd, state.env
         
         info = {
             "platform": platform.platform(),
@@ -781,10 +1563,10 @@ def get_system_info() -> command_result:
             "python_version": platform.python_version(),
             "python_implementation": platform.python_implementation(),
             "current_directory": current_directory,
-            "user": os.environ.get("USER") or os.environ.get("USERNAME", "Unknown"),
+            "user": env.get("USER") or env.get("USERNAME", "Unknown"),
             "home_directory": os.path.expanduser("~"),
             "path_separator": os.sep,
-            "environment_variables_count": len(os.environ)
+            "environment_variables_count": len(env)
         }
         
         output_lines = [
@@ -805,8 +1587,7 @@ def get_system_info() -> command_result:
         
         return command_result(
             success=True,
-            stdout="\
-".join(output_lines),
+            stdout="\n".join(output_lines),
             stderr="",
             returncode=0,
             current_directory=current_directory
@@ -832,9 +1613,9 @@ def get_environment_variables(filter_pattern: str = "") -> command_result:
         command_result: The result containing environment variables.
     """
     try:
-        global current_directory
+        current_directory = session_state.current().cwd
         
-        env_vars = dict(os.environ)
+        env_vars = dict(session_state.current().env)
         
         if filter_pattern:
             filtered_vars = {
@@ -849,10 +1630,8 @@ def get_environment_variables(filter_pattern: str = "") -> command_result:
         else:
             output_lines = [f"{key}={value}" for key, value in sorted(filtered_vars.items())]
             count = len(filtered_vars)
-            header = f"Found {count} environment variable{'s' if count != 1 else ''}" + (f" matching '{filter_pattern}'" if filter_pattern else "") + ":\
-"
-            output = header + "\
-".join(output_lines)
+            header = f"Found {count} environment variable{'s' if count != 1 else ''}" + (f" matching '{filter_pattern}'" if filter_pattern else "") + ":\n"
+            output = header + "\n".join(output_lines)
         
         return command_result(
             success=True,
@@ -883,9 +1662,14 @@ def set_environment_variable(name: str, value: str) -> command_result:
         command_result: The result of setting the environment variable.
     """
     try:
-        global current_directory
+        state = session_state.current()
+        current_directory = state.cwd
         
-        os.environ[name] = value
+        state.set_env(name, value)
+        # The running shell of this session was started with the old environment
+        session = shell_session.find_shell_session(state.shell_session_id)
+        if session is not None:
+            session.set_env(name, value)
         
         return command_result(
             success=True,
@@ -903,3 +1687,24 @@ def set_environment_variable(name: str, value: str) -> command_result:
             current_directory=current_directory
         )
 
+
+@mcp.tool()
+def get_server_stats(reset: bool = False) -> server_stats:
+    """
+    Returns call counts, error counts, latency percentiles and payload sizes of every tool called so far,
+    and for commands the time spent spawning the process vs running it.
+    
+    Args:
+        reset (bool): Start counting from zero again after reading the statistics (default: False).
+        
+    Returns:
+        server_stats: Statistics per tool; empty when telemetry is turned off (MCP_TERMINAL_TELEMETRY=0).
+    """
+    return telemetry.snapshot(reset)
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request):
+    """Prometheus endpoint, served next to /mcp and /sse when the server runs over HTTP"""
+    # Only imported when an HTTP transport serves the route
+    from starlette.responses import PlainTextResponse
+    return PlainTextResponse(telemetry.prometheus_text(), media_type="text/plain; version=0.0.4")
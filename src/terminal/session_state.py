@@ -0,0 +1,66 @@
+import os
+import threading
+import uuid
+import weakref
+from types import MappingProxyType
+from mcp.server.lowlevel.server import request_ctx
+from . import jobs, shell_session
+
+# Environment and directory the server was started in, every session starts from them
+_base_env = dict(os.environ)
+_start_directory = os.getcwd()
+
+class session_state:
+    """
+    Working directory and environment of one MCP session.
+
+    Readers never lock: cwd, env_overlay and env are replaced as a whole rather than
+    changed in place, so a reader always sees a consistent value. The environment handed
+    to child processes is merged once per change of the overlay, not once per spawn.
+    """
+
+    def __init__(self, cwd: str):
+        self.cwd = cwd
+        # Identifies the session, e.g. as the owner of its background jobs
+        self.session_id = uuid.uuid4().hex
+        self.env_overlay: MappingProxyType = MappingProxyType({})
+        # Environment of the processes started for this session
+        self.env: dict[str, str] = _base_env
+        # The persistent shell of this session (see shell_session)
+        self.shell_session_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+
+    def set_env(self, name: str, value: str) -> None:
+        with self._lock:
+            overlay = {**self.env_overlay, name: value}
+            env = {**_base_env, **overlay}
+            self.env_overlay, self.env = MappingProxyType(overlay), env
+
+_states: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_states_lock = threading.Lock()
+# State of calls made outside an MCP session (in-process calls, tests)
+_default_state = session_state(_start_directory)
+
+def current() -> session_state:
+    """
+    State of the MCP session the running request belongs to, created on its first request
+    and dropped with the session. Works in tools offloaded to worker threads too, since
+    run_blocking carries the request context along.
+    """
+    request = request_ctx.get(None)
+    session = request.session if request is not None else None
+    if session is None:
+        return _default_state
+    state = _states.get(session)
+    if state is None:
+        with _states_lock:
+            state = _states.get(session)
+            if state is None:
+                state = _states[session] = session_state(_start_directory)
+                # The persistent shell and the background jobs of a session go away with it
+                weakref.finalize(session, shell_session.discard_shell_session, state.shell_session_id)
+                weakref.finalize(session, jobs.discard_session_jobs, state.session_id)
+    return state
+
+def iter_states() -> list[session_state]:
+    return [_default_state, *list(_states.values())]
@@ -0,0 +1,113 @@
+import atexit
+import os
+import threading
+import time
+import weakref
+from typing import Any, BinaryIO
+
+def env_int(name: str, default: int) -> int:
+    """Read a positive integer setting from the environment, falling back to default"""
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+def env_float(name: str, default: float) -> float:
+    """Read a non-negative number from the environment, falling back to default"""
+    try:
+        value = float(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value >= 0 else default
+
+def env_bool(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+# Seconds after which run_command kills the command, 0 disables the default timeout
+command_timeout = env_float("MCP_TERMINAL_COMMAND_TIMEOUT", 600)
+
+# Resource limits applied to every command on POSIX systems, 0 means unlimited
+cpu_time_limit = env_int("MCP_TERMINAL_CPU_LIMIT", 0)
+memory_limit_mb = env_int("MCP_TERMINAL_MEMORY_LIMIT_MB", 0)
+file_size_limit_mb = env_int("MCP_TERMINAL_FILE_SIZE_LIMIT_MB", 0)
+
+def _default_cache_dir() -> str:
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "mcp-terminal")
+
+# Where persistent caches (search indexes, ...) are stored
+cache_dir = os.environ.get("MCP_TERMINAL_CACHE_DIR") or _default_cache_dir()
+
+# Seconds between saves of a persistent cache that keeps changing, it is always saved on exit
+CACHE_SAVE_INTERVAL = 60
+
+class persistent_cache:
+    """
+    In-memory data saved to a file under cache_dir. Subclasses set dirty when the data changes,
+    take a snapshot of it under _lock in _snapshot and write that snapshot out in _write. The
+    file is replaced atomically, so a concurrently starting server never reads half of it.
+    """
+
+    def __init__(self, cache_path: str | None):
+        self.cache_path = cache_path
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _snapshot(self) -> Any:
+        raise NotImplementedError
+
+    def _write(self, f: BinaryIO, snapshot: Any) -> None:
+        raise NotImplementedError
+
+    def save(self) -> None:
+        """Writes the data to cache_path through a temporary file, raises OSError when that fails"""
+        if self.cache_path is None:
+            return
+        with self._lock:
+            snapshot = self._snapshot()
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        temporary = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                self._write(f, snapshot)
+            os.replace(temporary, self.cache_path)
+        except OSError:
+            self.dirty = True
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+        self.saved_at = time.monotonic()
+
+    def save_if_dirty(self) -> None:
+        if self.dirty:
+            try:
+                self.save()
+            except OSError:
+                pass
+
+    def save_if_due(self) -> None:
+        if time.monotonic() - self.saved_at > CACHE_SAVE_INTERVAL:
+            self.save_if_dirty()
+
+    def save_on_exit(self) -> None:
+        """Saves the data when the server exits, if it changed since the last save"""
+        _exit_saves.add(self)
+
+_exit_saves: weakref.WeakSet[persistent_cache] = weakref.WeakSet()
+
+def _save_caches() -> None:
+    for cache in list(_exit_saves):
+        cache.save_if_dirty()
+
+atexit.register(_save_caches)
@@ -0,0 +1,251 @@
+import asyncio
+import contextvars
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import uuid
+from .terminal import run_result
+from .decoding import output_decoder
+from .settings import env_bool
+
+_READ_CHUNK_SIZE = 64 * 1024
+# Seconds the other stream gets to reach its end once the shell exited, a background process
+# still holding the pipe open would keep it from ever closing
+_EOF_GRACE = 0.5
+
+# Opt-in: run_command reuses one shell per session instead of spawning a process per command
+persistent_shell_enabled = env_bool("MCP_TERMINAL_PERSISTENT_SHELL")
+
+def persistent_shell_supported() -> bool:
+    """Persistent sessions rely on a POSIX shell; Windows keeps the one-process-per-command path"""
+    return sys.platform != "win32"
+
+def _shell_executable() -> list[str]:
+    bash = shutil.which("bash")
+    if bash:
+        return [bash, "--noprofile", "--norc"]
+    return ["/bin/sh"]
+
+class shell_session:
+    """
+    A long-lived shell process that runs commands one after another.
+
+    Each command is followed by sentinel markers on stdout and stderr, which carry
+    the exit code and working directory, so no process is spawned per command and
+    shell state (exported variables, functions, activated venvs) survives between calls.
+    """
+
+    def __init__(self, cwd: str, env: dict[str, str] | None = None):
+        self.cwd = cwd
+        # Environment the shell starts with, later changes go through set_env
+        self._env = os.environ if env is None else env
+        self._process: asyncio.subprocess.Process | None = None
+        self._lock = asyncio.Lock()
+        self._pending_env: dict[str, str] = {}
+        self._sentinel = f"__MCP_TERMINAL_{uuid.uuid4().hex}__".encode()
+        # Detected from the first output of the session, then reused
+        self._encoding: str | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def _start(self) -> None:
+        # Spawned outside the request context: the pipe transports outlive the request and
+        # would otherwise keep its MCP session alive
+        self._process = await asyncio.create_task(self._spawn(), context=contextvars.Context())
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(*_shell_executable(),
+                                                             env=self._env,
+                                                             stdin=subprocess.PIPE,
+                                                             stdout=subprocess.PIPE,
+                                                             stderr=subprocess.PIPE,
+                                                             cwd=self.cwd,
+                                                             # Own process group so a timeout kills the running command too
+                                                             start_new_session=True)
+
+    def _decode(self, data: bytes) -> str:
+        decoder = output_decoder(self._encoding)
+        text = decoder.decode(data, final=True)
+        if data:
+            self._encoding = None if decoder.mismatch else decoder.encoding
+        return text
+
+    def set_env(self, name: str, value: str) -> None:
+        """Queue an exported variable, applied before the next command"""
+        self._pending_env[name] = value
+
+    def _build_script(self, command: str) -> bytes:
+        sentinel = self._sentinel.decode()
+        lines = [f"export {name}={shlex.quote(value)}" for name, value in self._pending_env.items()]
+        lines += [
+            f"cd -- {shlex.quote(self.cwd)} 2>/dev/null",
+            # eval keeps syntax errors from terminating the shell, /dev/null keeps the command off our stdin
+            f"eval {shlex.quote(command)} < /dev/null",
+            "__mcp_rc=$?",
+            f"printf '\\n{sentinel} %d %s\\n' \"$__mcp_rc\" \"$PWD\"",
+            f"printf '\\n{sentinel}\\n' >&2",
+        ]
+        return ("\n".join(lines) + "\n").encode()
+
+    async def _read_until_sentinel(self, stream: asyncio.StreamReader, buffer: bytearray) -> tuple[bytes, bytes]:
+        """
+        Read a stream up to the sentinel line, returns (output, sentinel line payload).
+        Raises EOFError when the stream ends first, buffer then holds what was read.
+        """
+        marker = b"\n" + self._sentinel
+        search_from = 0
+        while True:
+            index = buffer.find(marker, search_from)
+            if index != -1:
+                end = buffer.find(b"\n", index + len(marker))
+                if end != -1:
+                    return bytes(buffer[:index]), bytes(buffer[index + len(marker):end])
+            else:
+                search_from = max(0, len(buffer) - len(marker))
+            chunk = await stream.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                raise EOFError()
+            buffer.extend(chunk)
+
+    async def run(self, command: str, timeout: float | None = None) -> run_result:
+        """
+        Runs a command inside the session shell.
+
+        Args:
+            command (str): The command to run.
+            timeout (float | None): Seconds before the shell and the command are killed, the session state is lost then.
+
+        Returns:
+            run_result: The result of the command, current_directory reflects any cd done by the command.
+        """
+        async with self._lock:
+            stdout_buffer, stderr_buffer = bytearray(), bytearray()
+            stdout_task = stderr_task = None
+            try:
+                if not self.alive:
+                    await self._start()
+                self._process.stdin.write(self._build_script(command))
+                self._pending_env.clear()
+                await self._process.stdin.drain()
+
+                stdout_task = asyncio.ensure_future(self._read_until_sentinel(self._process.stdout, stdout_buffer))
+                stderr_task = asyncio.ensure_future(self._read_until_sentinel(self._process.stderr, stderr_buffer))
+                try:
+                    (stdout_bytes, status), (stderr_bytes, _) = await asyncio.wait_for(
+                        asyncio.gather(stdout_task, stderr_task), timeout or None)
+                except asyncio.TimeoutError:
+                    await self.close()
+                    return run_result(
+                        success = False,
+                        stdout = "",
+                        stderr = f"Command timed out after {timeout:g} seconds, the shell session was restarted.",
+                        returncode = 1,
+                        current_directory = self.cwd,
+                        timed_out = True
+                    )
+                except EOFError:
+                    # The other stream is read to its end below
+                    raise
+                except BaseException:
+                    stdout_task.cancel()
+                    stderr_task.cancel()
+                    raise
+
+                returncode, _, cwd = status.decode(errors="replace").strip().partition(" ")
+                self.cwd = cwd or self.cwd
+                returncode = int(returncode)
+                return run_result(
+                    success = returncode == 0,
+                    stdout = self._decode(stdout_bytes),
+                    stderr = self._decode(stderr_bytes),
+                    returncode = returncode,
+                    current_directory = self.cwd
+                )
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                # The command terminated the shell (e.g. `exit`), a fresh one is started on the next call
+                returncode = await self._process.wait() if self._process else 1
+                self._process = None
+                tasks = [task for task in (stdout_task, stderr_task) if task is not None]
+                pending = [task for task in tasks if not task.done()]
+                if pending:
+                    await asyncio.wait(pending, timeout=_EOF_GRACE)
+                for task in pending:
+                    task.cancel()
+                # Each stream keeps what the command printed to it
+                stdout = self._decode(self._stream_output(stdout_task, stdout_buffer))
+                stderr = self._decode(self._stream_output(stderr_task, stderr_buffer))
+                separator = "\n" if stderr and not stderr.endswith("\n") else ""
+                return run_result(
+                    success = False,
+                    stdout = stdout,
+                    stderr = f"{stderr}{separator}Shell session exited with code {returncode}.",
+                    returncode = returncode or 1,
+                    current_directory = self.cwd
+                )
+            except asyncio.CancelledError:
+                # The stream position is unknown after a cancelled read, discard the shell
+                await self.close()
+                raise
+            except Exception as e:
+                return run_result(
+                    success = False,
+                    stdout = "",
+                    stderr = str(e),
+                    returncode = 1,
+                    current_directory = self.cwd
+                )
+
+    @staticmethod
+    def _stream_output(task: asyncio.Task | None, buffer: bytearray) -> bytes:
+        """Output of a stream read by _read_until_sentinel, whether it reached the sentinel or not"""
+        if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+            return task.result()[0]
+        return bytes(buffer)
+
+    async def close(self) -> None:
+        process, self._process = self._process, None
+        if process is None or process.returncode is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        await process.wait()
+
+_sessions: dict[str, shell_session] = {}
+
+def get_shell_session(cwd: str, session_id: str = "default", env: dict[str, str] | None = None) -> shell_session:
+    """Returns the shell session for session_id, creating it on first use"""
+    session = _sessions.get(session_id)
+    if session is None:
+        session = _sessions[session_id] = shell_session(cwd, env)
+    return session
+
+def find_shell_session(session_id: str = "default") -> shell_session | None:
+    """Returns the shell session for session_id if one is running"""
+    return _sessions.get(session_id)
+
+async def close_shell_session(session_id: str = "default") -> bool:
+    session = _sessions.pop(session_id, None)
+    if session is None:
+        return False
+    await session.close()
+    return True
+
+def discard_shell_session(session_id: str) -> None:
+    """Kills the shell of a client that went away, without waiting for it"""
+    session = _sessions.pop(session_id, None)
+    process = session._process if session is not None else None
+    if process is not None and process.returncode is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+def iter_shell_sessions():
+    return list(_sessions.values())
@@ -0,0 +1,313 @@
+import atexit
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from pydantic import BaseModel, Field
+from pydantic_core import to_json
+from mcp.server.fastmcp import Context
+from .settings import env_bool, env_float
+
+# Measure every tool call; when off, tools are registered without any wrapper
+enabled = env_bool("MCP_TERMINAL_TELEMETRY", True)
+# Prometheus text file rewritten with the current metrics (e.g. for node_exporter's textfile collector)
+metrics_file = os.environ.get("MCP_TERMINAL_METRICS_FILE") or None
+# JSONL file receiving one line per tool call
+trace_file = os.environ.get("MCP_TERMINAL_TRACE_FILE") or None
+# Seconds between rewrites of the metrics file and flushes of the trace file
+flush_interval = env_float("MCP_TERMINAL_METRICS_INTERVAL", 10)
+
+# Upper bounds of the latency buckets in seconds, Prometheus' defaults widened for long commands
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class histogram:
+    """Bucketed latencies, as Prometheus histograms count them"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, capped by the largest value seen"""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(LATENCY_BUCKETS + (math.inf,), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class tool_metrics:
+    __slots__ = ("calls", "errors", "latency", "request_bytes", "response_bytes", "max_response_bytes", "phases")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = histogram()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.max_response_bytes = 0
+        self.phases: dict[str, histogram] = {}
+
+class latency_summary(BaseModel):
+    count: int = Field(default=0, description="Number of observations")
+    total_seconds: float = Field(default=0, description="Sum of all observations")
+    p50: float = Field(default=0, description="Median in seconds, as the upper bound of its histogram bucket")
+    p95: float = Field(default=0, description="95th percentile in seconds, as the upper bound of its histogram bucket")
+    p99: float = Field(default=0, description="99th percentile in seconds, as the upper bound of its histogram bucket")
+    max: float = Field(default=0, description="Slowest observation in seconds")
+
+class tool_stats(BaseModel):
+    calls: int = Field(default=0, description="Calls of the tool")
+    errors: int = Field(default=0, description="Calls that raised or returned success=false")
+    latency: latency_summary = Field(default_factory=latency_summary, description="Time spent in the tool")
+    request_bytes: int = Field(default=0, description="Estimated JSON size of all arguments received")
+    response_bytes: int = Field(default=0, description="Estimated size of all results returned, from the length of their stdout and stderr")
+    max_response_bytes: int = Field(default=0, description="Estimated size of the largest result")
+    phases: dict[str, latency_summary] = Field(default_factory=dict, description="Time per phase of a call, e.g. spawn and run of a command")
+
+class server_stats(BaseModel):
+    enabled: bool = Field(description="Whether tool calls are measured (MCP_TERMINAL_TELEMETRY)")
+    uptime_seconds: float = Field(description="Seconds since the server started, or since the last reset")
+    tools: dict[str, tool_stats] = Field(default_factory=dict, description="Statistics per tool, for the tools called at least once")
+
+_metrics: dict[str, tool_metrics] = {}
+_lock = threading.Lock()
+_started = time.monotonic()
+# Phase durations of the running tool call, see record_phase
+_phases: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("mcp_terminal_phases", default=None)
+_trace = None
+_next_flush = 0.0
+
+def instrument(fn):
+    """
+    Wraps a tool function so every call is measured. Returns fn itself when telemetry is off.
+    The wrapper keeps the name, docstring and signature of fn so it can be registered as a tool.
+    """
+    if not enabled:
+        return fn
+    name = fn.__name__
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            phases = {}
+            token = _phases.set(phases)
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException as e:
+                _record(name, time.perf_counter() - start, kwargs, phases, error=e)
+                raise
+            finally:
+                _phases.reset(token)
+            _record(name, time.perf_counter() - start, kwargs, phases, result)
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            phases = {}
+            token = _phases.set(phases)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                _record(name, time.perf_counter() - start, kwargs, phases, error=e)
+                raise
+            finally:
+                _phases.reset(token)
+            _record(name, time.perf_counter() - start, kwargs, phases, result)
+            return result
+    return wrapper
+
+def record_phase(name: str, seconds: float) -> None:
+    """Adds seconds to a phase (spawn, run, ...) of the tool call running in this context"""
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+def _json_size(value) -> int:
+    try:
+        return len(to_json(value, fallback=str))
+    except Exception:
+        return 0
+
+def _request_size(kwargs: dict) -> int:
+    """Estimated JSON size of the arguments, strings (file content, commands) by their length"""
+    size = 0
+    for key, value in kwargs.items():
+        if isinstance(value, Context):
+            continue
+        size += len(key) + (len(value) + 2 if isinstance(value, str) else _json_size(value)) + 4
+    return size
+
+def _response_size(result) -> int:
+    """
+    Estimated JSON size of a result from the length of its stdout and stderr, which make up nearly all of
+    a large response. Serializing the result again would cost as much as the client's own encoding.
+    """
+    stdout, stderr = getattr(result, "stdout", None), getattr(result, "stderr", None)
+    if isinstance(stdout, str) and isinstance(stderr, str):
+        return len(stdout) + len(stderr)
+    return _json_size(result)
+
+def _record(name: str, seconds: float, kwargs: dict, phases: dict[str, float], result=None, error: BaseException | None = None) -> None:
+    request_bytes = _request_size(kwargs)
+    response_bytes = _response_size(result) if error is None else 0
+    failed = error is not None or getattr(result, "success", True) is False
+    with _lock:
+        metrics = _metrics.get(name)
+        if metrics is None:
+            metrics = _metrics[name] = tool_metrics()
+        metrics.calls += 1
+        metrics.errors += failed
+        metrics.latency.observe(seconds)
+        metrics.request_bytes += request_bytes
+        metrics.response_bytes += response_bytes
+        if response_bytes > metrics.max_response_bytes:
+            metrics.max_response_bytes = response_bytes
+        for phase, phase_seconds in phases.items():
+            phase_histogram = metrics.phases.get(phase)
+            if phase_histogram is None:
+                phase_histogram = metrics.phases[phase] = histogram()
+            phase_histogram.observe(phase_seconds)
+    if trace_file is not None:
+        _write_trace(name, seconds, request_bytes, response_bytes, phases, failed, error)
+    if (metrics_file is not None or trace_file is not None) and time.monotonic() >= _next_flush:
+        flush()
+
+def _write_trace(name: str, seconds: float, request_bytes: int, response_bytes: int,
+                 phases: dict[str, float], failed: bool, error: BaseException | None) -> None:
+    global _trace
+    entry = {
+        "time": round(time.time(), 6),
+        "tool": name,
+        "seconds": round(seconds, 6),
+        "success": not failed,
+        "request_bytes": request_bytes,
+        "response_bytes": response_bytes,
+    }
+    if phases:
+        entry["phases"] = {phase: round(phase_seconds, 6) for phase, phase_seconds in phases.items()}
+    if error is not None:
+        entry["error"] = type(error).__name__
+    line = json.dumps(entry) + "\n"
+    with _lock:
+        try:
+            if _trace is None:
+                _trace = open(trace_file, "a", encoding="utf-8")
+            _trace.write(line)
+        except OSError:
+            pass
+
+def _summary(values: histogram) -> latency_summary:
+    return latency_summary(
+        count=values.count,
+        total_seconds=round(values.total, 6),
+        p50=round(values.quantile(0.50), 6),
+        p95=round(values.quantile(0.95), 6),
+        p99=round(values.quantile(0.99), 6),
+        max=round(values.max, 6)
+    )
+
+def snapshot(reset: bool = False) -> server_stats:
+    """
+    Statistics of every tool called so far.
+
+    Args:
+        reset (bool): Start counting from zero again after taking the snapshot.
+
+    Returns:
+        server_stats: Calls, errors, latency, payload sizes and phases per tool.
+    """
+    global _started
+    with _lock:
+        tools = {
+            name: tool_stats(
+                calls=metrics.calls,
+                errors=metrics.errors,
+                latency=_summary(metrics.latency),
+                request_bytes=metrics.request_bytes,
+                response_bytes=metrics.response_bytes,
+                max_response_bytes=metrics.max_response_bytes,
+                phases={phase: _summary(values) for phase, values in metrics.phases.items()}
+            )
+            for name, metrics in sorted(_metrics.items())
+        }
+        uptime = time.monotonic() - _started
+        if reset:
+            _metrics.clear()
+            _started = time.monotonic()
+    return server_stats(enabled=enabled, uptime_seconds=round(uptime, 3), tools=tools)
+
+def _histogram_lines(metric: str, labels: str, values: histogram) -> list[str]:
+    lines, cumulative = [], 0
+    for bound, count in zip(LATENCY_BUCKETS, values.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {values.count}')
+    lines.append(f"{metric}_sum{{{labels}}} {values.total:.6f}")
+    lines.append(f"{metric}_count{{{labels}}} {values.count}")
+    return lines
+
+def prometheus_text() -> str:
+    """The metrics in the Prometheus text exposition format"""
+    counters = (
+        ("mcp_terminal_tool_calls_total", "Tool calls.", "calls"),
+        ("mcp_terminal_tool_errors_total", "Tool calls that raised or returned success=false.", "errors"),
+        ("mcp_terminal_tool_request_bytes_total", "Estimated JSON size of the arguments received.", "request_bytes"),
+        ("mcp_terminal_tool_response_bytes_total", "Estimated size of the results returned, from their stdout and stderr.", "response_bytes"),
+    )
+    with _lock:
+        metrics = sorted(_metrics.items())
+        lines = []
+        for metric, description, attribute in counters:
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{tool="{name}"}} {getattr(values, attribute)}' for name, values in metrics]
+        lines += ["# HELP mcp_terminal_tool_duration_seconds Time spent in the tool.",
+                  "# TYPE mcp_terminal_tool_duration_seconds histogram"]
+        for name, values in metrics:
+            lines += _histogram_lines("mcp_terminal_tool_duration_seconds", f'tool="{name}"', values.latency)
+        lines += ["# HELP mcp_terminal_tool_phase_seconds Time per phase of a tool call (spawn, run).",
+                  "# TYPE mcp_terminal_tool_phase_seconds histogram"]
+        for name, values in metrics:
+            for phase, phase_values in sorted(values.phases.items()):
+                lines += _histogram_lines("mcp_terminal_tool_phase_seconds", f'tool="{name}",phase="{phase}"', phase_values)
+    return "\n".join(lines) + "\n"
+
+def flush() -> None:
+    """Rewrites the metrics file and flushes the trace file"""
+    global _next_flush
+    _next_flush = time.monotonic() + flush_interval
+    if metrics_file is not None:
+        temporary = f"{metrics_file}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(prometheus_text())
+            # Readers never see a half-written file
+            os.replace(temporary, metrics_file)
+        except OSError:
+            pass
+    with _lock:
+        if _trace is not None:
+            try:
+                _trace.flush()
+            except OSError:
+                pass
+
+if enabled and (metrics_file is not None or trace_file is not None):
+    atexit.register(flush)
@@ -1,9 +1,21 @@
+import asyncio
+import io
+import signal
 import subprocess
 import os
-import locale
 import sys
 import shlex 
+import time
+from typing import Awaitable, Callable
 from pydantic import BaseModel, Field
+from .process import spawned_process
+from .decoding import output_decoder, command_encodings
+from .compaction import compaction_options, compaction_report, compacting_buffer
+from . import telemetry
+
+# Bytes of stdout/stderr kept in the final result of a streamed command (split between head and tail)
+DEFAULT_STREAM_OUTPUT_LIMIT = 256 * 1024
+_STREAM_CHUNK_SIZE = 64 * 1024
 
 class command_result(BaseModel):
     success: bool = Field(default=False, description="Indicates if the command was successful")
@@ -12,72 +24,286 @@ class command_result(BaseModel):
     returncode: int = Field(default=1, description="Return code of the command execution")
     current_directory: str = Field(default=os.getcwd(), description="Current working directory after command execution")
 
-def _get_encoding_candidates() -> list[str]:
-    return [sys.stdout.encoding, sys.stdin.encoding, locale.getpreferredencoding()]
-
-def _decode_output(output_bytes, encoding_candidates : list[str] = [] ):
-    """Try to decode output with multiple encodings"""
-    if isinstance(output_bytes, str):
-        return output_bytes
-             
-    encodings_to_try_last = [
-        'utf-8',
-        'utf-16',
-        'latin1',  # This rarely fails but may produce garbage
-    ]
-    
-    encoding_candidates.extend(encodings_to_try_last)
-    
-    for encoding in encoding_candidates:
-        try:
-            return output_bytes.decode(encoding)
-        except (UnicodeDecodeError, UnicodeError, LookupError):
-            continue
+class run_result(command_result):
+    wall_time: float | None = Field(default=None, description="Wall-clock seconds the command ran")
+    cpu_time: float | None = Field(default=None, description="User and system CPU seconds used by the command and the processes it waited for")
+    peak_rss: int | None = Field(default=None, description="Peak resident set size of the command in bytes, null when it stayed below the server's own footprint")
+    timed_out: bool | None = Field(default=None, description="Set when the command was killed because it exceeded its timeout")
+    compaction: compaction_report | None = Field(default=None, description="What output compaction removed, set when it was applied")
+
+def _program_name(command : list[str]) -> str:
+    """Key under which the output encoding of a command is remembered"""
+    return os.path.basename(command[0]) if command else ""
+
+def _prepare_command(command : list[str] | str) -> tuple[list[str], str]:
+    """Split the command and build the string handed to the platform shell"""
+    command = command if isinstance(command, list) else shlex.split(command)
+    command_str = ' '.join(part for part in command)
     
-    # Last resort: decode with errors='replace'
-    try:
-        return output_bytes.decode('utf-8', errors='replace')
-    except:
-        return str(output_bytes)
+    if sys.platform == "win32":
+        command_str = "powershell -Command " + command_str
+    return command, command_str
+
+def _shell_argv(command_str : str) -> list[str]:
+    """Build the argv equivalent to subprocess.run(command_str, shell=True)"""
+    if sys.platform == "win32":
+        return [os.environ.get("COMSPEC", "cmd.exe"), "/c", command_str]
+    return ["/bin/sh", "-c", command_str]
 
-def terminal_run_command(command : list[str] | str, cwd : str = os.getcwd(), change_directory : bool = False) -> command_result:
-    encodings = _get_encoding_candidates()
+def terminal_run_command(command : list[str] | str, cwd : str = os.getcwd(), change_directory : bool = False,
+                         timeout : float | None = None, env : dict[str, str] | None = None) -> run_result:
     try:
 
-        command = command if isinstance(command, list) else shlex.split(command)
-        command_str = ' '.join(part for part in command)
-        
-        if sys.platform == "win32":
-            command_str = "powershell -Command " + command_str
+        command, command_str = _prepare_command(command)
         
-        result = subprocess.run(command_str, 
-                                shell=True,
-                                env=os.environ,
-                                stdin=subprocess.DEVNULL,
-                                check=False,
-                                capture_output=True,
-                                #executable="powershell" if sys.platform == "win32" else "/bin/bash",
-                                cwd=cwd,
-                                text=False)
+        process = subprocess.Popen(command_str, 
+                                   shell=True,
+                                   env=os.environ if env is None else env,
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   #executable="powershell" if sys.platform == "win32" else "/bin/bash",
+                                   cwd=cwd,
+                                   start_new_session=sys.platform != "win32")
+        timed_out = False
+        try:
+            stdout_bytes, stderr_bytes = process.communicate(timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            # Kill the whole process group, otherwise grandchildren keep the pipes open
+            timed_out = True
+            if sys.platform == "win32":
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+            stdout_bytes, stderr_bytes = process.communicate()
 
         # Decode the output properly
-        stdout = _decode_output(result.stdout, encodings)
-        stderr = _decode_output(result.stderr, encodings)
-        success = (result.returncode == 0)
+        program = _program_name(command)
+        stdout = command_encodings.decode(program, stdout_bytes)
+        stderr = command_encodings.decode(program, stderr_bytes)
+        success = (process.returncode == 0) and not timed_out
+        if timed_out:
+            stderr = _append_timeout_message(stderr, timeout)
         
         if change_directory and success:
             path = command[1] if len(command) > 1 else ""
             cwd = os.path.abspath(os.path.join(cwd, path))
 
-        return command_result(
+        return run_result(
             success = success,
             stdout = stdout, 
             stderr = stderr, 
-            returncode = result.returncode,
+            returncode = process.returncode,
+            current_directory = cwd,
+            timed_out = timed_out or None
+        )
+    except Exception as e:
+        return run_result(
+            success = False,
+            stdout = "",
+            stderr = str(e),
+            returncode = 1,
+            current_directory = cwd
+        )
+
+def _append_timeout_message(stderr : str, timeout : float) -> str:
+    separator = "\n" if stderr and not stderr.endswith("\n") else ""
+    return f"{stderr}{separator}Command timed out after {timeout:g} seconds and was killed."
+
+async def terminal_run_command_async(command : list[str] | str, cwd : str = os.getcwd(), change_directory : bool = False,
+                                     timeout : float | None = None, env : dict[str, str] | None = None) -> run_result:
+    """Same as terminal_run_command, but waits for the process without blocking the event loop"""
+    try:
+        command, command_str = _prepare_command(command)
+
+        stdout_buffer = io.BytesIO()
+        stderr_buffer = io.BytesIO()
+        process, timed_out = await _execute(command_str, cwd, stdout_buffer, stderr_buffer, None, timeout, env)
+
+        program = _program_name(command)
+        # Decode straight from the buffers, without copying the output first
+        stdout = command_encodings.decode(program, stdout_buffer.getbuffer())
+        stderr = command_encodings.decode(program, stderr_buffer.getbuffer())
+        return _process_result(process, stdout, stderr, cwd, timed_out, timeout, command if change_directory else None)
+    except Exception as e:
+        return run_result(
+            success = False,
+            stdout = "",
+            stderr = str(e),
+            returncode = 1,
             current_directory = cwd
         )
+
+async def _execute(command_str : str, cwd : str, stdout_buffer, stderr_buffer,
+                   on_output : Callable[[str, bytes], Awaitable[None]] | None,
+                   timeout : float | None, env : dict[str, str] | None = None) -> tuple[spawned_process, bool]:
+    """
+    Runs the command in its own process group, pumping its pipes into the buffers.
+    On timeout or cancellation the whole process tree is killed, and so is anything
+    the shell left running in the background once it exits.
+    """
+    start = time.perf_counter()
+    process = await spawned_process.start(_shell_argv(command_str), cwd, env)
+    spawned = time.perf_counter()
+    telemetry.record_phase("spawn", spawned - start)
+    pumps = asyncio.gather(_pump_stream(process.stdout, stdout_buffer, "stdout", on_output),
+                           _pump_stream(process.stderr, stderr_buffer, "stderr", on_output))
+    timed_out = False
+    try:
+        try:
+            await asyncio.wait_for(process.wait(), timeout or None)
+        except asyncio.TimeoutError:
+            timed_out = True
+            process.kill_tree()
+            await process.wait()
+        process.kill_tree()
+        await pumps
+    except BaseException:
+        # Cancelled by the client, or the output callback failed
+        process.kill_tree()
+        pumps.cancel()
+        await asyncio.shield(process.wait())
+        # Collect the cancelled pumps, or asyncio reports their exception as never retrieved
+        await asyncio.gather(pumps, return_exceptions=True)
+        raise
+    finally:
+        process.close()
+        telemetry.record_phase("run", time.perf_counter() - spawned)
+    return process, timed_out
+
+def _process_result(process : spawned_process, stdout : str, stderr : str, cwd : str, timed_out : bool,
+                    timeout : float | None, cd_command : list[str] | None = None) -> run_result:
+    success = (process.returncode == 0) and not timed_out
+    if timed_out:
+        stderr = _append_timeout_message(stderr, timeout)
+
+    if cd_command is not None and success:
+        path = cd_command[1] if len(cd_command) > 1 else ""
+        cwd = os.path.abspath(os.path.join(cwd, path))
+
+    usage = process.usage
+    return run_result(
+        success = success,
+        stdout = stdout,
+        stderr = stderr,
+        returncode = process.returncode,
+        current_directory = cwd,
+        wall_time = round(usage.wall_time, 6) if usage else None,
+        cpu_time = round(usage.cpu_time, 6) if usage and usage.cpu_time is not None else None,
+        peak_rss = usage.peak_rss if usage else None,
+        timed_out = timed_out or None
+    )
+
+class output_buffer:
+    """
+    Keeps the first and last bytes of a stream and counts what falls in between,
+    so memory stays bounded no matter how much a command prints.
+    """
+
+    def __init__(self, limit : int = DEFAULT_STREAM_OUTPUT_LIMIT):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+
+    def write(self, data : bytes) -> None:
+        self.total_bytes += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head.extend(data[:room])
+            data = data[room:]
+        if data:
+            self.tail.extend(data)
+            # Trim lazily so long streams are not shifted on every chunk
+            if len(self.tail) > 2 * self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    @property
+    def dropped_bytes(self) -> int:
+        return max(0, self.total_bytes - len(self.head) - min(len(self.tail), self.tail_limit))
+
+    def getvalue(self, decoder : output_decoder | None = None) -> str:
+        """Decodes the kept output with decoder, which detects the encoding unless it was given one"""
+        decoder = decoder or output_decoder()
+        tail = self.tail[-self.tail_limit:] if self.tail_limit else b""
+        dropped = self.dropped_bytes
+        if not dropped:
+            return decoder.decode(bytes(self.head + tail), final=True)
+        # Cut on line boundaries so no multi-byte character is split
+        head_end = self.head.rfind(b"\n") + 1 or len(self.head)
+        tail_start = tail.find(b"\n") + 1
+        dropped += (len(self.head) - head_end) + tail_start
+        head = decoder.decode(bytes(self.head[:head_end]), final=True)
+        # The tail does not continue the head, decode it on its own with the same encoding
+        tail_decoder = output_decoder(decoder.encoding)
+        tail = tail_decoder.decode(bytes(tail[tail_start:]), final=True)
+        decoder.mismatch = decoder.mismatch or tail_decoder.mismatch
+        separator = "" if head.endswith("\n") or not head else "\n"
+        return f"{head}{separator}... [{dropped} bytes truncated] ...\n{tail}"
+
+def _decode_buffer(buffer : output_buffer | compacting_buffer, program : str) -> str:
+    if isinstance(buffer, compacting_buffer):
+        decoder, text = buffer.decoder, buffer.getvalue()
+    else:
+        decoder = output_decoder(command_encodings.get(program))
+        text = buffer.getvalue(decoder)
+    if buffer.total_bytes:
+        command_encodings.update(program, decoder)
+    return text
+
+async def _pump_stream(stream : asyncio.StreamReader, buffer, name : str,
+                       on_output : Callable[[str, bytes], Awaitable[None]] | None) -> None:
+    while True:
+        chunk = await stream.read(_STREAM_CHUNK_SIZE)
+        if not chunk:
+            return
+        buffer.write(chunk)
+        if on_output is not None:
+            await on_output(name, chunk)
+
+async def terminal_stream_command(command : list[str] | str, cwd : str = os.getcwd(),
+                                  on_output : Callable[[str, bytes], Awaitable[None]] | None = None,
+                                  max_output_bytes : int = DEFAULT_STREAM_OUTPUT_LIMIT,
+                                  timeout : float | None = None, env : dict[str, str] | None = None,
+                                  compaction : compaction_options | None = None) -> run_result:
+    """
+    Runs a command while reading its pipes incrementally.
+
+    Args:
+        command (list[str] | str): The command to run.
+        cwd (str): The working directory of the command.
+        on_output (Callable | None): Awaited with ("stdout" | "stderr", chunk) for every chunk read.
+        max_output_bytes (int): Bytes kept per stream in the result, the middle of longer output is dropped.
+        timeout (float | None): Seconds after which the command and its children are killed (default: no timeout).
+        env (dict[str, str] | None): Environment of the command (default: the server's environment).
+        compaction (compaction_options | None): Compact the output while it is read, its head and tail
+            lines then bound the result instead of max_output_bytes (default: keep the raw output).
+
+    Returns:
+        run_result: The result of the command execution with bounded stdout/stderr.
+    """
+    try:
+        command, command_str = _prepare_command(command)
+
+        program = _program_name(command)
+        if compaction is None:
+            stdout_buffer = output_buffer(max_output_bytes)
+            stderr_buffer = output_buffer(max_output_bytes)
+        else:
+            encoding = command_encodings.get(program)
+            stdout_buffer = compacting_buffer(output_decoder(encoding), compaction)
+            stderr_buffer = compacting_buffer(output_decoder(encoding), compaction)
+        process, timed_out = await _execute(command_str, cwd, stdout_buffer, stderr_buffer, on_output, timeout, env)
+
+        stdout = _decode_buffer(stdout_buffer, program)
+        stderr = _decode_buffer(stderr_buffer, program)
+        result = _process_result(process, stdout, stderr, cwd, timed_out, timeout)
+        if compaction is not None:
+            result.compaction = stdout_buffer.compactor.report + stderr_buffer.compactor.report
+        return result
     except Exception as e:
-        return command_result(
+        return run_result(
             success = False,
             stdout = "",
             stderr = str(e),
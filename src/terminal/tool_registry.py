@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sys
+import mcp
+import pydantic
+from mcp.server.fastmcp import FastMCP
+from mcp.types import Tool as MCPTool
+from . import settings
+from . import telemetry
+from .settings import env_bool
+
+# Answer tools/list from the schema cache when it matches the sources
+tool_cache_enabled = env_bool("MCP_TERMINAL_TOOL_CACHE", True)
+_CACHE_VERSION = 1
+# Files of the mcp package that shape the generated schemas, an upgrade changes them
+_MCP_SOURCES = ("types.py", "server/fastmcp/server.py", "server/fastmcp/tools/base.py",
+                "server/fastmcp/utilities/func_metadata.py")
+
+def _source_stats(directory: str, names) -> list:
+    stats = []
+    for name in names:
+        try:
+            info = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        stats.append((name, info.st_size, info.st_mtime_ns))
+    return stats
+
+def cache_key() -> str:
+    """
+    Identifies the tool definitions without building them: the Python, pydantic and mcp
+    versions, the sources of this package and the MCP_TERMINAL_* settings (they can change
+    defaults shown in the schemas). Only stats files, so it costs well under a millisecond.
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    sources = sorted(name for name in os.listdir(package) if name.endswith(".py"))
+    parts = (
+        _CACHE_VERSION,
+        sys.version,
+        pydantic.VERSION,
+        _source_stats(os.path.dirname(mcp.__file__), _MCP_SOURCES),
+        _source_stats(package, sources),
+        sorted((name, value) for name, value in os.environ.items() if name.startswith("MCP_TERMINAL_")),
+    )
+    return hashlib.sha1(repr(parts).encode("utf-8", errors="surrogateescape")).hexdigest()
+
+def _cache_path() -> str:
+    return os.path.join(settings.cache_dir, "tools.json")
+
+def load_tools(key: str, names: list[str]) -> list[MCPTool] | None:
+    """The cached tool definitions, or None when the cache is missing, stale or lists other tools"""
+    try:
+        with open(_cache_path(), encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") != key or [tool.get("name") for tool in cached["tools"]] != names:
+            return None
+        return [MCPTool.model_validate(tool) for tool in cached["tools"]]
+    except (OSError, ValueError, KeyError, TypeError, pydantic.ValidationError):
+        return None
+
+def save_tools(key: str, tools: list[MCPTool]) -> None:
+    path = _cache_path()
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "tools": [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools]}, f)
+        # Concurrently starting servers never read a half-written cache
+        os.replace(temporary, path)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+class terminal_mcp(FastMCP):
+    """
+    FastMCP that builds its tools on first use.
+
+    Building a tool (its argument model and input and output JSON schemas) is most of what the
+    server does at start-up besides importing. Decorated tools are only recorded here: tools/list
+    is answered from a schema cache on disk when it matches the sources, and a tool is built when
+    it is first called. Every tool is wrapped for telemetry when it is built.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending_tools: dict[str, tuple] = {}
+        self._tool_order: list[str] = []
+        self._listed_tools: list[MCPTool] | None = None
+        # Whether the last tools/list came from the cache, for --profile-startup
+        self.tools_from_cache = False
+
+    def add_tool(self, fn, *args, **kwargs):
+        name = kwargs.get("name") or (args[0] if args else None) or fn.__name__
+        if name not in self._tool_order:
+            self._tool_order.append(name)
+        self._pending_tools[name] = (fn, args, kwargs)
+        self._listed_tools = None
+
+    def _build_tool(self, name: str) -> None:
+        pending = self._pending_tools.pop(name, None)
+        if pending is not None:
+            fn, args, kwargs = pending
+            super().add_tool(telemetry.instrument(fn), *args, **kwargs)
+
+    def build_tools(self) -> None:
+        """Builds every tool not built yet"""
+        for name in list(self._pending_tools):
+            self._build_tool(name)
+
+    async def list_tools(self) -> list[MCPTool]:
+        if self._listed_tools is not None:
+            return self._listed_tools
+        key = cache_key() if tool_cache_enabled else ""
+        tools = load_tools(key, self._tool_order) if tool_cache_enabled else None
+        self.tools_from_cache = tools is not None
+        if tools is None:
+            self.build_tools()
+            order = {name: index for index, name in enumerate(self._tool_order)}
+            tools = sorted(await super().list_tools(), key=lambda tool: order.get(tool.name, len(order)))
+            if tool_cache_enabled:
+                save_tools(key, tools)
+        self._listed_tools = tools
+        return tools
+
+    async def call_tool(self, name: str, arguments: dict):
+        self._build_tool(name)
+        return await super().call_tool(name, arguments)
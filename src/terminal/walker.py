@@ -0,0 +1,295 @@
+import fnmatch
+import os
+import re
+from typing import NamedTuple
+
+IGNORE_FILES = (".gitignore", ".ignore")
+
+# ---------------------------------------------------------------------------
+# Ignore rules
+# ---------------------------------------------------------------------------
+
+def _translate_glob(pattern: str) -> str:
+    """Translate a gitignore glob to a regex matching a slash-separated relative path"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                if pattern.startswith("**/", i):
+                    out.append("(?:.*/)?")
+                    i += 3
+                else:
+                    out.append(".*")
+                    i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+class ignore_rule(NamedTuple):
+    regex: re.Pattern
+    negated: bool
+    directory_only: bool
+
+def parse_ignore_patterns(lines) -> list[ignore_rule]:
+    """Parse gitignore-style lines into rules"""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n\r")
+        if not line.strip() or line.startswith("#"):
+            continue
+        line = line.rstrip(" ")
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but the end anchors the pattern to the ignore file's directory
+        anchored = "/" in line
+        line = line.lstrip("/")
+        prefix = "^" if anchored else "^(?:.*/)?"
+        rules.append(ignore_rule(re.compile(prefix + _translate_glob(line) + "$"), negated, directory_only))
+    return rules
+
+class ignore_rules:
+    """
+    Stack of ignore files met while descending a tree. Each level keeps the
+    directory it applies to, the last matching rule wins like in git.
+    """
+
+    def __init__(self, levels: tuple = ()):
+        self.levels = levels
+
+    def with_directory(self, directory: str) -> "ignore_rules":
+        rules = []
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(directory, name), "r", encoding="utf-8", errors="replace") as f:
+                    rules.extend(parse_ignore_patterns(f))
+            except OSError:
+                continue
+        if not rules:
+            return self
+        return ignore_rules(self.levels + ((directory, rules),))
+
+    def with_patterns(self, directory: str, patterns: list[str]) -> "ignore_rules":
+        rules = parse_ignore_patterns(patterns)
+        return ignore_rules(self.levels + ((directory, rules),)) if rules else self
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, rules in self.levels:
+            relative = relative_path(path, base)
+            for rule in rules:
+                if rule.directory_only and not is_dir:
+                    continue
+                if rule.regex.match(relative):
+                    ignored = not rule.negated
+        return ignored
+
+def relative_path(path: str, base: str) -> str:
+    """Cheap relpath for paths known to be below base, always slash-separated"""
+    relative = path[len(base):].lstrip(os.sep)
+    return relative.replace(os.sep, "/") if os.sep != "/" else relative
+
+# ---------------------------------------------------------------------------
+# Name patterns
+# ---------------------------------------------------------------------------
+
+class name_pattern:
+    """
+    A glob matched against entry names, or against slash-separated relative paths
+    when it contains "/". Path patterns without "**" also tell which directories
+    can hold a match, so the walk does not descend into the others.
+    """
+
+    def __init__(self, pattern: str = "*", case_sensitive: bool = True):
+        self.pattern = pattern
+        self.case_sensitive = case_sensitive
+        self.matches_path = "/" in pattern
+        self.match_all = pattern == "*"
+        flags = 0 if case_sensitive else re.IGNORECASE
+        # In path patterns "*" stops at slashes and "**/" spans directories, like in glob and gitignore
+        source = "(?s:" + _translate_glob(pattern) + r")\Z" if self.matches_path else fnmatch.translate(pattern)
+        self._regex = re.compile(source, flags)
+        self.directory_patterns = None
+        self._hidden_directories = ()
+        if self.matches_path and "**" not in pattern:
+            components = pattern.split("/")[:-1]
+            self.directory_patterns = [re.compile(fnmatch.translate(component), flags) for component in components]
+            self._hidden_directories = tuple(component.startswith(".") for component in components)
+
+    @property
+    def matches_hidden(self) -> bool:
+        """Like glob, only a pattern starting with a dot matches hidden names"""
+        return self.pattern.rpartition("/")[2].startswith(".")
+
+    @property
+    def max_depth(self) -> int | None:
+        return len(self.directory_patterns) if self.directory_patterns is not None else None
+
+    def match(self, name: str, relative: str) -> bool:
+        if self.match_all:
+            return True
+        return self._regex.match(relative if self.matches_path else name) is not None
+
+    def names_hidden_directory(self, depth: int) -> bool:
+        """Whether the pattern spells out a hidden directory at this depth (e.g. ".github/*.yml")"""
+        return depth < len(self._hidden_directories) and self._hidden_directories[depth]
+
+    def may_contain_matches(self, name: str, depth: int) -> bool:
+        """Whether the directory called name, depth levels below the root, can hold a match"""
+        if self.directory_patterns is None:
+            return True
+        return depth < len(self.directory_patterns) and self.directory_patterns[depth].match(name) is not None
+
+# ---------------------------------------------------------------------------
+# Traversal
+# ---------------------------------------------------------------------------
+
+def _sort_key(entry: os.DirEntry) -> str:
+    return entry.name
+
+def walk_order_key(relative: str) -> list:
+    """
+    Sort key of a slash-separated relative path in walk order: the entries of a
+    directory come before everything below its subdirectories.
+    """
+    parts = relative.split("/")
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+def walk(root: str, pattern: str | name_pattern = "*", recursive: bool = True, max_depth: int | None = None,
+         include_files: bool = True, include_dirs: bool = False, include_hidden: bool = False,
+         respect_ignore: bool = False, ignore_patterns: list[str] | None = None,
+         include_other: bool = False, follow_symlinks: bool = False, case_sensitive: bool = True,
+         sort: bool = True, start_after: str | None = None):
+    """
+    Walks a tree with os.scandir, yielding the os.DirEntry of every matching entry.
+
+    Entry types come from the directory listing itself, so no stat call is made
+    unless the caller asks an entry for it. Results are produced lazily, in a stable
+    order: the entries of a directory (sorted by name) before those of its subdirectories.
+
+    Args:
+        root (str): The directory to walk.
+        pattern (str | name_pattern): Glob matched against names, or against relative paths when it contains "/".
+        recursive (bool): Whether to descend into subdirectories.
+        max_depth (int | None): Deepest level descended into, 0 only lists root (default: unlimited).
+        include_files (bool): Yield files (and symlinks to files).
+        include_dirs (bool): Yield directories.
+        include_other (bool): Also yield, like files, entries that are neither (sockets, devices, broken symlinks).
+        include_hidden (bool): Yield and descend into entries whose name starts with a dot.
+            Otherwise hidden directories are skipped and hidden files only match patterns starting with a dot.
+        respect_ignore (bool): Skip entries excluded by .gitignore/.ignore files.
+        ignore_patterns (list[str] | None): Extra gitignore-style patterns to exclude.
+        follow_symlinks (bool): Descend into symlinked directories (each directory is visited once).
+            Otherwise symlinks to directories are neither yielded nor descended.
+        case_sensitive (bool): Whether pattern matching is case sensitive.
+        sort (bool): Sort the entries of every directory by name.
+        start_after (str | None): Relative path of an entry, only the entries following it in walk order are
+            yielded, and subtrees entirely before it are not walked. Requires sort.
+
+    Yields:
+        os.DirEntry: The matching entries.
+    """
+    if not isinstance(pattern, name_pattern):
+        pattern = name_pattern(pattern, case_sensitive)
+    if not recursive:
+        max_depth = 0
+    if pattern.max_depth is not None:
+        max_depth = pattern.max_depth if max_depth is None else min(max_depth, pattern.max_depth)
+    hidden_files = include_hidden or pattern.matches_hidden
+    rules = ignore_rules()
+    if ignore_patterns:
+        rules = rules.with_patterns(root, ignore_patterns)
+    visited = None
+    if follow_symlinks:
+        try:
+            st = os.stat(root)
+            visited = {(st.st_dev, st.st_ino)}
+        except OSError:
+            visited = set()
+
+    # Directories on the path to start_after are filtered entry by entry, the ones after it are walked as usual
+    resume = walk_order_key(start_after) if start_after else None
+    stack = [(root, 0, rules, resume is not None)]
+    while stack:
+        directory, depth, rules, on_resume_path = stack.pop()
+        if respect_ignore:
+            rules = rules.with_directory(directory)
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=_sort_key) if sort else list(it)
+        except OSError:
+            continue
+        descend = max_depth is None or depth < max_depth
+        subdirectories = []
+        for entry in entries:
+            name = entry.name
+            hidden = name.startswith(".")
+            key = walk_order_key(relative_path(entry.path, root)) if on_resume_path else None
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                if not is_dir and not include_other and not entry.is_file():
+                    continue  # Sockets, devices, broken or directory symlinks
+            except OSError:
+                continue
+            if is_dir:
+                visible = include_hidden or not hidden
+                if not visible and not hidden_files and not pattern.names_hidden_directory(depth):
+                    continue
+                if rules.levels and rules.is_ignored(entry.path, True):
+                    continue
+                if include_dirs and (visible or hidden_files) and pattern.match(name, relative_path(entry.path, root)):
+                    if key is None or key > resume:
+                        yield entry
+                subtree_on_path = False
+                if key is not None:
+                    subtree = key[:-1] + [(1, name)]
+                    subtree_on_path = resume[:len(subtree)] == subtree
+                    if subtree < resume and not subtree_on_path:
+                        continue  # Walked by an earlier call
+                if descend and (visible or pattern.names_hidden_directory(depth)) and pattern.may_contain_matches(name, depth):
+                    if visited is not None:
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        if (st.st_dev, st.st_ino) in visited:
+                            continue  # Symlink loop or a directory already walked
+                        visited.add((st.st_dev, st.st_ino))
+                    subdirectories.append((entry.path, depth + 1, rules, subtree_on_path))
+                continue
+            if not include_files or (hidden and not hidden_files):
+                continue
+            if not pattern.match(name, relative_path(entry.path, root) if pattern.matches_path else name):
+                continue
+            if key is not None and key <= resume:
+                continue
+            if rules.levels and rules.is_ignored(entry.path, False):
+                continue
+            yield entry
+        stack.extend(reversed(subdirectories))
@@ -0,0 +1,645 @@
+import atexit
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Literal
+from pydantic import BaseModel, Field
+from .terminal import command_result
+from .settings import env_float, env_int
+
+# "auto" watches with inotify on Linux and polls elsewhere, "poll" always polls
+watch_backend = os.environ.get("MCP_TERMINAL_WATCH_BACKEND", "auto").lower()
+# Directories watched at the same time, the least recently queried one is dropped beyond this
+watch_roots = env_int("MCP_TERMINAL_WATCH_ROOTS", 8)
+# Changed paths remembered per directory; beyond this, changes are merged into their parent
+# directories, so an event storm (npm install, a clean build) costs bounded memory
+journal_entries = env_int("MCP_TERMINAL_WATCH_JOURNAL", 10000)
+# inotify watches (one per directory) across all roots; a root needing more is polled instead
+watch_directories = env_int("MCP_TERMINAL_WATCH_DIRECTORIES", 50000)
+# Seconds between two scans of a polled directory; get_changes_since always scans first
+poll_interval = env_float("MCP_TERMINAL_WATCH_POLL_INTERVAL", 2.0)
+
+change_kind = Literal["created", "modified", "deleted", "rescan"]
+
+class file_change(BaseModel):
+    path: str = Field(description="Path relative to the watched directory, '.' for the directory itself")
+    kind: change_kind = Field(description="created, modified or deleted; rescan when anything below this directory may have changed")
+    is_directory: bool = Field(description="Whether the path is a directory")
+
+class changes_result(command_result):
+    root: str | None = Field(default=None, description="The watched directory")
+    backend: str | None = Field(default=None, description="inotify or poll")
+    changes: list[file_change] = Field(default_factory=list, description="Changes since the cursor, oldest first, one per path")
+    next_cursor: str | None = Field(default=None, description="Pass as cursor to get the changes after these")
+    has_more: bool | None = Field(default=None, description="More changes follow next_cursor")
+
+# ---------------------------------------------------------------------------
+# Journal
+# ---------------------------------------------------------------------------
+
+# What a path's earlier change becomes when it changes again; pairs not listed take the new kind
+_MERGED = {
+    ("created", "modified"): "created",
+    ("deleted", "created"): "modified",
+}
+
+class change_journal:
+    """
+    The latest change of every path below a root, ordered by sequence number.
+
+    A path changing again moves to the end with a new number, so the changes after a
+    cursor are the tail of the journal. The entry keeps the number of the first change it
+    merged and the latest kind, for clients whose cursor lies inside the merged changes.
+    Past max_entries, the changes below the directories holding the most of them are
+    merged into one "rescan" entry per directory, until half the limit is left; later
+    changes below those directories only renumber their entry.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.seq = 0
+        # relative path -> (seq, merged kind, is directory, seq of the first merged change, latest kind)
+        self.entries: OrderedDict[str, tuple[int, str, bool, int, str]] = OrderedDict()
+        self.rescans: set[str] = set()
+        self.lock = threading.Lock()
+
+    def add(self, changes: list[tuple[str, str, bool]]) -> None:
+        with self.lock:
+            for relative, kind, is_dir in changes:
+                if self.rescans:
+                    ancestor = self._ancestor_in(relative, self.rescans)
+                    if ancestor is not None:
+                        relative, kind, is_dir = ancestor, "rescan", True
+                self.seq += 1
+                previous = self.entries.pop(relative, None)
+                first, latest = self.seq, kind
+                if previous is not None:
+                    first = previous[3]
+                    if previous[1] == "rescan":
+                        kind = latest = "rescan"
+                    else:
+                        kind = _MERGED.get((previous[1], kind), kind)
+                if kind == "rescan":
+                    self.rescans.add(relative)
+                    if relative == ".":
+                        # Nothing below the root needs its own entry any more
+                        self.entries.clear()
+                        self.rescans = {"."}
+                self.entries[relative] = (self.seq, kind, is_dir, first, latest)
+            if len(self.entries) > self.max_entries:
+                self._collapse(max(1, self.max_entries // 2))
+
+    def _collapse(self, target: int) -> None:
+        # Entries below every directory
+        below: dict[str, int] = {}
+        for relative in self.entries:
+            directory = relative
+            while directory != ".":
+                directory = os.path.dirname(directory) or "."
+                below[directory] = below.get(directory, 0) + 1
+        # Deepest directories first, so a storm in node_modules/ becomes one entry while
+        # changes spread elsewhere keep theirs; the threshold drops until the journal fits
+        directories = sorted((directory for directory in below if directory != "."), key=lambda d: d.count(os.sep), reverse=True)
+        collapsed: set[str] = set()
+        total = len(self.entries)
+        threshold = max(1, self.max_entries // 20)
+        while total > target and threshold >= 1:
+            for directory in directories:
+                if total <= target:
+                    break
+                count = below[directory]
+                if count <= threshold or directory in collapsed:
+                    continue
+                collapsed.add(directory)
+                removed = count if directory in self.entries else count - 1
+                total -= removed
+                ancestor = directory
+                while ancestor != ".":
+                    ancestor = os.path.dirname(ancestor) or "."
+                    below[ancestor] -= removed
+                below[directory] = 0
+            threshold //= 2
+        if total > target:
+            collapsed = {"."}
+        merged: dict[str, tuple[int, str, bool, int, str]] = {}
+        for relative, entry in self.entries.items():
+            key = relative if relative in collapsed else self._ancestor_in(relative, collapsed)
+            if key is not None:
+                current = merged.get(key)
+                if current is not None:
+                    entry = (max(entry[0], current[0]), "rescan", True, min(entry[3], current[3]), "rescan")
+                else:
+                    entry = (entry[0], "rescan", True, entry[3], "rescan")
+                relative = key
+            merged[relative] = entry
+        self.entries = OrderedDict(sorted(merged.items(), key=lambda item: item[1][0]))
+        self.rescans = {relative for relative, entry in self.entries.items() if entry[1] == "rescan"}
+
+    @staticmethod
+    def _ancestor_in(relative: str, directories: set[str]) -> str | None:
+        while relative != ".":
+            relative = os.path.dirname(relative) or "."
+            if relative in directories:
+                return relative
+        return None
+
+    def since(self, seq: int, limit: int) -> tuple[list[file_change], int, bool]:
+        """Changes numbered after seq, oldest first, the sequence number to continue from and whether more follow"""
+        with self.lock:
+            newer = []
+            for relative in reversed(self.entries):
+                entry = self.entries[relative]
+                if entry[0] <= seq:
+                    break
+                newer.append((relative, entry))
+            current = self.seq
+        newer.reverse()
+        more = len(newer) > limit
+        if more:
+            newer = newer[:limit]
+            current = newer[-1][1][0]
+        # A client that saw some of the merged changes already knows the state they left,
+        # only the latest kind applies to it (created then modified is a modification then)
+        changes = [file_change(path=relative, kind=latest if first <= seq else kind, is_directory=is_dir)
+                   for relative, (_, kind, is_dir, first, latest) in newer]
+        return changes, current, more
+
+# ---------------------------------------------------------------------------
+# Watched roots and invalidation listeners
+# ---------------------------------------------------------------------------
+
+class watched_root:
+    def __init__(self, path: str):
+        self.path = path
+        self.id = uuid.uuid4().hex[:12]
+        self.started_at = time.monotonic()
+        self.journal = change_journal(journal_entries)
+        self.backend = "poll"
+        self.broken = False
+        self.snapshot: dict[str, tuple[int, int, int, bool]] | None = None  # Polling only
+        self.poll_lock = threading.Lock()
+
+    def relative(self, path: str) -> str | None:
+        if path == self.path:
+            return "."
+        if path.startswith(self.path) and path[len(self.path)] == os.sep:
+            return path[len(self.path) + 1:]
+        if self.path == os.sep and path.startswith(os.sep):
+            return path[1:]
+        return None
+
+_roots: OrderedDict[str, watched_root] = OrderedDict()  # Most recently queried last
+_by_id: dict[str, watched_root] = {}
+_registry_lock = threading.Lock()
+_listeners: list[Callable[[list[str], list[str]], None]] = []
+
+def add_listener(listener: Callable[[list[str], list[str]], None]) -> None:
+    """
+    Calls listener(changed, rescan) with the absolute paths that changed below any watched
+    directory, rescan holding the directories where anything below may have changed.
+    Caches register here to drop entries as soon as the file system changes.
+    """
+    _listeners.append(listener)
+
+def _notify(changed: list[str], rescan: list[str]) -> None:
+    for listener in _listeners:
+        try:
+            listener(changed, rescan)
+        except Exception:
+            pass  # A cache failing to invalidate must not stop the watcher
+
+def _record(events: list[tuple[str, str, bool]], roots: list[watched_root] | None = None) -> None:
+    """Adds (absolute path, kind, is directory) events to the journals of the roots they are in"""
+    if not events:
+        return
+    if roots is None:
+        with _registry_lock:
+            roots = list(_roots.values())
+    for root in roots:
+        changes = []
+        for path, kind, is_dir in events:
+            relative = root.relative(path)
+            if relative is None:
+                continue
+            if relative == "." and kind == "deleted":
+                root.broken = True
+                kind = "rescan"
+            changes.append((relative, kind, is_dir))
+        if changes:
+            root.journal.add(changes)
+    _notify([path for path, kind, _ in events if kind != "rescan"],
+            [path for path, kind, _ in events if kind == "rescan"])
+
+def watched_since(path: str) -> float | None:
+    """
+    time.monotonic() from which every change below path is reported as it happens, None when
+    it is not watched with inotify. What a cache read after that time can be trusted until notified.
+    """
+    with _registry_lock:
+        starts = [root.started_at for root in _roots.values()
+                  if root.backend == "inotify" and not root.broken and root.relative(path) is not None]
+    return min(starts, default=None)
+
+def drain() -> None:
+    """Records the inotify events queued so far, so listeners have seen every change made before the call"""
+    instance = _inotify_instance
+    if instance is not None:
+        instance.drain()
+
+# ---------------------------------------------------------------------------
+# inotify (Linux)
+# ---------------------------------------------------------------------------
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_EXCL_UNLINK = 0x4000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+               | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_EVENT = struct.Struct("iIII")
+
+class watch_limit_error(OSError):
+    pass
+
+class _inotify:
+    """One inotify instance watching every directory of the inotify roots, read by a daemon thread"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._add_watch.restype = ctypes.c_int
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self._rm_watch.restype = ctypes.c_int
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.fd = fd
+        self._wake_read, self._wake_write = os.pipe()
+        self._wds: dict[int, str] = {}
+        self._paths: dict[str, int] = {}
+        self._lock = threading.Lock()  # Guards the watch tables
+        self._read_lock = threading.Lock()  # One reader of the queue at a time
+        self._thread = threading.Thread(target=self._run, name="mcp-terminal-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self, path: str) -> bool:
+        """Watches one directory; False when it is gone or not a directory any more"""
+        if path not in self._paths and len(self._wds) >= watch_directories:
+            raise watch_limit_error(errno.ENOSPC, f"More than {watch_directories} directories to watch")
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            code = self._get_errno()
+            if code == errno.ENOSPC:
+                raise watch_limit_error(code, "The inotify watch limit (fs.inotify.max_user_watches) is reached")
+            if code in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return False
+            raise OSError(code, os.strerror(code), path)
+        # The same directory reached under another name keeps its descriptor
+        previous = self._wds.get(wd)
+        if previous is not None and previous != path:
+            self._paths.pop(previous, None)
+        self._wds[wd] = path
+        self._paths[path] = wd
+        return True
+
+    def add_tree(self, path: str) -> list[tuple[str, str, bool]]:
+        """Watches path and every directory below it, returns what was found as "created" events"""
+        found = []
+        stack = [path]
+        with self._lock:
+            while stack:
+                directory = stack.pop()
+                if not self._watch(directory):
+                    continue
+                try:
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            try:
+                                is_dir = entry.is_dir(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            found.append((entry.path, "created", is_dir))
+                            if is_dir:
+                                stack.append(entry.path)
+                except OSError:
+                    continue
+        return found
+
+    def remove_tree(self, path: str, keep: Callable[[str], bool] = lambda path: False) -> None:
+        """Stops watching path and the directories below it, except those keep() holds on to"""
+        prefix = os.path.join(path, "")
+        with self._lock:
+            for directory in [directory for directory in self._paths if directory == path or directory.startswith(prefix)]:
+                if keep(directory):
+                    continue
+                wd = self._paths.pop(directory)
+                self._wds.pop(wd, None)
+                self._rm_watch(self.fd, wd)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                ready, _, _ = select.select([self.fd, self._wake_read], [], [])
+            except (OSError, ValueError):
+                return
+            if self._wake_read in ready:
+                return
+            self.drain()
+
+    def drain(self) -> None:
+        """Reads and records every queued event, so changes made before the call are in the journals"""
+        with self._read_lock:
+            while True:
+                try:
+                    data = os.read(self.fd, 256 * 1024)
+                except BlockingIOError:
+                    return
+                except OSError:
+                    return
+                if not data:
+                    return
+                self._dispatch(data)
+
+    def _dispatch(self, data: bytes) -> None:
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, every inotify root has to be listed again
+                with _registry_lock:
+                    roots = [root for root in _roots.values() if root.backend == "inotify"]
+                events += [(root.path, "rescan", True) for root in roots]
+                continue
+            with self._lock:
+                directory = self._wds.get(wd)
+                if mask & IN_IGNORED and directory is not None:
+                    del self._wds[wd]
+                    if self._paths.get(directory) == wd:
+                        del self._paths[directory]
+            if directory is None or mask & IN_IGNORED:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                events.append((path, "created", is_dir))
+                if is_dir:
+                    events += self._add_new_directory(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append((path, "deleted", is_dir))
+                if is_dir and mask & IN_MOVED_FROM:
+                    # Its descriptors would keep reporting under the old name
+                    self.remove_tree(path)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if not name:
+                    events.append((path, "deleted", True))
+            elif mask & (IN_MODIFY | IN_ATTRIB):
+                events.append((path, "modified", is_dir))
+        _record(events, self._roots())
+
+    def _add_new_directory(self, path: str) -> list[tuple[str, str, bool]]:
+        try:
+            return self.add_tree(path)
+        except OSError:
+            # Out of watches: what happens below it from now on is not seen
+            for root in self._roots():
+                if root.relative(path) is not None:
+                    root.broken = True
+            return [(path, "rescan", True)]
+
+    @staticmethod
+    def _roots() -> list[watched_root]:
+        with _registry_lock:
+            return [root for root in _roots.values() if root.backend == "inotify"]
+
+    def close(self) -> None:
+        os.write(self._wake_write, b"x")
+        self._thread.join(timeout=1)
+        for fd in (self.fd, self._wake_read, self._wake_write):
+            os.close(fd)
+
+_inotify_instance: _inotify | None = None
+_inotify_failed = False
+_backend_lock = threading.Lock()
+
+def _get_inotify() -> _inotify | None:
+    global _inotify_instance, _inotify_failed
+    with _backend_lock:
+        if _inotify_instance is None and not _inotify_failed:
+            if watch_backend == "poll" or not sys.platform.startswith("linux"):
+                _inotify_failed = True
+            else:
+                try:
+                    _inotify_instance = _inotify()
+                except (OSError, AttributeError):
+                    _inotify_failed = True  # No inotify in this libc or kernel
+        return _inotify_instance
+
+# ---------------------------------------------------------------------------
+# Polling
+# ---------------------------------------------------------------------------
+
+def _snapshot(root: str) -> dict[str, tuple[int, int, int, bool]]:
+    """(mtime, size, inode, is directory) of every entry below root, symlinks not followed"""
+    entries = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        info = entry.stat(follow_symlinks=False)
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries[entry.path] = (info.st_mtime_ns, info.st_size, info.st_ino, is_dir)
+                    if is_dir:
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return entries
+
+def _poll(root: watched_root) -> None:
+    with root.poll_lock:
+        if not os.path.isdir(root.path):
+            _record([(root.path, "deleted", True)], [root])
+            return
+        current = _snapshot(root.path)
+        previous, root.snapshot = root.snapshot, current
+        if previous is None:
+            return
+        events = []
+        for path, state in current.items():
+            old = previous.get(path)
+            if old is None:
+                events.append((path, "created", state[3]))
+            elif old != state and not (state[3] and old[2:] == state[2:]):
+                # A directory's mtime changes with its entries, which are reported themselves
+                events.append((path, "modified", state[3]))
+        events += [(path, "deleted", state[3]) for path, state in previous.items() if path not in current]
+        _record(events, [root])
+
+class _poller:
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mcp-terminal-poller", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(poll_interval):
+            with _registry_lock:
+                roots = [root for root in _roots.values() if root.backend == "poll" and not root.broken]
+            for root in roots:
+                _poll(root)
+
+    def close(self) -> None:
+        self._stop.set()
+
+_poller_instance: _poller | None = None
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+def _stop(root: watched_root) -> None:
+    _by_id.pop(root.id, None)
+    if root.backend == "inotify" and _inotify_instance is not None:
+        others = [other for other in _roots.values() if other.backend == "inotify" and other is not root]
+        _inotify_instance.remove_tree(root.path, lambda path: any(other.relative(path) is not None for other in others))
+
+def _start(path: str) -> watched_root:
+    global _poller_instance
+    root = watched_root(path)
+    inotify = _get_inotify()
+    if inotify is not None:
+        try:
+            inotify.add_tree(path)
+            root.backend = "inotify"
+        except watch_limit_error:
+            with _registry_lock:
+                others = [other for other in _roots.values() if other.backend == "inotify"]
+            inotify.remove_tree(path, lambda directory: any(other.relative(directory) is not None for other in others))
+    if root.backend == "poll":
+        _poll(root)
+        with _backend_lock:
+            if _poller_instance is None:
+                _poller_instance = _poller()
+    return root
+
+def watch(path: str) -> watched_root:
+    """Returns the watch of the directory at path, starting one if there is none or it broke"""
+    with _registry_lock:
+        root = _roots.get(path)
+        if root is not None and not root.broken:
+            _roots.move_to_end(path)
+            return root
+    root = _start(path)
+    with _registry_lock:
+        previous = _roots.pop(path, None)
+        _roots[path] = root
+        _by_id[root.id] = root
+        if previous is not None:
+            # After the new watch is registered, so the directories both watch stay watched
+            _stop(previous)
+        while len(_roots) > watch_roots:
+            _stop(_roots.popitem(last=False)[1])
+    return root
+
+def _parse_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        watch_id, seq = cursor.rsplit(".", 1)
+        return watch_id, int(seq)
+    except ValueError:
+        raise ValueError("Invalid cursor.") from None
+
+def changes_since(path: str, cursor: str = "", limit: int = 1000) -> changes_result:
+    """
+    Changes below the directory at path since cursor, starting to watch it when needed.
+
+    Args:
+        path (str): Absolute path of the directory.
+        cursor (str): next_cursor of an earlier call, empty to start watching and get a first cursor.
+        limit (int): Most changes returned, the rest follow next_cursor.
+
+    Returns:
+        changes_result: The changes and the cursor to continue from. A cursor whose watch ended
+        (evicted, the directory replaced, the server restarted) gets one "rescan" of ".".
+    """
+    if limit <= 0:
+        raise ValueError("limit must be positive.")
+    if not os.path.isdir(path):
+        raise NotADirectoryError(f"'{path}' is not a directory.")
+    if not cursor:
+        root = watch(path)
+        return _changes(root, [], root.journal.seq, False)
+    watch_id, seq = _parse_cursor(cursor)
+    with _registry_lock:
+        root = _by_id.get(watch_id)
+    if root is not None and root.path != path:
+        raise ValueError(f"The cursor belongs to '{root.path}', not '{path}'.")
+    if root is None or root.broken:
+        root = watch(path)
+        return _changes(root, [file_change(path=".", kind="rescan", is_directory=True)], root.journal.seq, False)
+    if root.backend == "inotify":
+        _inotify_instance.drain()
+    else:
+        _poll(root)
+    with _registry_lock:
+        if path in _roots:
+            _roots.move_to_end(path)
+    changes, current, more = root.journal.since(seq, limit)
+    return _changes(root, changes, current, more)
+
+def _changes(root: watched_root, changes: list[file_change], seq: int, more: bool) -> changes_result:
+    return changes_result(
+        success=True,
+        stdout="",
+        stderr="",
+        returncode=0,
+        root=root.path,
+        backend=root.backend,
+        changes=changes,
+        next_cursor=f"{root.id}.{seq}",
+        has_more=more
+    )
+
+def shutdown() -> None:
+    global _inotify_instance, _poller_instance
+    with _registry_lock:
+        _roots.clear()
+        _by_id.clear()
+    if _poller_instance is not None:
+        _poller_instance.close()
+        _poller_instance = None
+    if _inotify_instance is not None:
+        _inotify_instance.close()
+        _inotify_instance = None
+
+atexit.register(shutdown)